@@ -0,0 +1,355 @@
+import argparse
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+import duckdb
+
+import db_queries
+import query_cache
+
+DEFAULT_LIMIT = 1000
+
+# ========================================== AD-HOC QUERIES ==========================================
+# Dashboard filters (apps, languages, a date range, review flags) and group-by dimensions are compiled into
+# one aggregate query over the smallest DuckDB table that can answer them: app_daily when only apps and
+# dates are involved, the 'detail' grouping set of review_rollup for languages at quarter or year grain, and
+# reviews_compact (or steam_reviews, which may be the Parquet view from ingest.py) for everything else.
+# Every source provides the same additive base measures, so results don't depend on the source picked.
+
+BASE_MEASURES = db_queries.DAILY_MEASURES
+
+# Period dimensions, truncating a source's day column; the order is from finest to coarsest grain
+PERIODS = {
+    'day': "{day}",
+    'week': "CAST(date_trunc('week', {day}) AS DATE)",
+    'month': "CAST(date_trunc('month', {day}) AS DATE)",
+    'quarter': "CAST(date_trunc('quarter', {day}) AS DATE)",
+    'year': "CAST(date_trunc('year', {day}) AS DATE)",
+}
+
+FLAGS = list(db_queries.FLAG_BITS)
+
+DIMENSIONS = ['app', 'language', *PERIODS, *FLAGS]
+
+RESULT_MEASURES = """
+    review_count::BIGINT AS review_count,
+    positive_reviews::BIGINT AS positive_reviews,
+    ROUND(positive_reviews * 100.0 / review_count, 2) AS positive_percentage,
+    ROUND(playtime_forever_sum / NULLIF(playtime_forever_count, 0) / 60.0, 2) AS avg_playtime_hours
+"""
+
+
+def review_measures(flag):
+    return {
+        'review_count': "COUNT(*)",
+        'positive_reviews': f"COUNT(*) FILTER (WHERE {flag('recommended')})",
+        'playtime_forever_sum': 'SUM("author.playtime_forever")',
+        'playtime_forever_count': 'COUNT("author.playtime_forever")',
+    }
+
+
+def summed_measures():
+    return {measure: f"SUM({measure})" for measure in BASE_MEASURES}
+
+
+# Sources in the order they are tried. grain is the finest period the day column holds; a source without a
+# language or flag expression can't filter or group by it. Sources filtering on timestamp_created let DuckDB
+# skip row groups (and Parquet files) outside the date range.
+SOURCES = {
+    db_queries.DAILY_TABLE: {
+        'grain': 'day', 'day': "day", 'language': None, 'flag': None, 'app_name': None,
+        'measures': summed_measures(), 'where': None, 'timestamps': False,
+    },
+    db_queries.ROLLUP_TABLE: {
+        'grain': 'quarter', 'day': "quarter", 'language': "language", 'flag': None, 'app_name': None,
+        'measures': summed_measures(), 'where': "grouping_set = 'detail'", 'timestamps': False,
+    },
+    db_queries.COMPACT_TABLE: {
+        'grain': 'day', 'day': db_queries.DAY_EXPR, 'language': "language", 'flag': db_queries.flag_expr,
+        'app_name': None, 'measures': review_measures(db_queries.flag_expr), 'where': None, 'timestamps': True,
+    },
+    'steam_reviews': {
+        'grain': 'day', 'day': db_queries.DAY_EXPR, 'language': "language", 'flag': lambda flag: flag,
+        'app_name': "any_value(app_name)", 'measures': review_measures(lambda flag: flag), 'where': None,
+        'timestamps': True,
+    },
+}
+
+
+def as_date(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value))
+
+
+def normalize(apps=(), languages=(), start=None, end=None, flags=None, group_by=(), limit=DEFAULT_LIMIT):
+    # Canonical, hashable form of a request: the same filters given in any order or spelling share one key
+    start, end = as_date(start), as_date(end)
+    if start and end and start > end:
+        raise ValueError(f"start {start} is after end {end}")
+    flags = {flag: value for flag, value in (flags or {}).items() if value is not None}
+    unknown = set(flags) - set(FLAGS) | set(group_by) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown flags or dimensions {sorted(unknown)}; dimensions are {DIMENSIONS}")
+    return (
+        ('apps', tuple(sorted(set(apps)))),
+        ('languages', tuple(sorted({language.strip().lower() for language in languages}))),
+        ('start', start.isoformat() if start else None),
+        ('end', end.isoformat() if end else None),
+        ('flags', tuple(sorted((flag, bool(value)) for flag, value in flags.items()))),
+        ('group_by', tuple(dict.fromkeys(group_by))),
+        ('limit', int(limit)),
+    )
+
+
+def required_grain(request):
+    # A date range needs days; otherwise the finest period grouped by
+    if request['start'] or request['end']:
+        return 'day'
+    periods = [period for period in PERIODS if period in request['group_by']]
+    return periods[0] if periods else None
+
+
+def can_answer(source, request):
+    grain = required_grain(request)
+    if grain and list(PERIODS).index(grain) < list(PERIODS).index(source['grain']):
+        return False
+    if (request['languages'] or 'language' in request['group_by']) and source['language'] is None:
+        return False
+    flags = {flag for flag, _ in request['flags']} | set(request['group_by']) & set(FLAGS)
+    return not flags or source['flag'] is not None
+
+
+def pick_source(request, tables):
+    for name, source in SOURCES.items():
+        if name in tables and can_answer(source, request):
+            return name
+    raise ValueError(f"None of {list(SOURCES)} can answer {dict(request)}")
+
+
+def compile_query(request, source_name, app_ids=None, join_apps=True):
+    # (sql, params) for a normalized request against one source. app_ids are the ids of request['apps'],
+    # resolved beforehand so app filters can prune Parquet partitions and row groups.
+    source = SOURCES[source_name]
+    group_by = request['group_by']
+    params = []
+
+    keys = []
+    for dimension in group_by:
+        if dimension == 'app':
+            keys.append("app_id")
+        elif dimension == 'language':
+            keys.append(f"{source['language']} AS language")
+        elif dimension in PERIODS:
+            keys.append(f"{PERIODS[dimension].format(day=source['day'])} AS {dimension}")
+        else:
+            keys.append(f"{source['flag'](dimension)} AS {dimension}")
+    aggregates = [f"{expr} AS {measure}" for measure, expr in source['measures'].items()]
+    if 'app' in group_by and source['app_name']:
+        aggregates.append(f"{source['app_name']} AS app_name")
+
+    where = [source['where']] if source['where'] else []
+    if request['apps']:
+        if app_ids is not None:
+            where.append(f"app_id IN ({', '.join('?' for _ in app_ids)})" if app_ids else "FALSE")
+            params += app_ids
+        else:
+            where.append(f"app_name IN ({', '.join('?' for _ in request['apps'])})")
+            params += request['apps']
+    if request['languages']:
+        where.append(f"{source['language']} IN ({', '.join('?' for _ in request['languages'])})")
+        params += request['languages']
+    start, end = as_date(request['start']), as_date(request['end'])
+    if source['timestamps']:
+        epoch = datetime.date(1970, 1, 1)
+        if start:
+            where.append("timestamp_created >= ?")
+            params.append((start - epoch).days * 86400)
+        if end:
+            where.append("timestamp_created < ?")
+            params.append((end - epoch).days * 86400 + 86400)
+    else:
+        if start:
+            where.append(f"{source['day']} >= ?")
+            params.append(start)
+        if end:
+            where.append(f"{source['day']} <= ?")
+            params.append(end)
+    for flag, value in request['flags']:
+        where.append(f"{source['flag'](flag)} = {str(value).upper()}")
+
+    columns = []
+    for dimension in group_by:
+        if dimension == 'app':
+            columns.append("app_name")
+        elif dimension == 'language':
+            columns.append("language::VARCHAR AS language")
+        else:
+            columns.append(dimension)
+    join = f"LEFT JOIN {db_queries.APPS_TABLE} USING (app_id)" \
+        if 'app' in group_by and not source['app_name'] and join_apps else ""
+    # The group-by columns break review_count ties, so LIMIT keeps the same rows from any source and run
+    order_by = [dimension for dimension in group_by if dimension in PERIODS] + ["review_count DESC"]
+    order_by += ["app_id" if dimension == 'app' else dimension for dimension in group_by if dimension not in PERIODS]
+
+    query = f"""
+        WITH grouped AS (
+            SELECT {", ".join(keys + aggregates)}
+            FROM {source_name}
+            {"WHERE " + " AND ".join(where) if where else ""}
+            {"GROUP BY ALL" if keys else ""}
+        )
+        SELECT {", ".join(columns + [RESULT_MEASURES])}
+        FROM grouped {join}
+        ORDER BY {", ".join(order_by)}
+        LIMIT {request['limit']}
+    """
+    return query, params
+
+
+# ========================================== QUERY SERVICE ==========================================
+
+class QueryService:
+    # Runs ad-hoc requests against the DuckDB database and memoizes the results as DataFrames, keyed on the
+    # normalized request. Like query_cache.QueryCache, entries expire after `ttl` seconds, the least recently
+    # used entry is evicted past `max_entries`, and everything is dropped when the database file changes.
+    # The file is opened read-only for each uncached request only, so db_queries.py can still take its write
+    # lock between requests.
+
+    def __init__(self, path=db_queries.DUCKDB_PATH, max_entries=256, ttl=600, threads=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threads = threads
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = query_cache.file_version(path)
+
+    @property
+    def version(self):
+        return self._version
+
+    def check_version(self):
+        version = query_cache.file_version(self.path)
+        if version != self._version:
+            with self._lock:
+                self._entries.clear()
+            self._version = version
+
+    def connect(self):
+        conn = duckdb.connect(self.path, read_only=True)
+        if self.threads:
+            conn.execute(f"SET threads = {int(self.threads)}")
+        return conn
+
+    def _cached(self, key, compute):
+        self.check_version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], True
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value, False
+
+    def plan(self, conn, request):
+        # (source, sql, params) the request runs as
+        tables = {name for (name,) in conn.execute(
+            "SELECT table_name FROM duckdb_tables() UNION ALL SELECT view_name FROM duckdb_views()"
+        ).fetchall()}
+        source = pick_source(request, tables)
+        app_ids = None
+        if request['apps'] and db_queries.APPS_TABLE in tables:
+            placeholders = ", ".join("?" for _ in request['apps'])
+            app_ids = [app_id for (app_id,) in conn.execute(
+                f"SELECT app_id FROM {db_queries.APPS_TABLE} WHERE app_name IN ({placeholders}) ORDER BY app_id",
+                list(request['apps']),
+            ).fetchall()]
+        query, params = compile_query(request, source, app_ids, db_queries.APPS_TABLE in tables)
+        return source, query, params
+
+    def _run(self, request):
+        started = time.perf_counter()
+        conn = self.connect()
+        try:
+            source, query, params = self.plan(conn, request)
+            df = conn.execute(query, params).df()
+        finally:
+            conn.close()
+        return {'source': source, 'query': query, 'params': params, 'seconds': time.perf_counter() - started,
+                'result': df}
+
+    def query(self, **filters):
+        # filters: apps, languages, start, end, flags ({flag: True/False}), group_by, limit (see normalize).
+        # The frame's attrs say which source answered, the SQL, how long it took and whether it was cached.
+        request = normalize(**filters)
+        entry, cached = self._cached(request, lambda: self._run(dict(request)))
+        # Callers get their own copy, so adding columns doesn't touch the cached frame
+        df = entry['result'].copy()
+        df.attrs = {key: value for key, value in entry.items() if key != 'result'}
+        df.attrs['cached'] = cached
+        return df
+
+    def options(self):
+        # Apps and languages for the filter widgets, most reviewed first
+        def load():
+            conn = self.connect()
+            try:
+                return {
+                    dimension: [value for (value,) in conn.execute(f"""
+                        SELECT {column} FROM {db_queries.ROLLUP_TABLE}
+                        WHERE grouping_set = '{dimension}' AND {column} IS NOT NULL
+                        ORDER BY review_count DESC
+                    """).fetchall()]
+                    for dimension, column in (('app', 'app_name'), ('language', 'language'))
+                }
+            finally:
+                conn.close()
+        return self._cached('options', load)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an ad-hoc aggregate over the reviews in the DuckDB database")
+    parser.add_argument('--app', action='append', default=[], help="app name to keep (repeatable)")
+    parser.add_argument('--language', action='append', default=[], help="language to keep (repeatable)")
+    parser.add_argument('--start', help="first day, e.g. 2020-01-01")
+    parser.add_argument('--end', help="last day, inclusive")
+    for flag in FLAGS:
+        parser.add_argument(f"--{flag.replace('_', '-')}", dest=flag, choices=['yes', 'no'],
+                            help=f"keep only reviews with {flag} true (yes) or false (no)")
+    parser.add_argument('--group-by', nargs='+', default=[], choices=DIMENSIONS)
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    parser.add_argument('--database', default=db_queries.DUCKDB_PATH)
+    parser.add_argument('--sql', action='store_true', help="print the source table and compiled SQL as well")
+    args = parser.parse_args()
+
+    flags = {flag: getattr(args, flag) == 'yes' for flag in FLAGS if getattr(args, flag)}
+    service = QueryService(args.database)
+    df = service.query(apps=args.app, languages=args.language, start=args.start, end=args.end, flags=flags,
+                       group_by=args.group_by, limit=args.limit)
+    if args.sql:
+        print(f"-- {df.attrs['source']}, params {df.attrs['params']}")
+        print(df.attrs['query'])
+    print(df.to_string(index=False))
+    print(f"({len(df)} rows from {df.attrs['source']} in {df.attrs['seconds']:.3f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+import argparse
+import contextlib
+import datetime
+import importlib.metadata
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import duckdb
+
+import db_queries
+import segments
+
+BENCH_DIR = 'benchmarks'
+HISTORY_PATH = os.path.join(BENCH_DIR, 'history.json')
+STARTUP_HISTORY_PATH = os.path.join(BENCH_DIR, 'startup.json')
+
+SCALES = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000, '21m': 21_000_000}
+
+# Real data has ~12.8M authors for 21M reviews
+USERS_PER_REVIEW = 0.6
+STEAMID_BASE = 76561197960265728
+
+# Columns resampled together from the sample CSV so their combinations stay realistic
+# (an app keeps its name, updated >= created, an author's playtimes stay consistent)
+SYNTHETIC_COLUMN_GROUPS = [
+    ['app_id', 'app_name'],
+    ['language'],
+    ['timestamp_created', 'timestamp_updated'],
+    ['recommended'],
+    ['votes_helpful'],
+    ['votes_funny'],
+    ['weighted_vote_score'],
+    ['comment_count'],
+    ['steam_purchase', 'received_for_free', 'written_during_early_access'],
+    ['author.num_games_owned', 'author.num_reviews', 'author.playtime_forever',
+     'author.playtime_last_two_weeks', 'author.playtime_at_review', 'author.last_played'],
+]
+
+
+# ========================================== SYNTHETIC DATA ==========================================
+# Every row picks, per column group, one row of the sample CSV by hashing (row number, group, seed), so
+# each column keeps the sample's value distribution and the same seed always produces the same table.
+
+def synthesize_reviews(conn, rows, sample_csv=db_queries.SAMPLE_CSV_PATH, seed=0):
+    columns = ", ".join(f'"{column}"' for column in db_queries.REVIEW_COLUMNS if column not in ('review_id', 'author.steamid'))
+    sample_csv = sample_csv.replace("'", "''")
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE review_sample AS SELECT {columns} FROM read_csv_auto('{sample_csv}')")
+
+    lists = ", ".join(
+        f'list("{column}") AS "{column}"' for group in SYNTHETIC_COLUMN_GROUPS for column in group
+    )
+    picks = {
+        column: f'pool."{column}"[1 + (hash(i, {number}, {seed}) % pool.n)::BIGINT] AS "{column}"'
+        for number, group in enumerate(SYNTHETIC_COLUMN_GROUPS) for column in group
+    }
+    users = max(int(rows * USERS_PER_REVIEW), 1)
+    picks['review_id'] = 'i + 1 AS review_id'
+    picks['author.steamid'] = f'({STEAMID_BASE} + hash(i, -1, {seed}) % {users})::BIGINT AS "author.steamid"'
+
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE steam_reviews AS
+        WITH pool AS (SELECT {lists}, COUNT(*) AS n FROM review_sample)
+        SELECT {", ".join(picks[column] for column in db_queries.REVIEW_COLUMNS)}
+        FROM range({rows}) AS t(i), pool
+    """)
+    conn.execute("DROP TABLE review_sample")
+
+
+def bench_database(rows, sample_csv, seed, regenerate=False):
+    path = os.path.join(BENCH_DIR, f'steam_reviews_{rows}.duckdb')
+    conn = duckdb.connect(path)
+    exists = conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'steam_reviews'"
+    ).fetchone()[0]
+    if regenerate or not exists or conn.execute("SELECT COUNT(*) FROM steam_reviews").fetchone()[0] != rows:
+        started = time.perf_counter()
+        synthesize_reviews(conn, rows, sample_csv, seed)
+        print(f"Generated {rows} synthetic reviews in {time.perf_counter() - started:.1f}s")
+    return conn
+
+
+# ========================================== MEASUREMENT ==========================================
+
+def current_rss():
+    # Resident set size in bytes; /proc is Linux-only, elsewhere the process-wide peak is used
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+@contextlib.contextmanager
+def measure(results, step, rows, interval=0.01):
+    # Wall time, peak RSS (sampled every `interval` seconds) and rows/s of the input table for one step
+    peak = [current_rss()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        wall = time.perf_counter() - started
+        done.set()
+        sampler.join()
+        peak[0] = max(peak[0], current_rss())
+        results[step] = {
+            'wall_s': round(wall, 4),
+            'peak_rss_mb': round(peak[0] / (1 << 20), 1),
+            'rows_per_s': round(rows / wall) if wall else None,
+        }
+        print(f"  {step:<28} {wall:9.3f}s  {results[step]['peak_rss_mb']:9.1f} MB  "
+              f"{results[step]['rows_per_s'] or 0:>14,} rows/s")
+
+
+def run_pipeline(conn, rows, approx_distinct=False):
+    sqlite_path = os.path.join(BENCH_DIR, f'steam_reviews_{rows}.db')
+    results = {}
+    with measure(results, db_queries.COMPACT_TABLE, rows):
+        db_queries.build_compact(conn)
+    with measure(results, 'review_rollup', rows):
+        db_queries.build_rollup(conn, approx_distinct=approx_distinct)
+    with measure(results, db_queries.DAILY_TABLE, rows):
+        db_queries.build_daily(conn)
+    with measure(results, segments.USER_FEATURES_TABLE, rows):
+        segments.build_user_features(conn)
+    with measure(results, segments.CUBE_TABLE, rows):
+        segments.segment(conn)
+    for table, query, _ in db_queries.QUESTIONS:
+        with measure(results, table, rows):
+            db_queries.build_question(conn, table, query)
+    with measure(results, 'sampling', rows):
+        db_queries.build_review_sample(conn, os.path.join(BENCH_DIR, f'steam_reviews_sample_{rows}.csv'))
+        db_queries.build_samples(conn)
+    with measure(results, 'sqlite_export', rows):
+        db_queries.export_to_sqlite(conn, sqlite_path)
+    return results
+
+
+# ========================================== DASHBOARD STARTUP ==========================================
+# Each dashboard runs in a fresh Python process under Streamlit's AppTest, so every import is paid again as
+# on a server cold start. first_paint is the first script run (imports, cached one-time setup, default page),
+# rerun is a rerun with no widget changed, and the other steps are one click each: every sidebar page in
+# turn, then the first button. Only the script runs are timed, not the browser.
+
+STARTUP_APPS = ['visualise.py', 'steam_graph.py']
+
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+steps, errors = {'import_streamlit': time.perf_counter() - started}, {}
+
+def timed(step, run):
+    started = time.perf_counter()
+    app = run()
+    steps[step] = time.perf_counter() - started
+    if app.exception:
+        errors[step] = app.exception[0].value
+
+app = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[2]))
+timed('first_paint', app.run)
+timed('rerun', app.run)
+if app.sidebar.radio:
+    options = app.sidebar.radio[0].options
+    for option in options[1:] + options[:1]:
+        timed(f'page: {option}', app.sidebar.radio[0].set_value(option).run)
+if app.button:
+    timed(f'click: {app.button[0].label}', app.button[0].click().run)
+print(json.dumps({'steps': steps, 'errors': errors}))
+"""
+
+
+def bench_startup(app, runs=3, timeout=120):
+    # Best of `runs` cold starts for each step
+    best, errors = {}, {}
+    for _ in range(runs):
+        child = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, os.path.abspath(app), str(timeout)],
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            raise RuntimeError(f"{app} failed to start:\n{child.stderr}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        for step, wall in result['steps'].items():
+            best[step] = min(best.get(step, wall), wall)
+        errors.update(result['errors'])
+
+    results = {}
+    for step, wall in best.items():
+        results[step] = {'wall_s': round(wall, 4)}
+        print(f"  {step:<40} {wall:9.3f}s" + (f"  ERROR {errors[step]}" if step in errors else ""))
+    return results
+
+
+# ========================================== HISTORY ==========================================
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(history, path=HISTORY_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def pipeline_settings(run):
+    return run['rows'], run['threads'], run['memory_limit'], run.get('approx_distinct', False)
+
+
+def compare(run, history, threshold, settings=pipeline_settings):
+    # Compare each step with the latest earlier run with the same settings: scale and engine settings for
+    # pipeline runs, the app for startup runs
+    previous = next((r for r in reversed(history) if settings(r) == settings(run)), None)
+    if previous is None:
+        return []
+
+    regressions = []
+    for step, result in run['steps'].items():
+        before = previous['steps'].get(step)
+        if not before or not before['wall_s']:
+            continue
+        change = result['wall_s'] / before['wall_s'] - 1
+        if change > threshold:
+            regressions.append(step)
+            print(f"  REGRESSION {step}: {before['wall_s']:.3f}s -> {result['wall_s']:.3f}s ({change:+.0%}) "
+                  f"since {previous['commit'] or previous['started_at']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the question builds, sampling and export on synthetic data")
+    parser.add_argument('--scales', nargs='+', default=['100k'], choices=list(SCALES))
+    parser.add_argument('--threads', nargs='+', type=int, default=[None], help="DuckDB threads settings to compare")
+    parser.add_argument('--memory-limit', nargs='+', default=[None], help="DuckDB memory_limit settings to compare, e.g. 4GB")
+    parser.add_argument('--approx-distinct', action='store_true', help="build the rollup with HLL sketches")
+    parser.add_argument('--sample-csv', default=db_queries.SAMPLE_CSV_PATH,
+                        help="sample whose schema and value distributions the synthetic data follows")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--regenerate', action='store_true', help="rebuild the synthetic tables even if present")
+    parser.add_argument('--regression-threshold', type=float, default=0.2,
+                        help="flag steps this much slower than the previous comparable run")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--startup', action='store_true',
+                        help="benchmark the dashboards' cold start and per-click reruns instead of the pipeline")
+    parser.add_argument('--startup-runs', type=int, default=3, help="cold starts per dashboard, best one kept")
+    args = parser.parse_args()
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+
+    if args.startup:
+        history = load_history(STARTUP_HISTORY_PATH)
+        regressions = []
+        for app in STARTUP_APPS:
+            print(f"{app} ({args.startup_runs} cold starts)")
+            run = {
+                'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'streamlit_version': importlib.metadata.version('streamlit'),
+                'app': app,
+                'steps': bench_startup(app, args.startup_runs),
+            }
+            regressions += compare(run, history, args.regression_threshold, settings=lambda r: r['app'])
+            history.append(run)
+            save_history(history, STARTUP_HISTORY_PATH)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+        return
+
+    history = load_history()
+    regressions = []
+
+    for scale in args.scales:
+        rows = SCALES[scale]
+        conn = bench_database(rows, args.sample_csv, args.seed, args.regenerate)
+        for threads, memory_limit in itertools.product(args.threads, args.memory_limit):
+            if threads:
+                conn.execute(f"SET threads = {int(threads)}")
+            else:
+                conn.execute("RESET threads")
+            if memory_limit:
+                conn.execute(f"SET memory_limit = '{memory_limit}'")
+            else:
+                conn.execute("RESET memory_limit")
+            threads_used, memory_used = conn.execute(
+                "SELECT current_setting('threads'), current_setting('memory_limit')"
+            ).fetchone()
+            print(f"{scale} ({rows:,} rows), threads={threads_used}, memory_limit={memory_used}")
+
+            run = {
+                'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'duckdb_version': duckdb.__version__,
+                'rows': rows,
+                'threads': threads_used,
+                'memory_limit': memory_used,
+                'approx_distinct': args.approx_distinct,
+                'steps': run_pipeline(conn, rows, args.approx_distinct),
+            }
+            regressions += compare(run, history, args.regression_threshold)
+            history.append(run)
+            save_history(history)
+        conn.close()
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
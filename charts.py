@@ -0,0 +1,358 @@
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import column_store
+import query_cache
+import serving
+
+CHART_CACHE_DIR = 'chart_cache'
+
+# Professional color palette
+PRIMARY_DARK = '#1a1d23'
+SECONDARY_DARK = '#2d3748'
+ACCENT_BLUE = '#3182ce'
+SUCCESS_GREEN = '#38a169'
+WARNING_ORANGE = '#ed8936'
+LIGHT_TEXT = '#e2e8f0'
+MUTED_TEXT = '#a0aec0'
+CARD_BG = '#2d3748'
+BORDER_COLOR = '#4a5568'
+
+# Professional matplotlib theme, applied while a chart is drawn and saved
+THEME = ['dark_background', {
+    'figure.facecolor': PRIMARY_DARK,
+    'axes.facecolor': SECONDARY_DARK,
+    'axes.edgecolor': BORDER_COLOR,
+    'text.color': LIGHT_TEXT,
+    'axes.labelcolor': LIGHT_TEXT,
+    'xtick.color': LIGHT_TEXT,
+    'ytick.color': LIGHT_TEXT,
+    'grid.color': BORDER_COLOR,
+    'grid.alpha': 0.3,
+}]
+
+
+# ========================================== CHARTS ==========================================
+# Each chart takes the dashboard's fetch function plus its widget state and returns a Figure. Figures
+# are built with the object-oriented API rather than pyplot, so they never enter pyplot's global
+# registry and are freed as soon as the rendered image has been taken.
+#
+# matplotlib and seaborn take longer to import than the rest of the dashboard to start, so they are only
+# imported by the first chart actually drawn; charts served from the render cache never load them.
+
+def new_figure(**kwargs):
+    from matplotlib.figure import Figure
+    return Figure(**kwargs)
+
+
+def rotate_xticks(ax, fontsize=8):
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_ha('right')
+        label.set_fontsize(fontsize)
+
+
+def top_reviews_chart(fetch):
+    q1_1 = fetch("question1_1_top", limit=8)
+    fig = new_figure(figsize=(8, 4))
+    ax = fig.subplots()
+    q1_1.plot(kind="bar", x="app_name", y="total_reviews", ax=ax, color=ACCENT_BLUE)
+    ax.set_title("🏆 Top 8 Games by Reviews", fontsize=14, color=ACCENT_BLUE)
+    ax.set_xlabel("🎮 Game", fontsize=10)
+    ax.set_ylabel("📝 Reviews", fontsize=10)
+    rotate_xticks(ax)
+    fig.tight_layout()
+    return fig
+
+
+def positive_vs_total_chart(fetch):
+    q1_2 = fetch("question1_2")
+    fig = new_figure(figsize=(8, 4))
+    ax = fig.subplots()
+    ax.scatter(q1_2["total_reviews"], q1_2["positive_percentage"], color=SUCCESS_GREEN, alpha=0.7, s=30)
+    ax.set_title("👍 Positive % vs. Total Reviews", fontsize=14, color=ACCENT_BLUE)
+    ax.set_xlabel("📊 Total Reviews", fontsize=10)
+    ax.set_ylabel("💚 Positive %", fontsize=10)
+    fig.tight_layout()
+    return fig
+
+
+def high_volume_games_chart(fetch):
+    q1_3 = fetch("question1_3_top", limit=8)
+    fig = new_figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.bar(q1_3["app_name"], q1_3["total_reviews"], color=WARNING_ORANGE, label="📊 Total Reviews")
+    ax.bar(q1_3["app_name"], q1_3["positive_reviews"], color=SUCCESS_GREEN, label="👍 Positive Reviews")
+    ax.set_title("🚀 Top 8 Games with Over 500,000 Reviews", fontsize=14, color=ACCENT_BLUE)
+    ax.set_xlabel("🎮 Game", fontsize=10)
+    ax.set_ylabel("📈 Reviews", fontsize=10)
+    ax.legend()
+    rotate_xticks(ax)
+    fig.tight_layout()
+    return fig
+
+
+def playtime_chart(fetch):
+    q2_2 = fetch("question2_2_top", limit=8)
+    q2_3 = fetch("question2_3_top", limit=8)
+    fig = new_figure(figsize=(12, 8))
+    ax1, ax2 = fig.subplots(2, 1)
+
+    q2_2.plot(kind="bar", x="app_name", y="total_playtime", ax=ax1, color=ACCENT_BLUE)
+    ax1.set_title("⏰ Top 8 Games by Total Playtime", fontsize=14, color=ACCENT_BLUE)
+    ax1.set_xlabel("🎮 Game", fontsize=10)
+    ax1.set_ylabel("⏱️ Total Playtime (hours)", fontsize=10)
+    ax1.tick_params(axis='x', rotation=45, labelsize=8)
+
+    q2_3.plot(kind="bar", x="app_name", y="average_playtime_per_day", ax=ax2, color=SUCCESS_GREEN)
+    ax2.set_title("🔥 Top 8 Games by Avg Playtime/Day", fontsize=14, color=ACCENT_BLUE)
+    ax2.set_xlabel("🎮 Game", fontsize=10)
+    ax2.set_ylabel("📈 Avg Playtime/Day (hours)", fontsize=10)
+    ax2.tick_params(axis='x', rotation=45, labelsize=8)
+
+    fig.tight_layout()
+    return fig
+
+
+def top_languages_chart(fetch):
+    q3_1 = fetch("question3_1_top", limit=8)
+    fig = new_figure(figsize=(8, 5))
+    ax = fig.subplots()
+    q3_1.plot(kind="bar", x="language", y="review_count", ax=ax, color=ACCENT_BLUE)
+    ax.set_title("🌐 Top 8 Languages by Reviews", fontsize=12, color=ACCENT_BLUE)
+    ax.set_xlabel("🗣️ Language", fontsize=10)
+    ax.set_ylabel("📊 Reviews (k)", fontsize=10)
+    rotate_xticks(ax)
+    fig.tight_layout()
+    return fig
+
+
+def purchasing_languages_chart(fetch):
+    q3_2 = fetch("question3_2_top", limit=8)
+    fig = new_figure(figsize=(8, 5))
+    ax = fig.subplots()
+    q3_2.plot(kind="bar", x="language", y="total_users", ax=ax, color=SUCCESS_GREEN)
+    ax.set_title("🛒 Top 8 Languages by Purchasing Users", fontsize=12, color=ACCENT_BLUE)
+    ax.set_xlabel("🌍 Language", fontsize=10)
+    ax.set_ylabel("👥 Total Users", fontsize=10)
+    rotate_xticks(ax)
+    fig.tight_layout()
+    return fig
+
+
+def quarter_formatter(x, pos=None):
+    import matplotlib.dates as mdates
+    date = mdates.num2date(x)
+    quarter = (date.month - 1) // 3 + 1
+    return f"{date.year}-Q{quarter}"
+
+
+def trending_games_chart(fetch, selected_games, granularity='quarter', quarter_series=None):
+    import matplotlib.dates as mdates
+    from matplotlib.ticker import FuncFormatter
+
+    if granularity == 'quarter' and quarter_series is not None:
+        # Quarter series sliced out of the column store (ColumnStore.series) instead of re-aggregating the cube
+        trends = quarter_series(selected_games).rename(columns={'quarter': 'period'})
+    else:
+        # Each selected game's full series at the chosen granularity, straight from the daily cube's
+        # (app_name, day) index
+        placeholders = ", ".join("?" for _ in selected_games)
+        trends = fetch(serving.TREND_TABLE,
+                       columns=f"app_name, {serving.TREND_GRANULARITIES[granularity]} AS period, "
+                               f"{serving.TREND_MEASURES}",
+                       where=f"app_name IN ({placeholders})", group_by="app_name, period", order_by="period",
+                       params=list(selected_games))
+    trends['period'] = pd.to_datetime(trends['period'])
+
+    fig = new_figure(figsize=(12, 6))
+    ax = fig.subplots()
+    colors = [ACCENT_BLUE, SUCCESS_GREEN, WARNING_ORANGE, '#ff6b9d', '#c44569', '#f8b500']
+    # Daily and weekly series have too many points for markers
+    marker = 'o' if granularity in ('month', 'quarter', 'year') else None
+
+    for i, game in enumerate(selected_games):
+        game_data = trends[trends['app_name'] == game]
+        ax.plot(game_data['period'], game_data['review_count'], marker=marker, linewidth=3 if marker else 1.5,
+                markersize=6, label=game, color=colors[i % len(colors)])
+
+    if granularity == 'quarter':
+        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=3))
+        ax.xaxis.set_major_formatter(FuncFormatter(quarter_formatter))
+    else:
+        locator = mdates.AutoDateLocator()
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+    rotate_xticks(ax, fontsize=9)
+    ax.set_title(f'🚀 Trending Games per {granularity.title()}', fontsize=14, color=ACCENT_BLUE)
+    ax.set_xlabel(f'📅 {granularity.title()}', fontsize=10)
+    ax.set_ylabel('📊 Review Count', fontsize=10)
+    ax.legend(title='🎮 Games', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=9)
+    fig.tight_layout()
+    return fig
+
+
+def demographics_chart(fetch, selected_language):
+    import matplotlib.colors as mcolors
+    import seaborn as sns
+    from matplotlib.colors import ListedColormap
+
+    q5 = fetch("question5")
+    fig = new_figure(figsize=(14, 6))
+    ax1, ax2 = fig.subplots(1, 2)
+
+    # Heatmap
+    pivot_table = q5.pivot_table(index="language", columns="user_type", values="unique_users", aggfunc="sum")
+    colors_list = ['#0f1419', '#1a2332', '#2d4a5c', '#3d6b7d', '#4d8ca0', '#63b3d1', '#8cc9e8', '#b3ddf5']
+    custom_cmap = ListedColormap(colors_list)
+
+    sns.heatmap(pivot_table, annot=True, cmap=custom_cmap, ax=ax1, fmt=".0f", cbar_kws={'label': '👥 Users'},
+                norm=mcolors.LogNorm(vmin=pivot_table.min().min(), vmax=pivot_table.max().max()))
+    ax1.set_title("🌍 User Demographics Heatmap", fontsize=12, color=ACCENT_BLUE)
+    ax1.set_xlabel("🎮 User Type", fontsize=10)
+    ax1.set_ylabel("🗣️ Language", fontsize=10)
+
+    # Bar chart for selected language
+    selected_data = fetch("question5", where="language = ?", params=(selected_language,))
+    bars = ax2.bar(selected_data["user_type"], selected_data["unique_users"],
+                   color=[ACCENT_BLUE, SUCCESS_GREEN, WARNING_ORANGE][:len(selected_data)])
+    ax2.set_title(f"👥 {selected_language} Demographics", fontsize=12, color=ACCENT_BLUE)
+    ax2.set_xlabel("🎮 User Type", fontsize=10)
+    ax2.set_ylabel("👤 Unique Users", fontsize=10)
+
+    for bar in bars:
+        height = bar.get_height()
+        ax2.text(bar.get_x() + bar.get_width() / 2., height, f'{int(height)}', ha='center', va='bottom',
+                 fontweight='bold', fontsize=9)
+
+    fig.tight_layout()
+    return fig
+
+
+CHARTS = {
+    'top_reviews': top_reviews_chart,
+    'positive_vs_total': positive_vs_total_chart,
+    'high_volume_games': high_volume_games_chart,
+    'playtime': playtime_chart,
+    'top_languages': top_languages_chart,
+    'purchasing_languages': purchasing_languages_chart,
+    'trending_games': trending_games_chart,
+    'demographics': demographics_chart,
+}
+
+
+# Widget options, shared by the dashboard and the pre-render step so both agree on the default views
+TREND_DEFAULTS = ('quarter', 10)
+
+
+def top_trending(fetch, granularity, n):
+    return fetch(serving.trend_ranking(granularity), columns="period, rank, app_name, review_count, positive_reviews",
+                 where="rank <= ?", order_by="period DESC, rank", params=(n,))
+
+
+def trending_game_options(fetch, granularity, n):
+    # Games in the top n of any period, most reviewed first
+    return fetch(serving.trend_ranking(granularity), columns="app_name", where="rank <= ?", group_by="app_name",
+                 order_by="SUM(review_count) DESC", params=(n,))['app_name'].tolist()
+
+
+def demographic_language_options(fetch):
+    return fetch("question5")["language"].unique().tolist()
+
+
+# ========================================== RENDER CACHE ==========================================
+
+class ChartCache:
+    # Rendered chart images keyed on (chart, data version, widget state). Images live in an in-memory LRU
+    # and, when cache_dir is set, are also looked up on disk where pre-rendered charts are stored.
+
+    def __init__(self, cache_dir=None, max_entries=128, fmt='png', dpi=200):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.fmt = fmt
+        self.dpi = dpi
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, chart, version, state):
+        digest = hashlib.sha1(repr((version, state)).encode()).hexdigest()[:16]
+        return f"{chart}-{digest}"
+
+    def render(self, chart, version, state, draw, persist=False):
+        key = self.key(chart, version, state)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+
+        path = os.path.join(self.cache_dir, f"{key}.{self.fmt}") if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                image = f.read()
+        else:
+            import matplotlib.style
+            with matplotlib.style.context(THEME):
+                fig = draw()
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format=self.fmt, dpi=self.dpi, bbox_inches='tight')
+            fig.clear()
+            image = buffer.getvalue()
+            if persist and path:
+                with open(path, 'wb') as f:
+                    f.write(image)
+
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        return image
+
+
+# ========================================== PRE-RENDER ==========================================
+
+def default_views(fetch):
+    views = [(chart, ()) for chart in CHARTS if chart not in ('trending_games', 'demographics')]
+    granularity, n = TREND_DEFAULTS
+    games = trending_game_options(fetch, granularity, n)
+    if games:
+        views.append(('trending_games', (tuple(games[:3]), granularity)))
+    languages = demographic_language_options(fetch)
+    if languages:
+        views.append(('demographics', (languages[0],)))
+    return views
+
+
+def prerender(sqlite_path, cache_dir=CHART_CACHE_DIR, column_dir=column_store.DEFAULT_DIR):
+    # Renders the dashboard's default views right after an export, so first visits are served from disk.
+    # Sources and keys are the ones visualise.show_chart uses, or the dashboard wouldn't find the images.
+    version = query_cache.file_version(sqlite_path)
+    hot_store = column_store.ColumnStore(column_dir)
+    hot_quarters = hot_store.available(column_store.APP_TOTALS, column_store.QUARTER_SERIES)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(cache_dir)
+
+    conn = sqlite3.connect(sqlite_path)
+    fetch = serving.make_fetch(lambda query, params: pd.read_sql_query(query, conn, params=params),
+                               serving.existing_objects(conn))
+    cache = ChartCache(cache_dir)
+    rendered = 0
+    for chart, state in default_views(fetch):
+        sources = {'quarter_series': hot_store.series} if chart == 'trending_games' and hot_quarters else {}
+        try:
+            cache.render(chart, (version, hot_store.version) if sources else version, state,
+                         lambda: CHARTS[chart](fetch, *state, **sources), persist=True)
+            rendered += 1
+        except (TypeError, ValueError) as error:
+            # e.g. a question table with no rows has nothing to plot
+            print(f"Skipped pre-rendering {chart}: {error}")
+    conn.close()
+    print(f"Pre-rendered {rendered} charts to {cache_dir}")
+    return rendered
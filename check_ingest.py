@@ -0,0 +1,134 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import duckdb
+import pandas as pd
+
+import benchmark
+import db_queries
+import segments
+
+# ========================================== INCREMENTAL INGEST CHECK ==========================================
+# Generates synthetic reviews (see benchmark.synthesize_reviews), holds the newest of them back as a batch CSV
+# and runs db_queries.ingest_batch on a database built from the rest, then compares every table the ingest
+# maintains with a full rebuild over all the reviews. The batch brings new authors, a new app and a language
+# the older reviews don't have, so the dimension merges, the enum rebuild and the distinct-count deltas
+# (|U ∪ B| = |U| + |B ∪ S| - |S|, or the sketch merge with --approx-distinct) are all exercised. The batch is
+# ingested as two files, the new language only in the first, so the second merges the per-author features
+# instead of rebuilding them.
+
+NEW_LANGUAGE = 'klingon'
+NEW_APP_ID = 999999999
+NEW_APP_NAME = 'Ingest Check: New Game'
+
+# Compared tables: name -> query. author_key depends on the order authors arrived in, so the tables keyed
+# by it are compared by steamid.
+CHECKED_TABLES = {
+    db_queries.APPS_TABLE: f"SELECT * FROM {db_queries.APPS_TABLE}",
+    db_queries.AUTHORS_TABLE: f"SELECT * EXCLUDE (author_key) FROM {db_queries.AUTHORS_TABLE}",
+    db_queries.COMPACT_TABLE: f"""
+        SELECT c.* EXCLUDE (author_key, language), c.language::VARCHAR AS language, a.steamid
+        FROM {db_queries.COMPACT_TABLE} c
+        LEFT JOIN {db_queries.AUTHORS_TABLE} a USING (author_key)
+    """,
+    db_queries.ROLLUP_TABLE: f"SELECT * FROM {db_queries.ROLLUP_TABLE}",
+    db_queries.DAILY_TABLE: f"SELECT * FROM {db_queries.DAILY_TABLE}",
+    **{table: f"SELECT * FROM {table}" for table in db_queries.question_tables},
+    segments.USER_FEATURES_TABLE: f"SELECT * EXCLUDE (author_key) FROM {segments.USER_FEATURES_TABLE}",
+    **{table: f"""
+        SELECT a.steamid, t.* EXCLUDE (author_key)
+        FROM {table} t
+        JOIN {db_queries.AUTHORS_TABLE} a USING (author_key)
+    """ for table in (segments.USER_LANGUAGES_TABLE, segments.USER_SEGMENTS_TABLE)},
+    segments.CUBE_TABLE: f"SELECT * FROM {segments.CUBE_TABLE}",
+}
+
+
+def build_all(conn, approx_distinct=False):
+    db_queries.build_compact(conn)
+    db_queries.build_rollup(conn, approx_distinct=approx_distinct)
+    db_queries.build_daily(conn)
+    db_queries.build_questions(conn)
+    segments.build_user_features(conn)
+    segments.segment(conn)
+
+
+def prepare_reviews(conn, rows, batch_fraction, sample_csv, seed):
+    # Synthetic reviews with some NULL flags; returns the timestamps after which reviews go to the first and
+    # the second batch. Batch reviews are partly moved to the new app, and those of the first to the new language.
+    benchmark.synthesize_reviews(conn, rows, sample_csv, seed)
+    conn.execute("UPDATE steam_reviews SET received_for_free = NULL WHERE review_id % 5 = 2")
+    cutoff, second_cutoff = conn.execute(
+        f"SELECT quantile_disc(timestamp_created, [{1 - batch_fraction}, {1 - batch_fraction / 2}]) FROM steam_reviews"
+    ).fetchone()[0]
+    conn.execute(f"""
+        UPDATE steam_reviews SET language = '{NEW_LANGUAGE}'
+        WHERE timestamp_created > {cutoff} AND timestamp_created <= {second_cutoff} AND review_id % 10 = 0
+    """)
+    conn.execute(f"""
+        UPDATE steam_reviews SET app_id = {NEW_APP_ID}, app_name = '{NEW_APP_NAME}'
+        WHERE timestamp_created > {cutoff} AND review_id % 10 = 1
+    """)
+    return cutoff, second_cutoff
+
+
+def compare(incremental, full, table, query):
+    # Rows in a canonical order; sums of doubles may differ in the last bits with the merge order
+    left = incremental.execute(f"SELECT * FROM ({query}) ORDER BY ALL").df()
+    right = full.execute(f"SELECT * FROM ({query}) ORDER BY ALL").df()
+    try:
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, rtol=1e-9)
+    except AssertionError as error:
+        print(f"  {table:<28} DIFFERENT ({len(left)} vs {len(right)} rows)\n{error}")
+        return False
+    print(f"  {table:<28} ok ({len(left)} rows)")
+    return True
+
+
+def check(rows, batch_fraction=0.1, approx_distinct=False, sample_csv=db_queries.SAMPLE_CSV_PATH, seed=0):
+    full = duckdb.connect()
+    incremental = duckdb.connect()
+    with tempfile.TemporaryDirectory() as directory:
+        cutoff, second_cutoff = prepare_reviews(full, rows, batch_fraction, sample_csv, seed)
+        batches = {
+            os.path.join(directory, 'batch_1.csv'): f"timestamp_created BETWEEN {cutoff} + 1 AND {second_cutoff}",
+            os.path.join(directory, 'batch_2.csv'): f"timestamp_created > {second_cutoff}",
+        }
+        for batch_csv, condition in batches.items():
+            full.execute(f"COPY (SELECT * FROM steam_reviews WHERE {condition}) TO '{batch_csv}' (HEADER)")
+        older = full.execute(f"SELECT * FROM steam_reviews WHERE timestamp_created <= {cutoff}").fetch_arrow_table()
+        incremental.register('older_reviews', older)
+        incremental.execute("CREATE TABLE steam_reviews AS SELECT * FROM older_reviews")
+        incremental.unregister('older_reviews')
+
+        build_all(incremental, approx_distinct)
+        ingested = sum(db_queries.ingest_batch(incremental, batch_csv) for batch_csv in batches)
+        build_all(full, approx_distinct)
+
+    print(f"Ingested {ingested} of {rows} reviews; incremental vs full rebuild:")
+    tables = dict(CHECKED_TABLES)
+    if approx_distinct:
+        tables[db_queries.SKETCH_TABLE] = f"SELECT * FROM {db_queries.SKETCH_TABLE}"
+    matches = [compare(incremental, full, table, query) for table, query in tables.items()]
+    full.close()
+    incremental.close()
+    return all(matches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that an incremental ingest matches a full rebuild")
+    parser.add_argument('--rows', type=int, default=100_000, help="synthetic reviews in total")
+    parser.add_argument('--batch-fraction', type=float, default=0.1, help="share of the newest reviews ingested")
+    parser.add_argument('--approx-distinct', action='store_true', help="check the HLL sketch merge instead")
+    parser.add_argument('--sample-csv', default=db_queries.SAMPLE_CSV_PATH)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if not check(args.rows, args.batch_fraction, args.approx_distinct, args.sample_csv, args.seed):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
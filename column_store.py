@@ -0,0 +1,164 @@
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import query_cache
+
+DEFAULT_DIR = 'steam_reviews_columns'
+
+APP_TOTALS = 'app_totals'
+QUARTER_SERIES = 'quarter_series'
+DATASETS = [APP_TOTALS, QUARTER_SERIES]
+
+# ========================================== COLUMN STORE ==========================================
+# The dashboard's hottest metrics as uncompressed Arrow IPC files, one per dataset, which readers
+# memory-map instead of parsing SQLite rows into DataFrames on every rerun. Numeric columns come back as
+# NumPy views of the mapped file, so every Streamlit process slices the same page-cached copy and only the
+# rows a page shows are ever turned into Python objects.
+# app_totals holds one row per app (most reviewed first) and quarter_series one row per (app, quarter),
+# sorted by app_id and quarter so an app's series is a contiguous slice. Files are written next to their
+# final path and renamed over it, like the SQLite export; a reader keeps its old mapping until it notices.
+
+
+def dataset_path(directory, name):
+    return os.path.join(directory, f"{name}.arrow")
+
+
+def write_table(table, path):
+    # One record batch per file, so every column is a single contiguous buffer
+    version = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    staging = f"{path}.{version}"
+    try:
+        with pa.OSFile(staging, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table.combine_chunks(), max_chunksize=max(table.num_rows, 1))
+        os.replace(staging, path)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+
+def export_columns(conn, datasets, directory=DEFAULT_DIR):
+    # datasets: name -> DuckDB query
+    os.makedirs(directory, exist_ok=True)
+    exported = {}
+    for name, query in datasets.items():
+        table = conn.execute(query).fetch_arrow_table()
+        write_table(table, dataset_path(directory, name))
+        exported[name] = table.num_rows
+        print(f"Wrote {name} to {directory} ({table.num_rows} rows)")
+    return exported
+
+
+class ColumnStore:
+    # Shared by every session of a process (see visualise.get_column_store). A dataset is mapped on first
+    # use and remapped when its file is replaced.
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        # The dataset as an Arrow table backed by the mapped file, or None if it hasn't been exported
+        path = dataset_path(self.directory, name)
+        version = query_cache.file_version(path)
+        with self._lock:
+            cached = self._tables.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            table = None
+            if version is not None:
+                with pa.memory_map(path) as source:
+                    table = pa.ipc.open_file(source).read_all()
+            self._tables[name] = (version, table)
+            return table
+
+    @property
+    def version(self):
+        # Changes whenever an export replaces a dataset file, which it can do without touching the SQLite file
+        return tuple(query_cache.file_version(dataset_path(self.directory, name)) for name in DATASETS)
+
+    def available(self, *names):
+        return all(self.table(name) is not None for name in names)
+
+    def array(self, name, column):
+        chunked = self.table(name).column(column)
+        return chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+
+    def column(self, name, column):
+        # Zero-copy for numeric columns without NULLs; anything else is converted
+        array = self.array(name, column)
+        try:
+            return array.to_numpy(zero_copy_only=True)
+        except pa.ArrowInvalid:
+            return array.to_numpy(zero_copy_only=False)
+
+    def rows(self, name, indices, columns=None):
+        # Only the selected rows are materialized as a DataFrame
+        table = self.table(name)
+        if columns is not None:
+            table = table.select(columns)
+        return table.take(pa.array(np.asarray(indices, dtype=np.int64))).to_pandas()
+
+    def top(self, name, by, n, columns=None, mask=None):
+        # The n rows with the highest `by` (where `mask` holds), ties kept in file order
+        values = self.column(name, by)
+        candidates = np.arange(len(values)) if mask is None else np.flatnonzero(mask)
+        order = candidates[np.argsort(-values[candidates], kind='stable')[:n]]
+        return self.rows(name, order, columns)
+
+    def app_names(self):
+        # app_id -> app_name lookup as two sorted arrays
+        app_ids = self.column(APP_TOTALS, 'app_id')
+        order = np.argsort(app_ids, kind='stable')
+        return app_ids[order], self.array(APP_TOTALS, 'app_name').take(pa.array(order))
+
+    def series(self, app_names):
+        # The quarter series of the named apps, in the order given; each is a contiguous slice of quarter_series
+        names = self.array(APP_TOTALS, 'app_name').to_pylist()
+        app_ids = self.column(APP_TOTALS, 'app_id')
+        series_ids = self.column(QUARTER_SERIES, 'app_id')
+        positions = {name: index for index, name in reversed(list(enumerate(names)))}
+        indices, labels = [], []
+        for name in app_names:
+            if name in positions:
+                app_id = app_ids[positions[name]]
+                start, end = np.searchsorted(series_ids, [app_id, app_id + 1])
+                indices.append(np.arange(start, end))
+                labels += [name] * (end - start)
+        frame = self.rows(QUARTER_SERIES, np.concatenate(indices) if indices else [])
+        frame.insert(0, 'app_name', labels)
+        return frame
+
+    def top_per_quarter(self, n):
+        # RANK() of each app within its quarter by review count, keeping ranks <= n; the same rows and
+        # columns as charts.top_trending at quarter granularity, most recent quarter first
+        quarters = self.array(QUARTER_SERIES, 'quarter').cast(pa.int32()).to_numpy()
+        counts = self.column(QUARTER_SERIES, 'review_count')
+        order = np.lexsort((-counts, -quarters))
+        quarters, counts = quarters[order], counts[order]
+        positions = np.arange(len(order))
+        new_quarter = np.ones(len(order), dtype=bool)
+        new_quarter[1:] = quarters[1:] != quarters[:-1]
+        new_count = new_quarter.copy()
+        new_count[1:] |= counts[1:] != counts[:-1]
+        quarter_start = np.maximum.accumulate(np.where(new_quarter, positions, 0))
+        tie_start = np.maximum.accumulate(np.where(new_count, positions, 0))
+        rank = tie_start - quarter_start + 1
+        keep = rank <= n
+
+        top = self.rows(QUARTER_SERIES, order[keep], ['app_id', 'quarter', 'review_count', 'positive_reviews'])
+        sorted_ids, sorted_names = self.app_names()
+        names = sorted_names.take(pa.array(np.searchsorted(sorted_ids, top['app_id'].to_numpy()))).to_pylist()
+        return pd.DataFrame({
+            'period': top['quarter'].astype(str),
+            'rank': rank[keep],
+            'app_name': names,
+            'review_count': top['review_count'],
+            'positive_reviews': top['positive_reviews'],
+        })
@@ -1,308 +1,1196 @@
+import argparse
+import fnmatch
+import functools
+
 import duckdb
-import sqlite3
-
-# ========================================== DUCKDB SETUP =============================================
-
-#  Create or connect to the DuckDB database file
-conn = duckdb.connect('steam_reviews_db.duckdb')
-
-# Import the CSV into a new table in the database, excluding the 'review' column
-# conn.execute("""
-#     CREATE TABLE steam_reviews AS
-#     SELECT app_id, app_name, review_id, language, timestamp_created, timestamp_updated,
-#            recommended, votes_helpful, votes_funny, weighted_vote_score, comment_count,
-#            steam_purchase, received_for_free, written_during_early_access, "author.steamid",
-#            "author.num_games_owned", "author.num_reviews", "author.playtime_forever",
-#            "author.playtime_last_two_weeks", "author.playtime_at_review", "author.last_played"
-#     FROM read_csv_auto('steam_reviews.csv', max_line_size=100000000)
-# """)
-
-conn.execute("""
-    COPY (
-        SELECT *
-        FROM steam_reviews
-        ORDER BY RANDOM()
-        LIMIT 500
-        
-    ) TO 'steam_reviews_sample.csv' (HEADER, DELIMITER ',');
-""")
-
-conn.execute(
+
+import column_store
+import hll
+import profiling
+import run_profiles
+import sampling
+import scheduler
+import segments
+import serving
+import sqlite_export
+from schema import (APPS_TABLE, AUTHORS_TABLE, COMPACT_TABLE, DUCKDB_PATH, FLAG_BITS, FLAG_NULL_BITS, LANGUAGE_TYPE,
+                    flag_expr)
+
+SQLITE_PATH = 'steam_reviews_samples_500.db'
+SAMPLE_CSV_PATH = 'steam_reviews_sample.csv'
+
+# steam_reviews columns, i.e. the CSV columns without the 'review' text
+REVIEW_COLUMNS = [
+    'app_id', 'app_name', 'review_id', 'language', 'timestamp_created', 'timestamp_updated',
+    'recommended', 'votes_helpful', 'votes_funny', 'weighted_vote_score', 'comment_count',
+    'steam_purchase', 'received_for_free', 'written_during_early_access', 'author.steamid',
+    'author.num_games_owned', 'author.num_reviews', 'author.playtime_forever',
+    'author.playtime_last_two_weeks', 'author.playtime_at_review', 'author.last_played',
+]
+
+# ========================================== COMPACT REVIEW STORAGE ==========================================
+# reviews_compact is the copy of steam_reviews the rollup scans. App names live once in the apps dimension,
+# authors are a dense 4-byte author_key into the authors dimension instead of the 64-bit steamid, language is
+# a one-byte ENUM, the four boolean fields (and whether each is NULL) are bits of one UTINYINT and epoch-second
+# timestamps are 4-byte UINTEGERs (good until 2106), so a scan reads a fraction of the bytes of the string
+# columns. Distinct author counts hash the small keys, and per-author analysis (see segments.py) reads one row
+# per author. Table names and the flags layout live in schema.py, which segments.py reads them from too.
+
+TIMESTAMP_COLUMNS = ['timestamp_created', 'timestamp_updated', 'author.last_played']
+STAGE_TABLE = 'review_stage'
+
+
+def apps_query(source):
+    # An app renamed over time keeps its latest name
+    return f"""
+        SELECT app_id::INTEGER AS app_id, arg_max(app_name, timestamp_created) AS app_name
+        FROM {source}
+        GROUP BY app_id
     """
-    CREATE OR REPLACE TABLE steam_reviews_sample_500 AS
-    SELECT * FROM read_csv_auto('steam_reviews_sample.csv')
+
+
+def authors_query(source):
+    # One row per author: their latest snapshot of games owned and reviews written, plus what their reviews add up to
+    return f"""
+        SELECT
+            "author.steamid" AS steamid,
+            arg_max("author.num_games_owned", timestamp_created) AS num_games_owned,
+            arg_max("author.num_reviews", timestamp_created) AS num_reviews,
+            COUNT(*) AS review_count,
+            SUM("author.playtime_forever")::BIGINT AS playtime_forever_sum,
+            MAX(timestamp_created)::UINTEGER AS last_review
+        FROM {source}
+        WHERE "author.steamid" IS NOT NULL
+        GROUP BY "author.steamid"
     """
-)
 
-# ========================================== QUESTION TABLES ==========================================
 
-print("""======================================= Question 1 =================================================""")
-# Analyzing the total reviews, positive reviews, and positive review percentage on each game
-
-# Q1.1: Total reviews per game
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question1_1 AS
-    SELECT
-        app_name,
-        COUNT(*) as total_reviews
-    FROM steam_reviews
-    GROUP BY app_name;
-""")
-results = conn.execute("SELECT * FROM question1_1 ORDER BY total_reviews DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-# Q1.2: Positive reviews and percentage
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question1_2 AS
-    SELECT
-        app_name,
-        COUNT(*) as total_reviews,
-        SUM(CASE WHEN recommended THEN 1 ELSE 0 END) as positive_reviews,
-        ROUND(SUM(CASE WHEN recommended THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) as positive_percentage
-    FROM steam_reviews
-    GROUP BY app_name;
-""")
-results = conn.execute("SELECT * FROM question1_2 ORDER BY positive_percentage DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-# Q1.3: Games with over 500,000 reviews
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question1_3 AS
-    SELECT
-        app_name,
-        COUNT(*) as total_reviews,
-        SUM(CASE WHEN recommended THEN 1 ELSE 0 END) as positive_reviews,
-        ROUND(SUM(CASE WHEN recommended THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) as positive_percentage
-    FROM steam_reviews
-    GROUP BY app_name
-    HAVING COUNT(*) > 500000;
-""")
-results = conn.execute("SELECT * FROM question1_3 ORDER BY total_reviews DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-
-print("""======================================= Question 2 =================================================""")
-# Finding out which games are addicting
-
-# Q2.1: Game with the highest playtime_forever
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question2_1 AS
-    SELECT app_name, "author.playtime_forever"
-    FROM steam_reviews
-    ORDER BY "author.playtime_forever" DESC
-    LIMIT 1;
-""")
-results = conn.execute("SELECT * FROM question2_1;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-# Q2.2: Total playtime per game
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question2_2 AS
-    SELECT
-        ROW_NUMBER() OVER (ORDER BY SUM("author.playtime_forever") / 60.0 DESC) AS row_num,
-        app_name,
-        SUM("author.playtime_forever") / 60.0 AS total_playtime
-    FROM steam_reviews
-    GROUP BY app_name;
-""")
-results = conn.execute("SELECT * FROM question2_2 ORDER BY total_playtime DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-# Q2.3: Average playtime per day
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question2_3 AS
-    WITH playtime_two_weeks AS (
-        SELECT 
-            app_name, 
-            SUM("author.playtime_last_two_weeks") / 60.0 AS total_playtime_last_two_weeks,
-            COUNT(DISTINCT "author.steamid") AS users_per_app
-        FROM steam_reviews
-        WHERE "author.playtime_last_two_weeks" > 0
-        GROUP BY app_name
+def stage_query(source):
+    # The review columns as one rebuild reads them: already in the compact types where no value is lost, but
+    # still with app names, steamids and the booleans the dimensions and flags are derived from
+    columns = []
+    for column in REVIEW_COLUMNS:
+        if column == 'app_id':
+            columns.append("app_id::INTEGER AS app_id")
+        elif column in TIMESTAMP_COLUMNS:
+            columns.append(f'"{column}"::UINTEGER AS "{column}"')
+        else:
+            columns.append(f'"{column}"')
+    return f"SELECT {', '.join(columns)} FROM {source}"
+
+
+def compact_query(source):
+    columns = []
+    for column in REVIEW_COLUMNS:
+        if column == 'app_name' or column in FLAG_BITS:
+            continue
+        elif column == 'app_id':
+            columns.append("r.app_id::INTEGER AS app_id")
+        elif column == 'language':
+            columns.append(f"r.language::{LANGUAGE_TYPE} AS language")
+        elif column == 'author.steamid':
+            columns.append("a.author_key")
+        elif column in TIMESTAMP_COLUMNS:
+            columns.append(f'r."{column}"::UINTEGER AS "{column}"')
+        else:
+            columns.append(f'r."{column}"')
+    flags = " + ".join(
+        f"CASE WHEN r.{flag} THEN {bit} WHEN r.{flag} IS NULL THEN {FLAG_NULL_BITS[flag]} ELSE 0 END"
+        for flag, bit in FLAG_BITS.items()
     )
-    SELECT 
-        app_name,
-        (total_playtime_last_two_weeks * 1.0 / users_per_app) / 14.0 AS average_playtime_per_day
-    FROM playtime_two_weeks
-    WHERE (total_playtime_last_two_weeks * 1.0 / users_per_app) / 14.0 >= 2.5;
-""")
-results = conn.execute("SELECT * FROM question2_3 ORDER BY average_playtime_per_day DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-print("""======================================= Question 3 =================================================""")
-# Which population buys the most games?
-
-# Q3.1: Reviews by language
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question3_1 AS
-    SELECT 
-        language,
-        COUNT(*) / 1000 as review_count,
-        ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER(), 2) as percentage
-    FROM steam_reviews
-    GROUP BY language;
-""")
-results = conn.execute("SELECT * FROM question3_1 ORDER BY review_count DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-# Q3.2: Users by language who purchased games
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question3_2 AS
-    SELECT 
-        language,
-        COUNT(DISTINCT "author.steamid") AS total_users, 
-        ROUND(
-            COUNT(DISTINCT "author.steamid") * 100.0 / 
-            SUM(COUNT(DISTINCT "author.steamid")) OVER(), 
-            2
-        ) AS percentage
-    FROM steam_reviews
-    WHERE 
-        steam_purchase = TRUE 
-        AND received_for_free = FALSE
-    GROUP BY language;
-""")
-results = conn.execute("SELECT * FROM question3_2 ORDER BY total_users DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-print("""======================================= Question 4 =================================================""")
-# Top 10 trending games for each quarter
-
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question4 AS
-    WITH monthly_reviews AS (
+    columns.append(f"({flags})::UTINYINT AS flags")
+    return f"""
+        SELECT {', '.join(columns)}
+        FROM {source} AS r
+        LEFT JOIN {AUTHORS_TABLE} AS a ON a.steamid = r."author.steamid"
+    """
+
+
+def build_authors(conn, source='steam_reviews'):
+    # Keys follow steamid order, so the dimension is sorted by both
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {AUTHORS_TABLE} AS
+        SELECT (ROW_NUMBER() OVER (ORDER BY steamid))::INTEGER AS author_key, *
+        FROM ({authors_query(source)})
+    """)
+
+
+def merge_authors(conn, source):
+    # New authors get the next keys, so existing keys (and reviews_compact) stay valid. Known authors take
+    # the batch's snapshot when it has their latest review, and add its reviews to their totals.
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE authors_batch AS {authors_query(source)}")
+    latest = "b.last_review >= a.last_review"
+    conn.execute(f"""
+        UPDATE {AUTHORS_TABLE} AS a
+        SET num_games_owned = CASE WHEN {latest} THEN b.num_games_owned ELSE a.num_games_owned END,
+            num_reviews = CASE WHEN {latest} THEN b.num_reviews ELSE a.num_reviews END,
+            review_count = a.review_count + b.review_count,
+            playtime_forever_sum = COALESCE(a.playtime_forever_sum + b.playtime_forever_sum,
+                                            a.playtime_forever_sum, b.playtime_forever_sum),
+            last_review = GREATEST(a.last_review, b.last_review)
+        FROM authors_batch b
+        WHERE a.steamid = b.steamid
+    """)
+    conn.execute(f"""
+        INSERT INTO {AUTHORS_TABLE}
+        SELECT ((SELECT COALESCE(MAX(author_key), 0) FROM {AUTHORS_TABLE})
+                + ROW_NUMBER() OVER (ORDER BY steamid))::INTEGER AS author_key, b.*
+        FROM authors_batch b
+        WHERE b.steamid NOT IN (SELECT steamid FROM {AUTHORS_TABLE})
+    """)
+
+
+def build_compact(conn, source='steam_reviews', extra_language_sources=()):
+    # The source is read once into a staging table that apps, authors, the language enum and reviews_compact
+    # are all derived from, so a Parquet view isn't rescanned for each of them
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE {STAGE_TABLE} AS {stage_query(source)}")
+    # The enum holds every language of the sources; the table using it has to go before it can be replaced
+    languages = " UNION ".join(
+        f"SELECT language FROM {table}" for table in (STAGE_TABLE, *extra_language_sources)
+    )
+    conn.execute(f"CREATE OR REPLACE TABLE {APPS_TABLE} AS {apps_query(STAGE_TABLE)}")
+    build_authors(conn, STAGE_TABLE)
+    conn.execute(f"DROP TABLE IF EXISTS {COMPACT_TABLE}")
+    conn.execute(f"DROP TYPE IF EXISTS {LANGUAGE_TYPE}")
+    conn.execute(f"""
+        CREATE TYPE {LANGUAGE_TYPE} AS ENUM (
+            SELECT language FROM ({languages}) WHERE language IS NOT NULL ORDER BY language
+        )
+    """)
+    conn.execute(f"CREATE TABLE {COMPACT_TABLE} AS {compact_query(STAGE_TABLE)}")
+    conn.execute(f"DROP TABLE {STAGE_TABLE}")
+
+
+def compact_batch(conn):
+    # review_batch -> review_batch_compact. A language the enum doesn't know yet needs a new enum type, so
+    # reviews_compact is rebuilt first (new languages are rare); new apps and authors are added to their dimensions.
+    # Returns whether reviews_compact was rebuilt.
+    conn.execute("DROP TABLE IF EXISTS review_batch_compact")
+    new_languages = conn.execute(f"""
+        SELECT COUNT(*) FROM (SELECT DISTINCT language FROM review_batch WHERE language IS NOT NULL)
+        WHERE language NOT IN (SELECT unnest(enum_range(NULL::{LANGUAGE_TYPE})))
+    """).fetchone()[0]
+    if new_languages:
+        build_compact(conn, 'steam_reviews', ['review_batch'])
+    conn.execute(f"""
+        INSERT INTO {APPS_TABLE}
+        SELECT * FROM ({apps_query('review_batch')})
+        WHERE app_id NOT IN (SELECT app_id FROM {APPS_TABLE})
+    """)
+    merge_authors(conn, 'review_batch')
+    conn.execute(f"CREATE TEMP TABLE review_batch_compact AS {compact_query('review_batch')}")
+    return new_languages > 0
+
+
+def table_exists(conn, table):
+    return conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = current_database() AND table_name = ?",
+        [table],
+    ).fetchone()[0] > 0
+
+
+def view_exists(conn, view):
+    return conn.execute(
+        "SELECT COUNT(*) FROM duckdb_views() WHERE database_name = current_database() AND view_name = ?",
+        [view],
+    ).fetchone()[0] > 0
+
+
+# ========================================== REVIEW ROLLUP ============================================
+# Every question table is derived from review_rollup, which is built with a single scan of reviews_compact.
+# The 'detail' grouping set holds the additive measures per (app_id, language, quarter, user_type); app
+# names are joined from the apps dimension after aggregating.
+# COUNT(DISTINCT author_key) can't be summed across groups, so the coarser grouping sets the
+# questions need are computed in the same scan and labelled in grouping_set.
+
+ROLLUP_TABLE = 'review_rollup'
+
+ROLLUP_GROUPING_SETS = {
+    0: 'detail',                # (app_id, language, quarter, user_type)
+    7: 'app',                   # (app_id)
+    11: 'language',             # (language)
+    10: 'user_type_language',   # (user_type, language)
+    14: 'user_type',            # (user_type)
+    15: 'total',                # ()
+}
+
+# Quarter, day and user segment of a review, shared by the rollup and anything that reads raw reviews
+QUARTER_EXPR = "DATE_TRUNC('quarter', TIMESTAMP 'epoch' + timestamp_created * INTERVAL '1 second')"
+DAY_EXPR = "CAST(TIMESTAMP 'epoch' + timestamp_created * INTERVAL '1 second' AS DATE)"
+USER_TYPE_EXPR = """
+    CASE
+        WHEN "author.num_games_owned" < 3 THEN 'Light Multi-Game'
+        WHEN "author.num_games_owned" < 10 THEN 'Casual Multi-Game'
+        WHEN "author.num_games_owned" BETWEEN 10 AND 200 THEN 'Hardcore Multi-Game'
+    END
+"""
+
+
+# How each rollup measure merges when a batch of new reviews is folded in
+ROLLUP_MEASURES = {
+    'review_count': 'sum',
+    'positive_reviews': 'sum',
+    'playtime_forever_sum': 'sum',
+    'playtime_forever_count': 'sum',
+    'playtime_forever_max': 'max',
+    'games_owned_sum': 'sum',
+    'games_owned_count': 'sum',
+    'active_reviews': 'sum',
+    'active_playtime_two_weeks': 'sum',
+    'active_users': 'distinct',
+    'purchase_reviews': 'sum',
+    'purchasing_users': 'distinct',
+    'unique_users': 'distinct',
+}
+
+ROLLUP_KEYS = ['grouping_set', 'app_id', 'language', 'quarter', 'user_type']
+
+# Columns of each grouping set, in the same order as ROLLUP_GROUPING_SETS
+ROLLUP_GROUPS = [
+    ('app_id', 'language', 'quarter', 'user_type'),
+    ('app_id',),
+    ('language',),
+    ('user_type', 'language'),
+    ('user_type',),
+    (),
+]
+
+# Distinct measures: the authors counted, optionally restricted to reviews matching a condition
+DISTINCT_FILTERS = {
+    'active_users': "playtime_last_two_weeks > 0",
+    'purchasing_users': "steam_purchase = TRUE AND received_for_free = FALSE",
+    'unique_users': None,
+}
+
+
+def reviews_query(source):
+    # The review fields every rollup measure is computed from, read from a table in the compact layout
+    return f"""
         SELECT
-            app_name,
-            DATE_TRUNC('quarter', TIMESTAMP 'epoch' + timestamp_created * INTERVAL '1 second') AS quarter,
-            COUNT(*) AS review_count
-        FROM steam_reviews
-        GROUP BY app_name, quarter
-    ),
-    top_games_by_quarter AS (
+            app_id,
+            language,
+            {QUARTER_EXPR} AS quarter,
+            {USER_TYPE_EXPR} AS user_type,
+            {flag_expr('recommended')} AS recommended,
+            {flag_expr('steam_purchase')} AS steam_purchase,
+            {flag_expr('received_for_free')} AS received_for_free,
+            author_key,
+            "author.num_games_owned" AS num_games_owned,
+            "author.playtime_forever" AS playtime_forever,
+            "author.playtime_last_two_weeks" AS playtime_last_two_weeks
+        FROM {source}
+    """
+
+
+def grouping_set_expr():
+    cases = "\n".join(
+        f"            WHEN {grouping_id} THEN '{name}'" for grouping_id, name in ROLLUP_GROUPING_SETS.items()
+    )
+    return f"""CASE GROUPING(app_id, language, quarter, user_type)
+{cases}
+            END"""
+
+
+def grouping_sets(*extra):
+    return ",\n            ".join(f"({', '.join(group + extra)})" for group in ROLLUP_GROUPS)
+
+
+def rollup_query(source=COMPACT_TABLE, approx_distinct=False):
+    # With approx_distinct the distinct counts are left NULL here and filled in from the HLL sketches
+    distinct = {}
+    for measure, condition in DISTINCT_FILTERS.items():
+        if approx_distinct:
+            distinct[measure] = f"NULL::BIGINT AS {measure}"
+        elif condition:
+            distinct[measure] = f"COUNT(DISTINCT author_key) FILTER (WHERE {condition}) AS {measure}"
+        else:
+            distinct[measure] = f"COUNT(DISTINCT author_key) AS {measure}"
+    return f"""
+        WITH reviews AS ({reviews_query(source)}),
+        grouped AS (
+            SELECT
+                {grouping_set_expr()} AS grouping_set,
+                app_id,
+                language,
+                quarter,
+                user_type,
+                COUNT(*) AS review_count,
+                SUM(CASE WHEN recommended THEN 1 ELSE 0 END)::BIGINT AS positive_reviews,
+                SUM(playtime_forever) AS playtime_forever_sum,
+                COUNT(playtime_forever) AS playtime_forever_count,
+                MAX(playtime_forever) AS playtime_forever_max,
+                SUM(num_games_owned)::BIGINT AS games_owned_sum,
+                COUNT(num_games_owned) AS games_owned_count,
+                COUNT(*) FILTER (WHERE playtime_last_two_weeks > 0) AS active_reviews,
+                SUM(playtime_last_two_weeks) FILTER (WHERE playtime_last_two_weeks > 0) AS active_playtime_two_weeks,
+                {distinct['active_users']},
+                COUNT(*) FILTER (WHERE steam_purchase = TRUE AND received_for_free = FALSE) AS purchase_reviews,
+                {distinct['purchasing_users']},
+                {distinct['unique_users']}
+            FROM reviews
+            GROUP BY GROUPING SETS (
+                {grouping_sets()}
+            )
+        )
         SELECT
-            quarter,
+            grouping_set,
+            app_id,
             app_name,
-            review_count,
-            RANK() OVER (PARTITION BY quarter ORDER BY review_count DESC) AS rank_
-        FROM monthly_reviews
+            language::VARCHAR AS language,
+            quarter,
+            user_type,
+            {", ".join(ROLLUP_MEASURES)}
+        FROM grouped
+        LEFT JOIN {APPS_TABLE} USING (app_id)
+    """
+
+
+def rollup_key_match(left, right, keys=ROLLUP_KEYS):
+    return " AND ".join(f"{left}.{key} IS NOT DISTINCT FROM {right}.{key}" for key in keys)
+
+
+def build_rollup(conn, source=COMPACT_TABLE, approx_distinct=False):
+    if approx_distinct:
+        conn.execute(f"CREATE OR REPLACE TABLE {SKETCH_TABLE} AS {sketch_query(source)}")
+    else:
+        # Without sketches, later incremental ingests go back to exact distinct counts
+        conn.execute(f"DROP TABLE IF EXISTS {SKETCH_TABLE}")
+    conn.execute(f"CREATE OR REPLACE TABLE {ROLLUP_TABLE} AS {rollup_query(source, approx_distinct)}")
+    if approx_distinct:
+        refresh_distinct_estimates(conn)
+
+
+# ========================================== APPROXIMATE DISTINCT COUNTS ====================================
+# Opt-in (--approx-distinct): instead of exact COUNT(DISTINCT author_key) sets, the distinct counts come from
+# HyperLogLog sketches (see hll.py for the error bounds). Sketches are kept only at the grain the questions read
+# them: one per app (question2_3) and one per (user_type, language), which the language (question3_2), user_type
+# and total rows of question5 merge. review_rollup_sketch stores each one sparsely, one row per (group, register)
+# with the highest rank per distinct measure, so a group never takes more than 2^14 rows however many reviews it
+# has. Incremental batches merge their own sketch in, so nothing rescans reviews. The detail grouping set keeps
+# its distinct counts NULL.
+
+SKETCH_TABLE = 'review_rollup_sketch'
+SKETCH_KEYS = ['grouping_set', 'app_id', 'language', 'user_type', 'register']
+
+
+def sketch_query(source=COMPACT_TABLE):
+    ranks = ",\n                ".join(
+        f"MAX(rho) FILTER (WHERE {condition}) AS {measure}" if condition else f"MAX(rho) AS {measure}"
+        for measure, condition in DISTINCT_FILTERS.items()
     )
-    SELECT
-        app_name,
-        quarter,
-        review_count
-    FROM top_games_by_quarter
-    WHERE rank_ <= 10;
-""")
-results = conn.execute("SELECT * FROM question4 ORDER BY quarter, review_count DESC;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
-
-print("""======================================= Question 5 =================================================""")
-# User demographics analysis
-
-conn.execute("""
-    CREATE TABLE IF NOT EXISTS question5 AS
-    SELECT 
-        COALESCE(user_type, 'All Users') AS user_type,
-        COALESCE(language, 'All Languages') AS language,
-        COUNT(DISTINCT "author.steamid") AS unique_users,
-        AVG("author.num_games_owned") AS avg_games_owned,
-        AVG("author.playtime_forever") AS avg_playtime,
-        AVG(CASE WHEN recommended THEN 1.0 ELSE 0.0 END) AS recommendation_rate
-    FROM (
-        SELECT 
-            CASE 
-                WHEN "author.num_games_owned" < 3 THEN 'Light Multi-Game'
-                WHEN "author.num_games_owned" < 10 THEN 'Casual Multi-Game'
-                WHEN "author.num_games_owned" BETWEEN 10 AND 200 THEN 'Hardcore Multi-Game'
-            END AS user_type,
+    # Grouped on the language enum but stored as VARCHAR, so the enum can be replaced. Authors are hashed by
+    # steamid: author_key depends on the order authors were ingested in, so a rebuild would hash other values
+    # than the sketches merged so far and count the same author twice
+    return f"""
+        WITH reviews AS ({reviews_query(source)})
+        SELECT * REPLACE (language::VARCHAR AS language)
+        FROM (
+            SELECT
+                CASE WHEN GROUPING(app_id) = 0 THEN 'app' ELSE 'user_type_language' END AS grouping_set,
+                app_id,
+                language,
+                user_type,
+                register,
+                {ranks}
+            FROM (
+                SELECT reviews.*, {hll.register_expr('a.steamid')} AS register, {hll.rho_expr('a.steamid')} AS rho
+                FROM reviews
+                JOIN {AUTHORS_TABLE} AS a USING (author_key)
+            )
+            GROUP BY GROUPING SETS ((app_id, register), (user_type, language, register))
+        )
+    """
+
+
+def estimates_query():
+    measures = ", ".join(DISTINCT_FILTERS)
+    merged = ",\n                ".join(f"MAX({measure}) AS {measure}" for measure in DISTINCT_FILTERS)
+    estimates = ",\n            ".join(f"{hll.estimate_expr(measure)} AS {measure}" for measure in DISTINCT_FILTERS)
+    return f"""
+        WITH merged AS (
+            SELECT grouping_set, app_id, language, user_type, register, {measures}
+            FROM {SKETCH_TABLE}
+            WHERE grouping_set = 'app'
+            UNION ALL BY NAME
+            SELECT
+                CASE GROUPING(user_type, language)
+                    WHEN 0 THEN 'user_type_language'
+                    WHEN 1 THEN 'user_type'
+                    WHEN 2 THEN 'language'
+                    WHEN 3 THEN 'total'
+                END AS grouping_set,
+                language,
+                user_type,
+                register,
+                {merged}
+            FROM {SKETCH_TABLE}
+            WHERE grouping_set = 'user_type_language'
+            GROUP BY GROUPING SETS (
+                (user_type, language, register), (user_type, register), (language, register), (register)
+            )
+        )
+        SELECT
+            grouping_set,
+            app_id,
             language,
-            "author.steamid",
-            "author.num_games_owned",
-            "author.playtime_forever",
-            recommended
-        FROM steam_reviews
-    ) 
-    GROUP BY CUBE(user_type, language);
-""")
-results = conn.execute("SELECT * FROM question5 ORDER BY language, avg_games_owned, user_type;").fetchall()
-print("==================================================================================\nSample Data:")
-for result in results:
-    print(result)
+            NULL AS quarter,
+            user_type,
+            {estimates}
+        FROM merged
+        GROUP BY ALL
+    """
 
-# ========================================== QUESTION SAMPLE TABLES ==========================================
-# Loop to create a randomized sample table for each question table
-question_tables = [
-    "question1_1", "question1_2", "question1_3",
-    "question2_1", "question2_2", "question2_3",
-    "question3_1", "question3_2",
-    "question4", "question5"
-]
 
-for table in question_tables:
-    sample_table_name = f"{table}_samples_500"
+def refresh_distinct_estimates(conn):
+    conn.execute(f"""
+        UPDATE {ROLLUP_TABLE} AS r
+        SET {", ".join(f"{measure} = e.{measure}" for measure in DISTINCT_FILTERS)}
+        FROM ({estimates_query()}) AS e
+        WHERE {rollup_key_match('r', 'e')}
+    """)
+
+
+def merge_sketch(conn, source):
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE sketch_batch AS {sketch_query(source)}")
+    conn.execute(f"""
+        UPDATE {SKETCH_TABLE} AS k
+        SET {", ".join(f"{measure} = GREATEST(k.{measure}, b.{measure})" for measure in DISTINCT_FILTERS)}
+        FROM sketch_batch b
+        WHERE {rollup_key_match('k', 'b', SKETCH_KEYS)}
+    """)
+    conn.execute(f"""
+        INSERT INTO {SKETCH_TABLE}
+        SELECT b.* FROM sketch_batch b
+        WHERE NOT EXISTS (SELECT 1 FROM {SKETCH_TABLE} k WHERE {rollup_key_match('k', 'b', SKETCH_KEYS)})
+    """)
+
+
+def has_sketches(conn):
+    return table_exists(conn, SKETCH_TABLE)
+
+
+# ========================================== DAILY TREND CUBE ==========================================
+# Review counts, positives and playtime per (app, day). Every measure is additive, so any coarser period
+# (week, month, quarter, year) and any top-N per period can be derived from it without rescanning reviews;
+# the dashboard does that in SQLite (see serving.trend_ranking).
+
+DAILY_TABLE = 'app_daily'
+DAILY_MEASURES = ['review_count', 'positive_reviews', 'playtime_forever_sum', 'playtime_forever_count']
+
+
+def daily_query(source=COMPACT_TABLE):
+    return f"""
+        SELECT app_id, app_name, day, {", ".join(DAILY_MEASURES)}
+        FROM (
+            SELECT
+                app_id,
+                {DAY_EXPR} AS day,
+                COUNT(*) AS review_count,
+                SUM(CASE WHEN {flag_expr('recommended')} THEN 1 ELSE 0 END)::BIGINT AS positive_reviews,
+                SUM("author.playtime_forever") AS playtime_forever_sum,
+                COUNT("author.playtime_forever") AS playtime_forever_count
+            FROM {source}
+            GROUP BY app_id, day
+        )
+        LEFT JOIN {APPS_TABLE} USING (app_id)
+    """
+
+
+def build_daily(conn, source=COMPACT_TABLE):
+    conn.execute(f"CREATE OR REPLACE TABLE {DAILY_TABLE} AS {daily_query(source)}")
+
+
+def merge_daily_delta(conn):
+    # Adds the batch's (app, day) rows to the cube, the same way additive rollup measures are merged
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE daily_batch AS {daily_query('review_batch_compact')}")
+    match = "d.app_id = b.app_id AND d.day = b.day"
+    conn.execute(f"""
+        UPDATE {DAILY_TABLE} AS d
+        SET {", ".join(f"{m} = COALESCE(d.{m} + b.{m}, d.{m}, b.{m})" for m in DAILY_MEASURES)}
+        FROM daily_batch b
+        WHERE {match}
+    """)
+    conn.execute(f"""
+        INSERT INTO {DAILY_TABLE}
+        SELECT b.* FROM daily_batch b
+        WHERE NOT EXISTS (SELECT 1 FROM {DAILY_TABLE} d WHERE {match})
+    """)
+
+
+# ========================================== INCREMENTAL INGEST =======================================
+# A new CSV batch is appended to steam_reviews and folded into review_rollup as delta aggregates, so the
+# question tables can be refreshed without rescanning the full table. ingest_state keeps one row per
+# batch; its latest (timestamp_created, review_id) is the high-water mark, and batch rows at or below
+# it are treated as already ingested. The per-author feature tables are merged for the batch's authors only,
+# and the segment x language cube is regrouped from them.
+
+FEATURE_TABLES = [segments.USER_FEATURES_TABLE, segments.USER_LANGUAGES_TABLE, segments.USER_SEGMENTS_TABLE,
+                  segments.CUBE_TABLE]
+
+def read_reviews_csv(csv_path, types=None):
+    # types: column -> DuckDB type, instead of the types sniffed from the file (a header-only file sniffs as VARCHAR)
+    columns = ", ".join(f'"{column}"' for column in REVIEW_COLUMNS)
+    csv_path = csv_path.replace("'", "''")
+    options = ""
+    if types:
+        options = ", types = {" + ", ".join(f"'{column}': '{t}'" for column, t in types.items()) + "}"
+    return f"SELECT {columns} FROM read_csv_auto('{csv_path}', max_line_size=100000000{options})"
+
+
+def column_types(conn, table):
+    return dict(conn.execute(
+        "SELECT column_name, data_type FROM duckdb_columns() "
+        "WHERE database_name = current_database() AND table_name = ?",
+        [table],
+    ).fetchall())
+
+
+def get_high_water_mark(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_state (
+            batch_file VARCHAR,
+            rows_ingested BIGINT,
+            high_water_timestamp BIGINT,
+            high_water_review_id BIGINT,
+            ingested_at TIMESTAMP
+        )
+    """)
+    mark = conn.execute("""
+        SELECT high_water_timestamp, high_water_review_id
+        FROM ingest_state
+        ORDER BY ingested_at DESC
+        LIMIT 1
+    """).fetchone()
+    if mark is None:
+        # First batch: everything already in steam_reviews counts as ingested
+        mark = conn.execute("""
+            SELECT timestamp_created, review_id
+            FROM steam_reviews
+            ORDER BY timestamp_created DESC, review_id DESC
+            LIMIT 1
+        """).fetchone()
+    return mark if mark is not None else (None, None)
+
+
+def merge_rollup_delta(conn):
+    # review_batch_compact holds the new reviews. Additive measures merge by adding the batch rollup. A distinct
+    # count grows by the batch users not already counted in the group: |U ∪ B| = |U| + |B ∪ S| - |S|,
+    # where S are the existing reviews written by the batch's authors. With sketches the batch sketch is
+    # merged in instead and the distinct counts are re-estimated.
+    approx_distinct = has_sketches(conn)
+    conn.execute(
+        f"CREATE OR REPLACE TEMP TABLE rollup_batch AS {rollup_query('review_batch_compact', approx_distinct)}"
+    )
+
+    if approx_distinct:
+        merge_sketch(conn, 'review_batch_compact')
+        joins = ""
+    else:
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE review_batch_seen AS
+            SELECT * FROM {COMPACT_TABLE}
+            WHERE author_key IN (SELECT author_key FROM review_batch_compact)
+        """)
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE rollup_seen AS {rollup_query('review_batch_seen')}")
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE rollup_union AS
+            {rollup_query('(SELECT * FROM review_batch_compact UNION ALL SELECT * FROM review_batch_seen)')}
+        """)
+        joins = f"""
+            JOIN rollup_union u ON {rollup_key_match('b', 'u')}
+            LEFT JOIN rollup_seen s ON {rollup_key_match('b', 's')}
+        """
+
+    # Per-group delta of every measure
+    deltas = []
+    for measure, merge in ROLLUP_MEASURES.items():
+        if merge == 'distinct' and not approx_distinct:
+            deltas.append(f"u.{measure} - COALESCE(s.{measure}, 0) AS {measure}")
+        else:
+            deltas.append(f"b.{measure}")
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE rollup_delta AS
+        SELECT {", ".join(f"b.{key}" for key in ROLLUP_KEYS)}, b.app_name, {", ".join(deltas)}
+        FROM rollup_batch b
+        {joins}
+    """)
+
+    assignments = []
+    for measure, merge in ROLLUP_MEASURES.items():
+        if merge == 'max':
+            assignments.append(f"{measure} = GREATEST(r.{measure}, d.{measure})")
+        else:
+            # Sums stay NULL only while both sides are NULL
+            assignments.append(f"{measure} = COALESCE(r.{measure} + d.{measure}, r.{measure}, d.{measure})")
+    conn.execute(f"""
+        UPDATE {ROLLUP_TABLE} AS r
+        SET {", ".join(assignments)}
+        FROM rollup_delta d
+        WHERE {rollup_key_match('r', 'd')}
+    """)
     conn.execute(f"""
-        CREATE OR REPLACE TABLE {sample_table_name} AS 
-        SELECT * FROM {table}
-        ORDER BY RANDOM()
-        LIMIT 500;
+        INSERT INTO {ROLLUP_TABLE} BY NAME
+        SELECT d.* FROM rollup_delta d
+        WHERE NOT EXISTS (SELECT 1 FROM {ROLLUP_TABLE} r WHERE {rollup_key_match('r', 'd')})
     """)
 
-    # Show the results
-    results = conn.execute(f"SELECT * FROM {sample_table_name};").fetchall()
-    print(f"Sample Data for {table} (500 random rows):")
+    if approx_distinct:
+        refresh_distinct_estimates(conn)
+
+
+def ingest_batch(conn, csv_path):
+    if view_exists(conn, 'steam_reviews'):
+        # A view over the Parquet dataset (see ingest.py) can't be appended to
+        raise ValueError(
+            "steam_reviews is a view over Parquet files, which --ingest can't append to: regenerate the dataset "
+            "from the full CSV with ingest.py and rebuild, or load steam_reviews as a DuckDB table"
+        )
+    high_water_timestamp, high_water_review_id = get_high_water_mark(conn)
+    # The batch is read with the types of steam_reviews, whatever the file's own values sniff as
+    types = {column: t for column, t in column_types(conn, 'steam_reviews').items() if column in REVIEW_COLUMNS}
+    conn.execute("CREATE OR REPLACE TEMP TABLE review_batch AS SELECT * FROM steam_reviews LIMIT 0")
+    conn.execute(f"""
+        INSERT INTO review_batch
+        SELECT * FROM ({read_reviews_csv(csv_path, types)})
+        WHERE $timestamp IS NULL
+            OR timestamp_created > $timestamp
+            OR (timestamp_created = $timestamp AND review_id > $review_id)
+    """, {'timestamp': high_water_timestamp, 'review_id': high_water_review_id})
+    rows = conn.execute("SELECT COUNT(*) FROM review_batch").fetchone()[0]
+    if rows == 0:
+        print(f"No new reviews in {csv_path}")
+        return 0
+    batch_timestamp, batch_review_id = conn.execute("""
+        SELECT timestamp_created, review_id
+        FROM review_batch
+        ORDER BY timestamp_created DESC, review_id DESC
+        LIMIT 1
+    """).fetchone()
+
+    # The compact table, the rollup and the daily cube have to exist before deltas can be merged into them
+    if not table_exists(conn, COMPACT_TABLE) or not table_exists(conn, ROLLUP_TABLE):
+        build_compact(conn)
+        build_rollup(conn)
+    if not table_exists(conn, DAILY_TABLE):
+        build_daily(conn)
+    if not all(table_exists(conn, table) for table in FEATURE_TABLES):
+        segments.build_user_features(conn)
+        segments.segment(conn)
+
+    conn.begin()
+    try:
+        rebuilt = compact_batch(conn)
+        merge_rollup_delta(conn)
+        merge_daily_delta(conn)
+        conn.execute("INSERT INTO steam_reviews SELECT * FROM review_batch")
+        conn.execute(f"INSERT INTO {COMPACT_TABLE} SELECT * FROM review_batch_compact")
+        if rebuilt:
+            # Rebuilding reviews_compact for a new language renumbers the authors
+            segments.build_user_features(conn)
+            segments.segment(conn)
+        else:
+            segments.merge_user_features(conn, 'review_batch_compact')
+            segments.segment(conn, authors='review_batch_compact')
+        build_questions(conn)
+        conn.execute(
+            "INSERT INTO ingest_state VALUES (?, ?, ?, ?, current_timestamp)",
+            [csv_path, rows, batch_timestamp, batch_review_id],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Ingested {rows} new reviews from {csv_path}")
+    return rows
+
+
+# ========================================== QUESTION TABLES ==========================================
+# (table, query over review_rollup, ORDER BY used when printing the results)
+
+QUESTIONS = [
+    # Q1.1: Total reviews per game
+    ("question1_1", """
+        SELECT
+            app_name,
+            review_count AS total_reviews
+        FROM review_rollup
+        WHERE grouping_set = 'app'
+    """, "total_reviews DESC"),
+
+    # Q1.2: Positive reviews and percentage
+    ("question1_2", """
+        SELECT
+            app_name,
+            review_count AS total_reviews,
+            positive_reviews,
+            ROUND(positive_reviews * 100.0 / review_count, 2) AS positive_percentage
+        FROM review_rollup
+        WHERE grouping_set = 'app'
+    """, "positive_percentage DESC"),
+
+    # Q1.3: Games with over 500,000 reviews
+    ("question1_3", """
+        SELECT
+            app_name,
+            review_count AS total_reviews,
+            positive_reviews,
+            ROUND(positive_reviews * 100.0 / review_count, 2) AS positive_percentage
+        FROM review_rollup
+        WHERE grouping_set = 'app' AND review_count > 500000
+    """, "total_reviews DESC"),
+
+    # Q2.1: Game with the highest playtime_forever
+    ("question2_1", """
+        SELECT app_name, playtime_forever_max AS "author.playtime_forever"
+        FROM review_rollup
+        WHERE grouping_set = 'app'
+        ORDER BY playtime_forever_max DESC, app_name
+        LIMIT 1
+    """, None),
+
+    # Q2.2: Total playtime per game
+    ("question2_2", """
+        SELECT
+            ROW_NUMBER() OVER (ORDER BY playtime_forever_sum / 60.0 DESC) AS row_num,
+            app_name,
+            playtime_forever_sum / 60.0 AS total_playtime
+        FROM review_rollup
+        WHERE grouping_set = 'app'
+    """, "total_playtime DESC"),
+
+    # Q2.3: Average playtime per day
+    ("question2_3", """
+        SELECT
+            app_name,
+            (active_playtime_two_weeks / 60.0 / active_users) / 14.0 AS average_playtime_per_day
+        FROM review_rollup
+        WHERE grouping_set = 'app'
+            AND active_reviews > 0
+            AND (active_playtime_two_weeks / 60.0 / active_users) / 14.0 >= 2.5
+    """, "average_playtime_per_day DESC"),
+
+    # Q3.1: Reviews by language
+    ("question3_1", """
+        SELECT
+            language,
+            review_count / 1000 AS review_count,
+            ROUND(review_count * 100.0 / SUM(review_count) OVER(), 2) AS percentage
+        FROM review_rollup
+        WHERE grouping_set = 'language'
+    """, "review_count DESC"),
+
+    # Q3.2: Users by language who purchased games
+    ("question3_2", """
+        SELECT
+            language,
+            purchasing_users AS total_users,
+            ROUND(purchasing_users * 100.0 / SUM(purchasing_users) OVER(), 2) AS percentage
+        FROM review_rollup
+        WHERE grouping_set = 'language' AND purchase_reviews > 0
+    """, "total_users DESC"),
+
+    # Q4: Top 10 trending games for each quarter
+    ("question4", """
+        WITH quarterly_reviews AS (
+            SELECT
+                app_name,
+                quarter,
+                SUM(review_count)::BIGINT AS review_count
+            FROM review_rollup
+            WHERE grouping_set = 'detail'
+            GROUP BY app_name, quarter
+        ),
+        top_games_by_quarter AS (
+            SELECT
+                quarter,
+                app_name,
+                review_count,
+                RANK() OVER (PARTITION BY quarter ORDER BY review_count DESC) AS rank_
+            FROM quarterly_reviews
+        )
+        SELECT
+            app_name,
+            quarter,
+            review_count
+        FROM top_games_by_quarter
+        WHERE rank_ <= 10
+    """, "quarter, review_count DESC"),
+
+    # Q5: User demographics analysis
+    ("question5", """
+        SELECT
+            COALESCE(user_type, 'All Users') AS user_type,
+            COALESCE(language, 'All Languages') AS language,
+            unique_users,
+            games_owned_sum / NULLIF(games_owned_count, 0) AS avg_games_owned,
+            playtime_forever_sum / NULLIF(playtime_forever_count, 0) AS avg_playtime,
+            positive_reviews * 1.0 / review_count AS recommendation_rate
+        FROM review_rollup
+        WHERE grouping_set IN ('user_type_language', 'user_type', 'language', 'total')
+    """, "language, avg_games_owned, user_type"),
+]
+
+question_tables = [table for table, _, _ in QUESTIONS]
+
+
+def build_question(conn, table, query):
+    conn.execute(f"CREATE OR REPLACE TABLE {table} AS {query}")
+
+
+def build_questions(conn):
+    for table, query, _ in QUESTIONS:
+        build_question(conn, table, query)
+
+
+def print_question(conn, table, order_by, limit=None):
+    order_clause = f" ORDER BY {order_by}" if order_by else ""
+    limit_clause = f" LIMIT {int(limit)}" if limit is not None else ""
+    results = conn.execute(f"SELECT * FROM {table}{order_clause}{limit_clause};").fetchall()
+    print("==================================================================================\nSample Data:")
     for result in results:
         print(result)
-# ========================================== EXPORT TO SQLITE ==========================================
-print("""======================================= Exporting to SQLite =======================================""")
-
-# Create SQLite connection
-sqlite_conn = sqlite3.connect('steam_reviews_samples_500.db')
-
-# List of tables to transfer
-tables = [
-    'steam_reviews_sample_500',
-    'question1_1_samples_500', 'question1_2_samples_500', 'question1_3_samples_500',
-    'question2_1_samples_500', 'question2_2_samples_500', 'question2_3_samples_500',
-    'question3_1_samples_500', 'question3_2_samples_500',
-    'question4_samples_500', 'question5_samples_500'
-]
+    if limit is not None and len(results) == limit:
+        print(f"(first {limit} rows of {table})")
+
+
+# ========================================== QUESTION SAMPLE TABLES ==========================================
+# Seeded reservoir samples (see sampling.py); the tables keep their *_500 names whatever the size
+
+SAMPLE_SIZE = 500
 
-# Copy each table
-for table in tables:
-    # Read from DuckDB
-    df = conn.execute(f"SELECT * FROM {table}").fetchdf()
-
-    # Write to SQLite
-    df.to_sql(
-        name=table,
-        con=sqlite_conn,
-        if_exists='replace',
-        index=False
+# Sample table -> rows, for tables that shouldn't use SAMPLE_SIZE
+SAMPLE_SIZES = {}
+
+# Sample table -> columns to stratify by; other tables get a plain reservoir sample
+SAMPLE_STRATA = {
+    # A random 500 of the top 10 per quarter can drop whole quarters
+    'question4_samples_500': ('quarter',),
+}
+
+
+def sample_size(table, sizes=None):
+    return {**SAMPLE_SIZES, **(sizes or {})}.get(table, SAMPLE_SIZE)
+
+
+def build_review_sample(conn, csv_path=SAMPLE_CSV_PATH, size=None, seed=sampling.SEED):
+    # Raw reviews, kept as a CSV next to the databases and loaded back as steam_reviews_sample_500.
+    # last_played is a DOUBLE in the CSV; written as an integer it loads back as INTEGER, not REAL, in SQLite.
+    table = 'steam_reviews_sample_500'
+    size = size or sample_size(table)
+    csv_path = csv_path.replace("'", "''")
+    conn.execute(f"""
+        COPY (
+            SELECT * REPLACE ("author.last_played"::BIGINT AS "author.last_played")
+            FROM ({sampling.sample_query('steam_reviews', size, SAMPLE_STRATA.get(table, ()), seed)})
+        ) TO '{csv_path}' (HEADER, DELIMITER ',');
+    """)
+
+    conn.execute(
+        f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT * FROM read_csv_auto('{csv_path}')
+        """
     )
-    print(f"Exported {table} to SQLite ({len(df)} rows)")
 
-# Clean up
-sqlite_conn.commit()
-sqlite_conn.close()
-conn.close()
 
-print("""======================================= Export Complete =======================================""")
+def build_sample(conn, table, size=None, seed=sampling.SEED):
+    sample_table = f"{table}_samples_500"
+    size = size or sample_size(sample_table)
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {sample_table} AS
+        {sampling.sample_query(table, size, SAMPLE_STRATA.get(sample_table, ()), seed)}
+    """)
+
+
+def print_sample(conn, table, limit=None):
+    results = conn.execute(f"SELECT * FROM {table}_samples_500;").fetchall()
+    print(f"Sample Data for {table} ({len(results)} sampled rows):")
+    for result in results[:limit]:
+        print(result)
+
+
+def build_samples(conn, sizes=None, seed=sampling.SEED):
+    # Loop to create a sample table for each question table
+    for table in question_tables:
+        build_sample(conn, table, sample_size(f"{table}_samples_500", sizes), seed)
+        print_sample(conn, table)
+
+
+# ========================================== BUILD DAG ==========================================
+# review_rollup, app_daily and user_features read reviews_compact, every question table reads review_rollup, every
+# *_samples_500 table reads its question table and segment_language reads user_features; nothing else depends on
+# anything, so independent builds run concurrently (see scheduler.run_dag).
+
+def pipeline_tasks(approx_distinct=False, sample_sizes=None, seed=sampling.SEED):
+    tasks = {
+        COMPACT_TABLE: ((), build_compact),
+        'steam_reviews_sample_500': ((), functools.partial(
+            build_review_sample, size=sample_size('steam_reviews_sample_500', sample_sizes), seed=seed)),
+        ROLLUP_TABLE: ((COMPACT_TABLE,), functools.partial(build_rollup, approx_distinct=approx_distinct)),
+        DAILY_TABLE: ((COMPACT_TABLE,), build_daily),
+        # Builds user_languages as well; segments.py re-segments the authors without rebuilding either
+        segments.USER_FEATURES_TABLE: ((COMPACT_TABLE,), segments.build_user_features),
+        segments.CUBE_TABLE: ((segments.USER_FEATURES_TABLE,), segments.segment),
+    }
+    for table, query, _ in QUESTIONS:
+        tasks[table] = ((ROLLUP_TABLE,), functools.partial(build_question, table=table, query=query))
+        tasks[f"{table}_samples_500"] = ((table,), functools.partial(
+            build_sample, table=table, size=sample_size(f"{table}_samples_500", sample_sizes), seed=seed))
+    return tasks
+
+
+# ========================================== PIPELINE STAGES ==========================================
+# ingest appends --ingest CSVs (refreshing the rollup, daily cube and question tables incrementally), build
+# rebuilds reviews_compact, the rollup, app_daily, the question tables and the user segments, sample redraws
+# the *_500 sample tables and export copies tables to SQLite. --only narrows every stage to the named tables
+# (shell-style patterns, a question table also selects its sample); tables they read are used as already built.
+
+STAGES = ['ingest', 'build', 'sample', 'export']
+
+
+def task_stage(name):
+    return 'sample' if name.endswith('_500') else 'build'
+
+
+def is_selected(table, only=None):
+    if not only:
+        return True
+    question = table.removesuffix('_samples_500')
+    return any(fnmatch.fnmatchcase(table, pattern) or fnmatch.fnmatchcase(question, pattern) for pattern in only)
+
+
+def select_tasks(tasks, stages, only=None):
+    return {name: task for name, task in tasks.items() if task_stage(name) in stages and is_selected(name, only)}
+
+
+def configure_engine(conn, profile='auto', **overrides):
+    # Budget shared by all concurrent builds: DuckDB threads and memory are per database, not per cursor
+    settings = run_profiles.resolve_profile(profile, **overrides)
+    run_profiles.apply_settings(conn, settings)
+    return settings
+
+
+# ========================================== EXPORT TO SQLITE ==========================================
+
+# List of tables to transfer: the full question tables, daily trend cube and segment x language cube, plus the
+# 500-row samples
+export_tables = (
+    ['steam_reviews_sample_500']
+    + question_tables
+    + [DAILY_TABLE, segments.CUBE_TABLE]
+    + [f"{table}_samples_500" for table in question_tables]
+)
+
+# SQLite indexes created after each table is loaded
+export_indexes = {
+    'steam_reviews_sample_500': [('app_id',), ('"author.steamid"',)],
+    **serving.SERVING_INDEXES,
+}
+
+export_views = {view: serving.top_view_query(view) for view in serving.TOP_VIEWS}
+
+
+# Memory-mapped column store for the dashboard's hot path (see column_store.py): per-app totals in the order of
+# question1_1, and per-(app, quarter) series summed from the daily cube
+COLUMN_STORE_DIR = column_store.DEFAULT_DIR
+
+column_datasets = {
+    column_store.APP_TOTALS: f"""
+        SELECT
+            app_id,
+            app_name,
+            review_count AS total_reviews,
+            positive_reviews,
+            ROUND(positive_reviews * 100.0 / review_count, 2) AS positive_percentage,
+            playtime_forever_sum / 60.0 AS total_playtime
+        FROM {ROLLUP_TABLE}
+        WHERE grouping_set = 'app'
+        ORDER BY total_reviews DESC, app_id
+    """,
+    column_store.QUARTER_SERIES: f"""
+        SELECT
+            app_id,
+            CAST(date_trunc('quarter', day) AS DATE) AS quarter,
+            SUM(review_count)::BIGINT AS review_count,
+            SUM(positive_reviews)::BIGINT AS positive_reviews,
+            SUM(playtime_forever_sum)::BIGINT AS playtime_forever_sum
+        FROM {DAILY_TABLE}
+        GROUP BY ALL
+        ORDER BY app_id, quarter
+    """,
+}
+
+
+def export_columns(conn, datasets):
+    if datasets:
+        print("""======================================= Column Store ==============================================""")
+        column_store.export_columns(conn, datasets, COLUMN_STORE_DIR)
+
+
+def export_to_sqlite(conn, sqlite_path=SQLITE_PATH, tables=None):
+    # Arrow batches are streamed out of DuckDB and bulk-inserted into SQLite in a single transaction. Tables
+    # not in `tables` are left as they are in the SQLite file.
+    tables = export_tables if tables is None else tables
+    views = {view: query for view, query in export_views.items() if serving.TOP_VIEWS[view][0] in tables}
+    return sqlite_export.export_tables(conn, tables, sqlite_path, export_indexes, views)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Steam reviews question tables and export them to SQLite")
+    parser.add_argument('--stages', nargs='+', choices=STAGES,
+                        help="stages to run, in pipeline order (default: build sample export, or ingest sample "
+                             "export with --ingest)")
+    parser.add_argument('--only', nargs='+', metavar='TABLE',
+                        help="only build, sample and export these tables, e.g. question4 or 'question1_*'")
+    parser.add_argument('--ingest', nargs='+', metavar='CSV',
+                        help="append new review batches and refresh the question tables incrementally")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print the selected builds and their SQL in order without running anything")
+    parser.add_argument('--explain', action='store_true',
+                        help="like --dry-run, but print DuckDB's plan of each statement")
+    parser.add_argument('--quiet', action='store_true', help="don't print the question and sample rows")
+    parser.add_argument('--max-rows', type=int, metavar='N', help="print at most N rows of each table")
+    parser.add_argument('--prerender', action='store_true',
+                        help="render the dashboard's default charts after exporting")
+    parser.add_argument('--graph', action='store_true',
+                        help="build the review graph and export similar-games tables to SQLite")
+    parser.add_argument('--approx-distinct', action='store_true',
+                        help="count distinct authors with mergeable HyperLogLog sketches (~0.8%% standard error)")
+    parser.add_argument('--run-profile', default='auto', choices=['auto', *run_profiles.PROFILES],
+                        help="DuckDB memory, threads and spill settings; auto picks one from available memory")
+    parser.add_argument('--workers', type=int, help="question builds to run concurrently (default: from the profile)")
+    parser.add_argument('--threads', type=int, help="DuckDB threads shared by all builds")
+    parser.add_argument('--memory-limit', help="DuckDB memory_limit shared by all builds, e.g. 8GB")
+    parser.add_argument('--temp-directory', help="where DuckDB spills when memory_limit is reached")
+    parser.add_argument('--sample-seed', type=int, default=sampling.SEED,
+                        help="seed of the sample tables; the same seed draws the same rows")
+    parser.add_argument('--sample-size', action='append', default=[], metavar='[TABLE=]ROWS',
+                        help="rows per sample table, for every table or e.g. question4_samples_500=1000")
+    parser.add_argument('--profile', action='store_true',
+                        help="record per-statement wall time, rows, memory and spill to the query_metrics table")
+    parser.add_argument('--profile-json', metavar='PATH', help="also write the metrics and query profiles as JSON")
+    parser.add_argument('--trace', metavar='PATH', help="also write a Chrome/Perfetto trace of the statements")
+    args = parser.parse_args()
+    args.profile = args.profile or bool(args.profile_json or args.trace)
+    stages = args.stages or (['ingest', 'sample', 'export'] if args.ingest else ['build', 'sample', 'export'])
+    if ('ingest' in stages) != bool(args.ingest):
+        parser.error("the ingest stage and --ingest CSV go together")
+
+    sample_sizes = {}
+    for option in args.sample_size:
+        table, _, rows = option.rpartition('=')
+        if table:
+            sample_sizes[table] = int(rows)
+        else:
+            sample_sizes.update({name: int(rows) for name in export_tables if name.endswith('_500')})
+
+    tasks = select_tasks(pipeline_tasks(args.approx_distinct, sample_sizes, args.sample_seed), stages, args.only)
+    tables_to_export = [table for table in export_tables if is_selected(table, args.only)] \
+        if 'export' in stages else []
+    columns_to_export = {name: query for name, query in column_datasets.items() if is_selected(name, args.only)} \
+        if 'export' in stages else {}
+    if args.only and not tasks and not tables_to_export and not columns_to_export:
+        parser.error(f"--only {' '.join(args.only)} matches none of the pipeline's tables")
+
+    if args.dry_run or args.explain:
+        print("""======================================= Dry Run ===================================================""")
+        for csv_path in args.ingest or []:
+            print(f"Would ingest new reviews from {csv_path}")
+        plan = profiling.PlanConnection(duckdb.connect(DUCKDB_PATH) if args.explain else None)
+        scheduler.plan_dag(plan, tasks)
+        if tables_to_export:
+            print(f"Would export to {SQLITE_PATH}: {', '.join(tables_to_export)}")
+        if columns_to_export:
+            print(f"Would write to {COLUMN_STORE_DIR}: {', '.join(columns_to_export)}")
+        if plan.conn is not None:
+            plan.conn.close()
+        return
+
+    # ========================================== DUCKDB SETUP =============================================
+
+    #  Create or connect to the DuckDB database file
+    engine = duckdb.connect(DUCKDB_PATH)
+    conn = profiling.ProfiledConnection(engine) if args.profile else engine
+
+    # Import the CSV into a new table in the database, excluding the 'review' column
+    # conn.execute("""
+    #     CREATE TABLE steam_reviews AS
+    #     SELECT app_id, app_name, review_id, language, timestamp_created, timestamp_updated,
+    #            recommended, votes_helpful, votes_funny, weighted_vote_score, comment_count,
+    #            steam_purchase, received_for_free, written_during_early_access, "author.steamid",
+    #            "author.num_games_owned", "author.num_reviews", "author.playtime_forever",
+    #            "author.playtime_last_two_weeks", "author.playtime_at_review", "author.last_played"
+    #     FROM read_csv_auto('steam_reviews.csv', max_line_size=100000000)
+    # """)
+    # or stream it into partitioned Parquet with bounded memory: python ingest.py --register steam_reviews
+
+    settings = configure_engine(conn, args.run_profile, threads=args.threads, memory_limit=args.memory_limit,
+                                temp_directory=args.temp_directory, workers=args.workers)
+    monitor = run_profiles.SpillMonitor(engine).start()
+
+    if 'ingest' in stages:
+        print("""======================================= Incremental Ingest ========================================""")
+        # ingest_batch refreshes the rollup, question and per-author tables itself
+        for csv_path in args.ingest:
+            try:
+                ingest_batch(conn, csv_path)
+            except ValueError as error:
+                parser.error(str(error))
+
+    if tasks:
+        print("""======================================= Build DAG =================================================""")
+        scheduler.run_dag(conn, tasks, settings['workers'])
+
+    if not args.quiet:
+        built_questions = [(table, order_by) for table, _, order_by in QUESTIONS if table in tasks]
+        if built_questions:
+            print("""======================================= Question Tables ===========================================""")
+        for table, order_by in built_questions:
+            print_question(conn, table, order_by, args.max_rows)
+
+        for table in question_tables:
+            if f"{table}_samples_500" in tasks:
+                print_sample(conn, table, args.max_rows)
+
+    if tables_to_export or args.graph:
+        # Everything is written to a new version of the SQLite file, which replaces the one the dashboards
+        # read in a single atomic rename at the end (see sqlite_export.new_version)
+        with sqlite_export.new_version(SQLITE_PATH) as sqlite_path:
+            if tables_to_export:
+                print("""======================================= Exporting to SQLite =======================================""")
+                export_to_sqlite(conn, sqlite_path, tables_to_export)
+
+            if args.graph:
+                print("""======================================= Graph Analytics ===========================================""")
+                # Imported here so plain pipeline runs don't need numpy/scipy
+                import graph_analytics
+                import graph_builder
+                graph = graph_builder.load_graph(conn, 'steam_reviews')
+                graph.save(graph_builder.GRAPH_PATH)
+                graph_analytics.export_analytics(graph, sqlite_path)
+
+            # Written before the rename, so no SQLite version is served next to the column store of an older run
+            export_columns(conn, columns_to_export)
+    else:
+        export_columns(conn, columns_to_export)
+
+    print("""======================================= Memory and Spill ==========================================""")
+    monitor.stop()
+    monitor.report(settings['name'])
+
+    if args.profile:
+        print("""======================================= Query Profile =============================================""")
+        conn.save(args.profile_json, args.trace)
+        conn.summary()
+    conn.close()
+
+    if args.prerender:
+        # Imported here so plain pipeline runs don't need matplotlib
+        import charts
+        charts.prerender(SQLITE_PATH, column_dir=COLUMN_STORE_DIR)
+
+    print("""======================================= Export Complete =======================================""")
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import graph_builder
+import sqlite_export
+
+TOP_K = 20
+PAGERANK_ALPHA = 0.85
+PAGERANK_ITERATIONS = 30
+SEED_BATCH = 256
+
+# table -> ranking column, all keyed on (app_id, rank)
+ANALYTICS_TABLES = {
+    'game_similarity': 'jaccard',
+    'game_also_reviewed': 'shared_reviewers',
+    'game_pagerank': 'score',
+}
+
+
+def reviewer_matrix(graph):
+    # users x games, 1 where the user reviewed the game
+    indptr, games, _ = graph.project('reviews')
+    return sp.csr_matrix((np.ones(len(games), dtype=np.float32), games, indptr),
+                         shape=(graph.num_users, graph.num_games))
+
+
+def top_k_per_row(matrix, k):
+    # (row, position in matrix.data, rank) of the k largest entries in each row of a CSR matrix, skipping
+    # the diagonal. Matrices sharing the same sparsity structure can be read at the same positions.
+    rows, positions, ranks = [], [], []
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        candidates = np.arange(start, end)[matrix.indices[start:end] != row]
+        best = candidates[np.argsort(-matrix.data[candidates], kind='stable')[:k]]
+        rows.append(np.full(len(best), row))
+        positions.append(best)
+        ranks.append(np.arange(1, len(best) + 1))
+    if not rows:
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0, int)
+    return np.concatenate(rows), np.concatenate(positions), np.concatenate(ranks)
+
+
+def game_pairs(graph, rows, columns, ranks, other):
+    return pd.DataFrame({
+        'app_id': graph.game_ids[rows],
+        'app_name': graph.game_names[rows],
+        f'{other}_app_id': graph.game_ids[columns],
+        f'{other}_app_name': graph.game_names[columns],
+        'rank': ranks,
+    })
+
+
+# ========================================== CO-REVIEW SIMILARITY ==========================================
+# Shared reviewers of every game pair come from one sparse product, A^T A. The diagonal holds each game's
+# reviewer count, so Jaccard and cosine are computed over the nonzeros without touching empty pairs.
+
+def co_review(graph, k=TOP_K):
+    reviewers = reviewer_matrix(graph)
+    shared = (reviewers.T @ reviewers).tocsr()
+    shared.sort_indices()
+    degree = shared.diagonal()
+
+    rows = np.repeat(np.arange(graph.num_games), np.diff(shared.indptr))
+    columns = shared.indices
+    counts = shared.data
+    jaccard = counts / (degree[rows] + degree[columns] - counts)
+    cosine = counts / np.sqrt(degree[rows] * degree[columns])
+
+    jaccard_matrix = sp.csr_matrix((jaccard, columns, shared.indptr), shape=shared.shape)
+    r, position, rank = top_k_per_row(jaccard_matrix, k)
+    similarity = game_pairs(graph, r, columns[position], rank, 'similar')
+    similarity['shared_reviewers'] = counts[position].astype(np.int64)
+    similarity['jaccard'] = jaccard[position]
+    similarity['cosine'] = cosine[position]
+
+    # "Users who reviewed X also reviewed Y": ranked by shared reviewers, with the share of X's reviewers
+    r, position, rank = top_k_per_row(shared, k)
+    also_reviewed = game_pairs(graph, r, columns[position], rank, 'also')
+    also_reviewed['shared_reviewers'] = counts[position].astype(np.int64)
+    also_reviewed['share'] = counts[position] / degree[r]
+    return similarity, also_reviewed
+
+
+# ========================================== PERSONALIZED PAGERANK ==========================================
+# Random walk game -> reviewer -> game with restarts at the seed game. The two-step walk collapses into one
+# sparse games x games transition matrix, and seeds are iterated together as a dense block of rows.
+
+def game_transitions(graph):
+    reviewers = reviewer_matrix(graph)
+    game_degree = np.asarray(reviewers.sum(axis=0)).ravel()
+    user_degree = np.asarray(reviewers.sum(axis=1)).ravel()
+    to_users = sp.diags(1 / np.maximum(game_degree, 1)) @ reviewers.T
+    to_games = sp.diags(1 / np.maximum(user_degree, 1)) @ reviewers
+    return (to_users @ to_games).tocsr()
+
+
+def personalized_pagerank(transitions, seeds, alpha=PAGERANK_ALPHA, iterations=PAGERANK_ITERATIONS):
+    # One row of scores per seed game
+    restart = np.zeros((len(seeds), transitions.shape[0]))
+    restart[np.arange(len(seeds)), seeds] = 1 - alpha
+    scores = restart.copy()
+    for _ in range(iterations):
+        scores = alpha * np.asarray(transitions.T @ scores.T).T + restart
+    return scores
+
+
+def pagerank(graph, k=TOP_K, alpha=PAGERANK_ALPHA, iterations=PAGERANK_ITERATIONS, seed_batch=SEED_BATCH):
+    transitions = game_transitions(graph)
+    frames = []
+    for start in range(0, graph.num_games, seed_batch):
+        seeds = np.arange(start, min(start + seed_batch, graph.num_games))
+        scores = personalized_pagerank(transitions, seeds, alpha, iterations)
+        scores[np.arange(len(seeds)), seeds] = 0
+        scores = sp.csr_matrix(scores)
+        r, position, rank = top_k_per_row(scores, k)
+        frame = game_pairs(graph, seeds[r], scores.indices[position], rank, 'related')
+        frame['score'] = scores.data[position]
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else game_pairs(graph, [], [], [], 'related')
+
+
+# ========================================== PRECOMPUTED TABLES ==========================================
+
+def analytics_tables(graph, k=TOP_K):
+    similarity, also_reviewed = co_review(graph, k)
+    return {
+        'game_similarity': similarity,
+        'game_also_reviewed': also_reviewed,
+        'game_pagerank': pagerank(graph, k),
+    }
+
+
+def export_analytics(graph, sqlite_path, k=TOP_K):
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    try:
+        for table, frame in analytics_tables(graph, k).items():
+            frame.to_sql(table, sqlite_conn, if_exists='replace', index=False)
+            sqlite_conn.execute(f"CREATE INDEX idx_{table}_app_id_rank ON {table} (app_id, rank)")
+            print(f"Exported {table} to SQLite ({len(frame)} rows)")
+        sqlite_conn.commit()
+    finally:
+        sqlite_conn.close()
+
+
+def main():
+    from db_queries import SQLITE_PATH
+
+    parser = argparse.ArgumentParser(description="Precompute similar-games tables from the review graph")
+    parser.add_argument('--graph', default=graph_builder.GRAPH_PATH, help="graph saved by graph_builder.py")
+    parser.add_argument('--sqlite', default=SQLITE_PATH)
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    args = parser.parse_args()
+
+    graph = graph_builder.BipartiteGraph.load(args.graph)
+    # Written to a new version of the database, swapped in with the rest of its tables once complete
+    with sqlite_export.new_version(args.sqlite) as sqlite_path:
+        export_analytics(graph, sqlite_path, args.top_k)
+
+
+if __name__ == '__main__':
+    main()
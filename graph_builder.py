@@ -0,0 +1,212 @@
+import argparse
+
+import numpy as np
+
+GRAPH_PATH = 'steam_graph.npz'
+
+# Bytes kept per review: user and game index (int32), review_id (int64), recommended (bool),
+# votes_helpful (uint32), playtime (float32), plus the game-side CSR permutation (int32)
+BYTES_PER_REVIEW = 4 + 4 + 8 + 1 + 4 + 4 + 4
+BYTES_PER_USER = 8 + 8 + 8      # steamid, CSR offset, projected CSR offset
+BYTES_PER_GAME = 8 + 8 + 64     # app_id, CSR offset, name
+
+PROJECTION_WEIGHTS = ('reviews', 'votes_helpful', 'playtime')
+
+
+def csr_offsets(sorted_index, size):
+    counts = np.bincount(sorted_index, minlength=size)
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+# ========================================== BIPARTITE GRAPH ==========================================
+
+class BipartiteGraph:
+    # User–review–game graph held as flat arrays. Users and games get dense integer ids (their position
+    # in user_ids / game_ids), every review is an edge between one user and one game, and each side has a
+    # CSR index: reviews are stored sorted by user, so the reviews of user u are positions
+    # user_indptr[u]:user_indptr[u + 1], and the reviews of game g are game_reviews[game_indptr[g]:game_indptr[g + 1]].
+
+    def __init__(self, user_ids, game_ids, game_names, review_ids, review_user, review_game,
+                 recommended, votes_helpful, playtime):
+        self.user_ids = user_ids
+        self.game_ids = game_ids
+        self.game_names = game_names
+        self.review_ids = review_ids
+        self.review_user = review_user
+        self.review_game = review_game
+        self.recommended = recommended
+        self.votes_helpful = votes_helpful
+        self.playtime = playtime
+
+        # Reviews are loaded sorted by user, so the user side needs no permutation
+        self.user_indptr = csr_offsets(review_user, len(user_ids))
+        self.game_reviews = np.argsort(review_game, kind='stable').astype(np.int32)
+        self.game_indptr = csr_offsets(review_game, len(game_ids))
+
+    @property
+    def num_users(self):
+        return len(self.user_ids)
+
+    @property
+    def num_games(self):
+        return len(self.game_ids)
+
+    @property
+    def num_reviews(self):
+        return len(self.review_ids)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in vars(self).values() if isinstance(array, np.ndarray))
+
+    def user_review_slice(self, user):
+        return slice(self.user_indptr[user], self.user_indptr[user + 1])
+
+    def game_review_indices(self, game):
+        return self.game_reviews[self.game_indptr[game]:self.game_indptr[game + 1]]
+
+    def user_games(self, user):
+        return self.review_game[self.user_review_slice(user)]
+
+    def game_users(self, game):
+        return self.review_user[self.game_review_indices(game)]
+
+    def project(self, weight='reviews'):
+        # User–game graph with one weighted edge per (user, game) pair, as CSR arrays over users.
+        # Reviews are sorted by user, then game, so duplicate pairs are adjacent and collapse with
+        # one reduceat instead of a sort.
+        if weight not in PROJECTION_WEIGHTS:
+            raise ValueError(f"weight must be one of {PROJECTION_WEIGHTS}")
+        if self.num_reviews == 0:
+            return np.zeros(self.num_users + 1, dtype=np.int64), np.zeros(0, np.int32), np.zeros(0, np.float32)
+
+        starts = np.flatnonzero(np.concatenate((
+            [True],
+            (self.review_user[1:] != self.review_user[:-1]) | (self.review_game[1:] != self.review_game[:-1]),
+        )))
+        values = {
+            'reviews': np.ones(self.num_reviews, dtype=np.float32),
+            'votes_helpful': self.votes_helpful.astype(np.float32),
+            'playtime': self.playtime,
+        }[weight]
+        weights = np.add.reduceat(values, starts).astype(np.float32)
+        return csr_offsets(self.review_user[starts], self.num_users), self.review_game[starts], weights
+
+    def save(self, path=GRAPH_PATH):
+        np.savez(
+            path,
+            user_ids=self.user_ids, game_ids=self.game_ids, game_names=self.game_names,
+            review_ids=self.review_ids, review_user=self.review_user, review_game=self.review_game,
+            recommended=self.recommended, votes_helpful=self.votes_helpful, playtime=self.playtime,
+        )
+
+    @classmethod
+    def load(cls, path=GRAPH_PATH):
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+
+# ========================================== BATCHED LOADER ==========================================
+# Dense ids are assigned by the database with DENSE_RANK, so Python never builds a steamid -> id dict.
+# The queries run unchanged on DuckDB (steam_reviews) and on SQLite (steam_reviews_sample_500).
+
+def fetch_column_batches(cursor, batch_rows):
+    # Each batch as one NumPy array per column. DuckDB hands over Arrow record batches, so no row becomes a
+    # Python tuple; SQLite only has rows, which is fine for the small sample table it serves.
+    if hasattr(cursor, 'fetch_record_batch'):
+        for batch in cursor.fetch_record_batch(batch_rows):
+            yield [column.to_numpy(zero_copy_only=False) for column in batch.columns]
+    else:
+        while rows := cursor.fetchmany(batch_rows):
+            yield [np.array(column) for column in zip(*rows)]
+
+
+def load_graph(conn, table='steam_reviews', batch_rows=100_000, memory_budget_mb=1024, limit=None):
+    source = f"(SELECT * FROM {table} LIMIT {int(limit)})" if limit else table
+    reviews = f"""
+        SELECT * FROM {source} AS reviews
+        WHERE "author.steamid" IS NOT NULL AND app_id IS NOT NULL
+    """
+
+    num_reviews, num_users, num_games = conn.execute(f"""
+        SELECT COUNT(*), COUNT(DISTINCT "author.steamid"), COUNT(DISTINCT app_id) FROM ({reviews}) AS r
+    """).fetchone()
+    budget = memory_budget_mb << 20
+    needed = num_reviews * BYTES_PER_REVIEW + num_users * BYTES_PER_USER + num_games * BYTES_PER_GAME
+    if needed > budget:
+        raise MemoryError(
+            f"{num_reviews} reviews need about {needed >> 20} MB, over the {memory_budget_mb} MB budget; "
+            f"raise memory_budget_mb or pass a limit"
+        )
+
+    # Arrays are allocated once at their final size and filled batch by batch
+    user_ids = np.empty(num_users, dtype=np.uint64)
+    cursor = conn.execute(f'SELECT DISTINCT "author.steamid" FROM ({reviews}) AS r ORDER BY 1')
+    position = 0
+    for (steamids,) in fetch_column_batches(cursor, batch_rows):
+        user_ids[position:position + len(steamids)] = steamids
+        position += len(steamids)
+
+    games = conn.execute(f"""
+        SELECT app_id, MIN(app_name) FROM ({reviews}) AS r GROUP BY app_id ORDER BY app_id
+    """).fetchall()
+    game_ids = np.array([game[0] for game in games], dtype=np.int64)
+    game_names = np.array([game[1] or '' for game in games], dtype=str)
+
+    review_ids = np.empty(num_reviews, dtype=np.int64)
+    review_user = np.empty(num_reviews, dtype=np.int32)
+    review_game = np.empty(num_reviews, dtype=np.int32)
+    recommended = np.empty(num_reviews, dtype=bool)
+    votes_helpful = np.empty(num_reviews, dtype=np.uint32)
+    playtime = np.empty(num_reviews, dtype=np.float32)
+
+    cursor = conn.execute(f"""
+        SELECT
+            DENSE_RANK() OVER (ORDER BY "author.steamid") - 1 AS user_index,
+            DENSE_RANK() OVER (ORDER BY app_id) - 1 AS game_index,
+            review_id,
+            CASE WHEN recommended THEN 1 ELSE 0 END,
+            COALESCE(votes_helpful, 0),
+            COALESCE("author.playtime_forever", 0)
+        FROM ({reviews}) AS r
+        ORDER BY user_index, game_index
+    """)
+    position = 0
+    for user, game, review, recommend, votes, played in fetch_column_batches(cursor, batch_rows):
+        end = position + len(user)
+        review_user[position:end] = user
+        review_game[position:end] = game
+        review_ids[position:end] = review
+        recommended[position:end] = recommend
+        votes_helpful[position:end] = votes
+        playtime[position:end] = played
+        position = end
+
+    return BipartiteGraph(user_ids, game_ids, game_names, review_ids, review_user, review_game,
+                          recommended, votes_helpful, playtime)
+
+
+def main():
+    import duckdb
+    from db_queries import DUCKDB_PATH
+
+    parser = argparse.ArgumentParser(description="Build the user–review–game graph from steam_reviews")
+    parser.add_argument('--duckdb', default=DUCKDB_PATH)
+    parser.add_argument('--out', default=GRAPH_PATH)
+    parser.add_argument('--batch-rows', type=int, default=100_000)
+    parser.add_argument('--memory-budget-mb', type=int, default=1024)
+    parser.add_argument('--limit', type=int, help="only use the first N reviews")
+    args = parser.parse_args()
+
+    conn = duckdb.connect(args.duckdb, read_only=True)
+    graph = load_graph(conn, 'steam_reviews', args.batch_rows, args.memory_budget_mb, args.limit)
+    conn.close()
+    graph.save(args.out)
+    print(f"Saved {graph.num_users} users, {graph.num_games} games and {graph.num_reviews} reviews "
+          f"({graph.nbytes >> 20} MB) to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
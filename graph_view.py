@@ -0,0 +1,186 @@
+import math
+
+import numpy as np
+from pyvis.network import Network
+
+# Above this many nodes physics is switched off and nodes get a precomputed radial layout
+PHYSICS_NODE_LIMIT = 300
+
+EDGE_WEIGHTS = ('votes_helpful', 'playtime')
+
+NODE_COLORS = {
+    'user': '#1f77b4',
+    'game': '#ff7f0e',
+    'review': '#2ca02c',
+    'cluster': '#7f7f7f',
+}
+RECOMMENDED_COLORS = {True: '#2ca02c', False: '#d62728'}
+
+
+def top_k(values, k):
+    # Indices of the k largest values, largest first, without sorting the whole array
+    if k >= len(values):
+        return np.argsort(values, kind='stable')[::-1]
+    best = np.argpartition(values, -k)[-k:]
+    return best[np.argsort(values[best], kind='stable')[::-1]]
+
+
+def top_games(graph, n):
+    return top_k(graph.game_indptr[1:] - graph.game_indptr[:-1], n)
+
+
+# ========================================== LEVEL OF DETAIL ==========================================
+# Each shown game keeps its top-k reviews by votes_helpful or playtime; the remaining reviewers collapse
+# into one cluster node per game. Expanded games keep up to expand_limit reviews, expanded users pull in
+# every game they reviewed. Nodes remember the game they were reached through (anchor) for the layout.
+
+class GraphView:
+
+    def __init__(self, graph, weight='votes_helpful', review_nodes=False):
+        if weight not in EDGE_WEIGHTS:
+            raise ValueError(f"weight must be one of {EDGE_WEIGHTS}")
+        self.graph = graph
+        self.weight = weight
+        self.review_nodes = review_nodes
+        self.nodes = {}
+        self.edges = []
+
+    def _weights(self, reviews):
+        return getattr(self.graph, self.weight)[reviews]
+
+    def add_game(self, game):
+        node = f'game_{game}'
+        if node not in self.nodes:
+            reviews = self.graph.game_indptr[game + 1] - self.graph.game_indptr[game]
+            self.nodes[node] = dict(
+                type='game', label=str(self.graph.game_names[game]), anchor=node,
+                title=f"app_id {self.graph.game_ids[game]}: {reviews} reviews", size=10 + 3 * math.log1p(reviews),
+            )
+        return node
+
+    def add_user(self, user, anchor):
+        node = f'user_{user}'
+        if node not in self.nodes:
+            self.nodes[node] = dict(type='user', label=f'User_{self.graph.user_ids[user]}', anchor=anchor, size=8)
+        return node
+
+    def add_review(self, review):
+        user = self.graph.review_user[review]
+        game_node = self.add_game(self.graph.review_game[review])
+        user_node = self.add_user(user, game_node)
+        recommended = bool(self.graph.recommended[review])
+        title = (f"{'Recommended' if recommended else 'Not recommended'}, "
+                 f"{self.graph.votes_helpful[review]} helpful votes, "
+                 f"{self.graph.playtime[review] / 60:.0f} h played")
+
+        if self.review_nodes:
+            review_node = f'review_{review}'
+            self.nodes[review_node] = dict(
+                type='review', label=f'Review_{self.graph.review_ids[review]}', anchor=game_node, title=title, size=6,
+            )
+            self.edges.append((user_node, review_node, dict(label='WRITES')))
+            self.edges.append((review_node, game_node, dict(label='FOR')))
+        else:
+            self.edges.append((user_node, game_node, dict(title=title, color=RECOMMENDED_COLORS[recommended])))
+
+    def add_game_reviews(self, game, k):
+        game_node = self.add_game(game)
+        reviews = self.graph.game_review_indices(game)
+        shown = reviews[top_k(self._weights(reviews), k)]
+        for review in shown:
+            self.add_review(review)
+
+        hidden = len(reviews) - len(shown)
+        if hidden:
+            cluster = f'cluster_{game}'
+            self.nodes[cluster] = dict(
+                type='cluster', label=f'+{hidden} reviewers', anchor=game_node, size=8 + 3 * math.log1p(hidden),
+                title=f"{hidden} more reviewers of {self.graph.game_names[game]}", shape='box',
+            )
+            self.edges.append((cluster, game_node, dict(dashes=True)))
+
+    def add_user_reviews(self, user, k):
+        reviews = np.arange(self.graph.user_indptr[user], self.graph.user_indptr[user + 1])
+        for review in reviews[top_k(self._weights(reviews), k)]:
+            self.add_review(review)
+
+
+def level_of_detail(graph, games, k=10, weight='votes_helpful', expanded_games=(), expanded_users=(),
+                    expand_limit=200, review_nodes=False):
+    view = GraphView(graph, weight, review_nodes)
+    for game in games:
+        view.add_game_reviews(game, expand_limit if game in expanded_games else k)
+    for user in expanded_users:
+        view.add_user_reviews(user, expand_limit)
+    return view
+
+
+# ========================================== RENDERING ==========================================
+
+def radial_layout(nodes, spacing=60):
+    # Games on a large circle, every other node on a ring around the game it was reached through
+    games = [node for node, data in nodes.items() if data['type'] == 'game' and data['anchor'] == node]
+    radius = spacing * max(len(games), 1) / math.pi
+    positions = {}
+    for i, game in enumerate(games):
+        angle = 2 * math.pi * i / max(len(games), 1)
+        positions[game] = (radius * math.cos(angle), radius * math.sin(angle))
+
+    satellites = {}
+    for node, data in nodes.items():
+        if node not in positions:
+            satellites.setdefault(data['anchor'], []).append(node)
+    for anchor, members in satellites.items():
+        x, y = positions.get(anchor, (0.0, 0.0))
+        ring = spacing * (1 + len(members) / 24)
+        for i, node in enumerate(members):
+            angle = 2 * math.pi * i / len(members)
+            positions[node] = (x + ring * math.cos(angle), y + ring * math.sin(angle))
+    return positions
+
+
+def render(view, path='graph.html', physics_limit=PHYSICS_NODE_LIMIT, height="600px"):
+    physics = len(view.nodes) <= physics_limit
+    directed = view.review_nodes
+    net = Network(notebook=True, directed=directed, height=height, width="100%")
+    positions = {} if physics else radial_layout(view.nodes)
+
+    for node, data in view.nodes.items():
+        attributes = {key: value for key, value in data.items() if key not in ('type', 'anchor')}
+        if node in positions:
+            attributes['x'], attributes['y'] = positions[node]
+            attributes['physics'] = False
+        net.add_node(node, color=NODE_COLORS[data['type']], **attributes)
+
+    for source, target, data in view.edges:
+        net.add_edge(source, target, **data)
+
+    net.set_options(f"""
+    {{
+      "physics": {{
+        "enabled": {str(physics).lower()},
+        "stabilization": {{
+          "iterations": 100
+        }}
+      }},
+      "edges": {{
+        "arrows": {{
+          "to": {{
+            "enabled": {str(directed).lower()},
+            "scaleFactor": 1
+          }}
+        }},
+        "smooth": {{
+          "type": "{'dynamic' if physics else 'continuous'}",
+          "enabled": {str(physics).lower()}
+        }}
+      }},
+      "interaction": {{
+        "hideEdgesOnDrag": {str(not physics).lower()},
+        "tooltipDelay": 100
+      }}
+    }}
+    """)
+
+    net.save_graph(path)
+    return path
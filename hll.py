@@ -0,0 +1,35 @@
+# ========================================== HYPERLOGLOG ==========================================
+# Distinct counts as HyperLogLog sketches in plain DuckDB SQL. A value's 64-bit hash picks one of
+# m = 2^PRECISION registers (top bits) and a rank rho = 1 + leading zeros of the remaining bits. A sketch
+# is the MAX rank per register, stored sparsely as (register, rho) rows, so sketches of any groups merge
+# with GROUP BY register / MAX(rho) and never need the raw values again.
+#
+# Error bounds: the relative standard error is 1.04 / sqrt(m), i.e. 0.81% at the default PRECISION = 14
+# (about 1.6% at two standard errors, 2.4% at three). Below 2.5 * m the estimate switches to linear
+# counting over the empty registers, which is close to exact for small groups (a few hundred users).
+# With 64-bit hashes there is no large-range correction to apply.
+
+PRECISION = 14
+
+
+def register_expr(value, precision=PRECISION):
+    return f"(hash({value}) >> {64 - precision})::INTEGER"
+
+
+def rho_expr(value, precision=PRECISION):
+    bits = 64 - precision
+    low = f"(hash({value}) & {(1 << bits) - 1}::UBIGINT)"
+    # floor(log2(x)) from a DOUBLE can round up just below a power of two; the shift check corrects it
+    top_bit = f"FLOOR(LOG2({low}))::INTEGER"
+    top_bit = f"({top_bit} - CASE WHEN (1::UBIGINT << {top_bit}) > {low} THEN 1 ELSE 0 END)"
+    return f"(CASE WHEN {low} = 0 THEN {bits + 1} ELSE {bits} - {top_bit} END)::UTINYINT"
+
+
+def estimate_expr(rho, precision=PRECISION):
+    # Aggregate over the (register, rho) rows of one sketch; NULL ranks count as empty registers. rho is
+    # unsigned, so it is cast before negating it (-rho would wrap around)
+    m = 1 << precision
+    alpha = 0.7213 / (1 + 1.079 / m)
+    empty = f"({m} - COUNT({rho}))"
+    raw = f"({alpha * m * m} / ({empty} + COALESCE(SUM(POW(2.0, -{rho}::INTEGER)), 0)))"
+    return f"ROUND(CASE WHEN {raw} <= {2.5 * m} AND {empty} > 0 THEN {m} * LN({m} / {empty}) ELSE {raw} END)::BIGINT"
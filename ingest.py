@@ -0,0 +1,130 @@
+import argparse
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from db_queries import DUCKDB_PATH, REVIEW_COLUMNS
+
+PARQUET_DIR = 'steam_reviews_parquet'
+
+# ========================================== TYPED REVIEW SCHEMA ==========================================
+# Column types used while parsing the CSV, so nothing is inferred from a huge sniffing sample
+
+REVIEW_SCHEMA = pa.schema([
+    ('app_id', pa.int32()),
+    ('app_name', pa.string()),
+    ('review_id', pa.int64()),
+    ('language', pa.string()),
+    ('timestamp_created', pa.int64()),
+    ('timestamp_updated', pa.int64()),
+    ('recommended', pa.bool_()),
+    ('votes_helpful', pa.int64()),
+    ('votes_funny', pa.int64()),
+    ('weighted_vote_score', pa.float64()),
+    ('comment_count', pa.int64()),
+    ('steam_purchase', pa.bool_()),
+    ('received_for_free', pa.bool_()),
+    ('written_during_early_access', pa.bool_()),
+    ('author.steamid', pa.uint64()),
+    ('author.num_games_owned', pa.int64()),
+    ('author.num_reviews', pa.int64()),
+    ('author.playtime_forever', pa.float64()),
+    ('author.playtime_last_two_weeks', pa.float64()),
+    ('author.playtime_at_review', pa.float64()),
+    ('author.last_played', pa.float64()),
+])
+
+# Hive partitions of the Parquet dataset: steam_reviews_parquet/app_id=578080/quarter=2020-10-01/
+PARTITIONING = ds.partitioning(pa.schema([('app_id', pa.int32()), ('quarter', pa.date32())]), flavor='hive')
+
+PARTITIONED_SCHEMA = REVIEW_SCHEMA.append(pa.field('quarter', pa.date32()))
+
+REVIEW_TEXT_SCHEMA = pa.schema([('review_id', pa.int64()), ('app_id', pa.int32()), ('review', pa.string())])
+
+
+# ========================================== STREAMING CSV READER ==========================================
+
+def stream_review_batches(csv_path, block_size, review_writer=None):
+    # Each block of block_size bytes becomes one record batch, so memory stays bounded no matter how
+    # large the CSV is. The block has to be larger than the longest row (some reviews are huge).
+    columns = list(REVIEW_COLUMNS) + (['review'] if review_writer is not None else [])
+    column_types = {field.name: field.type for field in REVIEW_SCHEMA}
+    column_types['review'] = pa.string()
+    reader = pv.open_csv(
+        csv_path,
+        read_options=pv.ReadOptions(block_size=block_size),
+        parse_options=pv.ParseOptions(newlines_in_values=True),
+        convert_options=pv.ConvertOptions(column_types=column_types, include_columns=columns),
+    )
+
+    for batch in reader:
+        # Review text goes to the sidecar file (if any) and never into the partitioned dataset
+        if review_writer is not None:
+            review_writer.write_batch(batch.select(['review_id', 'app_id', 'review']))
+
+        created = pc.cast(batch.column('timestamp_created'), pa.timestamp('s'))
+        quarter = pc.floor_temporal(created, unit='quarter').cast(pa.date32())
+        yield pa.RecordBatch.from_arrays(
+            [batch.column(name) for name in REVIEW_COLUMNS] + [quarter],
+            schema=PARTITIONED_SCHEMA,
+        )
+
+
+# ========================================== PARQUET WRITER ==========================================
+
+def csv_to_parquet(csv_path, parquet_dir=PARQUET_DIR, review_sidecar=None, block_size=64 << 20,
+                   max_open_files=4096):
+    review_writer = pq.ParquetWriter(review_sidecar, REVIEW_TEXT_SCHEMA) if review_sidecar else None
+    try:
+        ds.write_dataset(
+            stream_review_batches(csv_path, block_size, review_writer),
+            parquet_dir,
+            schema=PARTITIONED_SCHEMA,
+            format='parquet',
+            partitioning=PARTITIONING,
+            existing_data_behavior='delete_matching',
+            max_open_files=max_open_files,
+            max_partitions=1 << 16,
+        )
+    finally:
+        if review_writer is not None:
+            review_writer.close()
+
+
+def register_parquet_reviews(conn, parquet_dir=PARQUET_DIR, view='steam_reviews'):
+    # Filters on app_id or quarter only read the matching partitions
+    columns = ", ".join(f'"{column}"' for column in REVIEW_COLUMNS)
+    conn.execute(f"""
+        CREATE OR REPLACE VIEW {view} AS
+        SELECT {columns}
+        FROM read_parquet('{parquet_dir}/**/*.parquet', hive_partitioning = true,
+                          hive_types = {{'app_id': INTEGER, 'quarter': DATE}})
+    """)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream steam_reviews.csv into a partitioned Parquet dataset")
+    parser.add_argument('csv_path', nargs='?', default='steam_reviews.csv')
+    parser.add_argument('--out', default=PARQUET_DIR, help="output dataset directory")
+    parser.add_argument('--review-sidecar', metavar='PARQUET',
+                        help="keep the review text in this file instead of dropping it")
+    parser.add_argument('--block-size-mb', type=int, default=64, help="CSV bytes parsed per chunk")
+    parser.add_argument('--register', metavar='VIEW',
+                        help=f"create this view over the dataset in {DUCKDB_PATH}")
+    args = parser.parse_args()
+
+    csv_to_parquet(args.csv_path, args.out, args.review_sidecar, args.block_size_mb << 20)
+    print(f"Wrote {args.csv_path} to {args.out}")
+
+    if args.register:
+        conn = duckdb.connect(DUCKDB_PATH)
+        register_parquet_reviews(conn, args.out, args.register)
+        conn.close()
+        print(f"Registered {args.register} over {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import datetime
+import json
+import os
+import re
+import tempfile
+import textwrap
+import threading
+import time
+
+METRICS_TABLE = 'query_metrics'
+
+# Statements are named after the table they write, e.g. "CREATE OR REPLACE TABLE question4 AS ..." -> question4
+TARGET_PATTERN = re.compile(
+    r'^\s*(?:CREATE\s+(?:OR\s+REPLACE\s+)?(?:TEMP\w*\s+)?(?:TABLE|VIEW|TYPE)|INSERT\s+INTO|UPDATE|DELETE\s+FROM'
+    r'|COPY)\s+(?:IF\s+NOT\s+EXISTS\s+)?("[^"]+"|[\w.]+)',
+    re.IGNORECASE,
+)
+# With preserve_insertion_order and several threads, DuckDB writes through the BATCH_* variants
+WRITE_OPERATORS = {
+    'CREATE_TABLE_AS', 'BATCH_CREATE_TABLE_AS', 'INSERT', 'BATCH_INSERT', 'UPDATE', 'DELETE',
+    'COPY_TO_FILE', 'BATCH_COPY_TO_FILE', 'FIXED_BATCH_COPY_TO_FILE',
+}
+
+
+def statement_name(query):
+    match = TARGET_PATTERN.match(query)
+    if match:
+        return match.group(1).strip('"')
+    return query.split(None, 1)[0].upper() if query.strip() else 'empty'
+
+
+def rows_produced(profile):
+    # Rows written by CREATE TABLE AS / INSERT / COPY, or rows returned by a query
+    children = profile.get('children') or []
+    if children and children[0].get('operator_type') in WRITE_OPERATORS and children[0].get('children'):
+        return children[0]['children'][0].get('operator_cardinality')
+    return profile.get('rows_returned')
+
+
+# ========================================== PROFILED CONNECTION ==========================================
+# Drop-in for a DuckDB connection: every execute() runs with DuckDB's JSON profiler on, which records the
+# same operator tree as EXPLAIN ANALYZE. Each statement becomes one metrics row named after the table it
+# writes. Cursors share the run's metrics, so concurrent builds on cursors are recorded too. Everything else
+# is passed through to the wrapped connection.
+# peak_memory_bytes is DuckDB's system_peak_buffer_memory, which is measured for the whole database rather
+# than for the statement (operators don't report their own). With concurrent builds it also counts what the
+# other builds held at the time, so build with --workers 1 to keep the steps apart.
+
+class ProfiledConnection:
+
+    def __init__(self, conn, run_id=None, _metrics=None, _lock=None):
+        self.conn = conn
+        self.run_id = run_id or datetime.datetime.now().isoformat(timespec='seconds')
+        self.metrics = [] if _metrics is None else _metrics
+        self._lock = _lock or threading.Lock()
+        fd, self._profile_path = tempfile.mkstemp(prefix='duckdb_profile_', suffix='.json')
+        os.close(fd)
+        conn.execute("PRAGMA enable_profiling = 'json'")
+        conn.execute(f"PRAGMA profiling_output = '{self._profile_path}'")
+        try:
+            conn.execute("SET profiling_coverage = 'ALL'")
+        except Exception:
+            # Older DuckDB only profiles SELECT-like statements; the rest still get wall times
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def _read_profile(self):
+        try:
+            with open(self._profile_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def execute(self, query, parameters=None):
+        with open(self._profile_path, 'w'):
+            pass
+        started_at = time.time()
+        started = time.perf_counter()
+        result = self.conn.execute(query) if parameters is None else self.conn.execute(query, parameters)
+        wall = time.perf_counter() - started
+        profile = self._read_profile() or {}
+
+        with self._lock:
+            self.metrics.append({
+                'run_id': self.run_id,
+                'step': statement_name(query),
+                'started_at': started_at,
+                'wall_s': wall,
+                'latency_s': profile.get('latency'),
+                'cpu_s': profile.get('cpu_time'),
+                'rows': rows_produced(profile),
+                'peak_memory_bytes': profile.get('system_peak_buffer_memory'),
+                'spill_bytes': profile.get('system_peak_temp_dir_size'),
+                'query': query.strip(),
+                'profile': profile,
+                'thread': threading.get_ident(),
+            })
+        return result
+
+    def cursor(self):
+        return ProfiledConnection(self.conn.cursor(), self.run_id, self.metrics, self._lock)
+
+    def close(self):
+        if os.path.exists(self._profile_path):
+            os.remove(self._profile_path)
+        self.conn.close()
+
+    # ========================================== OUTPUT ==========================================
+
+    def save(self, json_path=None, trace_path=None):
+        # Metrics rows go to query_metrics in the database itself; the JSON file adds full profiles and the
+        # trace file can be opened in chrome://tracing or Perfetto
+        self.conn.execute("PRAGMA disable_profiling")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (
+                run_id VARCHAR,
+                step VARCHAR,
+                started_at TIMESTAMP,
+                wall_s DOUBLE,
+                latency_s DOUBLE,
+                cpu_s DOUBLE,
+                rows BIGINT,
+                peak_memory_bytes BIGINT,
+                spill_bytes BIGINT,
+                query VARCHAR,
+                profile JSON
+            )
+        """)
+        self.conn.executemany(
+            f"INSERT INTO {METRICS_TABLE} VALUES (?, ?, to_timestamp(?), ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (m['run_id'], m['step'], m['started_at'], m['wall_s'], m['latency_s'], m['cpu_s'], m['rows'],
+                 m['peak_memory_bytes'], m['spill_bytes'], m['query'], json.dumps(m['profile']))
+                for m in self.metrics
+            ],
+        )
+
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(self.metrics, f, indent=2, default=str)
+
+        if trace_path:
+            threads = {thread: tid for tid, thread in enumerate(dict.fromkeys(m['thread'] for m in self.metrics))}
+            events = [
+                {
+                    'name': m['step'], 'cat': 'duckdb', 'ph': 'X', 'pid': os.getpid(), 'tid': threads[m['thread']],
+                    'ts': m['started_at'] * 1e6, 'dur': m['wall_s'] * 1e6,
+                    'args': {'rows': m['rows'], 'peak_memory_bytes': m['peak_memory_bytes'],
+                             'spill_bytes': m['spill_bytes']},
+                }
+                for m in self.metrics
+            ]
+            with open(trace_path, 'w') as f:
+                json.dump({'traceEvents': events}, f)
+
+    def summary(self, top=10):
+        print(f"{'step':<32} {'wall s':>9} {'rows':>12} {'peak MB':>9} {'spill MB':>9}")
+        for m in sorted(self.metrics, key=lambda m: m['wall_s'], reverse=True)[:top]:
+            print(f"{m['step']:<32} {m['wall_s']:9.3f} {m['rows'] or 0:>12,} "
+                  f"{(m['peak_memory_bytes'] or 0) / (1 << 20):9.1f} {(m['spill_bytes'] or 0) / (1 << 20):9.1f}")
+
+
+# ========================================== DRY RUN ==========================================
+# Stands in for a DuckDB connection and prints every statement a build would run instead of running it.
+# With `conn`, it prints DuckDB's EXPLAIN plan of each statement instead, which plans the statement without
+# executing it. Statements reading tables that an earlier build of the same run would create can't be
+# planned yet and are printed as SQL.
+
+class PlanConnection:
+
+    def __init__(self, conn=None):
+        self.conn = conn
+        self.statements = []
+
+    def execute(self, query, parameters=None):
+        query = textwrap.dedent(query).strip()
+        self.statements.append(query)
+        print(f"-- {statement_name(query)}")
+        if self.conn is not None:
+            try:
+                plan = self.conn.execute(f"EXPLAIN {query}", parameters).fetchall()
+                print("\n".join(row[1] for row in plan))
+                return self
+            except Exception as error:
+                print(f"-- (no plan: {str(error).splitlines()[0]})")
+        print(f"{query};")
+        return self
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
@@ -0,0 +1,176 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+def file_version(path):
+    # Changes whenever the database file is rewritten or replaced. Exports swap in a new file (a new inode)
+    # with no -wal file, so the main file is all there is to the version.
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# ========================================== CONNECTION POOL ==========================================
+
+class ConnectionPool:
+    # SQLite connections shared by every dashboard session. Connections are opened lazily up to `size`;
+    # reset() retires them so the next checkout reopens the (possibly replaced) database file.
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        return sqlite3.connect(self.path, check_same_thread=False), self._generation
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            if self._idle.empty() and self._opened < self.size:
+                self._opened += 1
+                entry = self._open()
+            else:
+                entry = None
+        if entry is None:
+            entry = self._idle.get()
+
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                if entry[1] != self._generation:
+                    entry[0].close()
+                    entry = self._open()
+            self._idle.put(entry)
+
+    def reset(self):
+        with self._lock:
+            self._generation += 1
+            retired = []
+            while not self._idle.empty():
+                retired.append(self._idle.get_nowait())
+            for conn, _ in retired:
+                conn.close()
+                self._idle.put(self._open())
+
+
+# ========================================== QUERY CACHE ==========================================
+
+class QueryCache:
+    # Memoizes query results as DataFrames, keyed on (query, params). Entries expire after `ttl` seconds,
+    # the least recently used entry is evicted past `max_entries`, and everything is dropped as soon as
+    # the database file changes. With watch(), a background thread reloads the cache when the file changes
+    # instead, and requests keep getting the previous snapshot's results until the reload is done.
+
+    def __init__(self, path, pool_size=4, max_entries=64, ttl=600):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = file_version(path)
+        self._watcher = None
+        self._stop = threading.Event()
+
+    @property
+    def version(self):
+        return self._version
+
+    def check_version(self):
+        version = file_version(self.path)
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+            self.pool.reset()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def refresh(self):
+        # Re-runs the cached queries against the new file on a connection of its own, then swaps the results,
+        # the version and the connection pool in together
+        version = file_version(self.path)
+        if version == self._version:
+            return False
+        with self._lock:
+            keys = list(self._entries)
+
+        fresh = OrderedDict()
+        conn = sqlite3.connect(self.path)
+        try:
+            for query, params in keys:
+                try:
+                    fresh[(query, params)] = (time.monotonic(), pd.read_sql_query(query, conn, params=params))
+                except (sqlite3.Error, pd.errors.DatabaseError):
+                    # e.g. a table the new version doesn't have any more
+                    continue
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._entries = fresh
+            self._version = version
+        self.pool.reset()
+        return True
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except (OSError, sqlite3.Error, pd.errors.DatabaseError):
+                # Retried on the next poll
+                continue
+
+    def watch(self, interval=2.0):
+        # Polls the file version every `interval` seconds on a daemon thread; requests no longer check it
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def read_sql(self, query, params=()):
+        if self._watcher is None:
+            self.check_version()
+        key = (query, tuple(params))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # Callers get their own copy, so adding columns doesn't touch the cached frame
+                return entry[1].copy()
+            self.misses += 1
+            version = self._version
+
+        with self.pool.connection() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+
+        with self._lock:
+            # A result read from the previous snapshot isn't kept once a refresh has swapped in the new one
+            if self._version == version:
+                self._entries[key] = (now, df)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return df.copy()
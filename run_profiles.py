@@ -0,0 +1,172 @@
+import os
+import threading
+
+GB = 1 << 30
+MEMORY_SHARE = 0.7
+
+# ========================================== RUN PROFILES ==========================================
+# DuckDB settings for the full 21M-row pipeline by machine size. memory_limit leaves headroom for Python,
+# the SQLite export and the OS; anything above it spills to temp_directory instead of failing.
+# preserve_insertion_order = false lets the sorts and windows of question2_2, question3_1 and question4
+# stream to disk. workers is how many DAG builds run at once, which share the same memory_limit.
+# A profile is picked when the available memory is at least min_memory, and memory_limit never exceeds
+# MEMORY_SHARE of what is available.
+
+PROFILES = {
+    'laptop': {
+        'min_memory': 0,
+        'memory_limit': 5 * GB,
+        'threads': 4,
+        'temp_directory': 'duckdb_spill',
+        'preserve_insertion_order': False,
+        'workers': 1,
+    },
+    'worker': {
+        'min_memory': 16 * GB,
+        'memory_limit': 12 * GB,
+        'threads': 8,
+        'temp_directory': 'duckdb_spill',
+        'preserve_insertion_order': False,
+        'workers': 2,
+    },
+    'bigbox': {
+        'min_memory': 64 * GB,
+        'memory_limit': 48 * GB,
+        'threads': 32,
+        'temp_directory': 'duckdb_spill',
+        'preserve_insertion_order': False,
+        'workers': 4,
+    },
+}
+
+ENGINE_SETTINGS = ['memory_limit', 'threads', 'temp_directory', 'preserve_insertion_order']
+
+
+def cgroup_memory_limit():
+    # Containers see the host's /proc/meminfo, so their own limit has to come from the cgroup
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def available_memory():
+    # Bytes of memory the pipeline can use: MemAvailable on Linux, else physical memory, capped by the cgroup
+    available = None
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if available is None:
+        try:
+            available = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (ValueError, OSError, AttributeError):
+            pass
+    limit = cgroup_memory_limit()
+    if limit is not None:
+        available = min(available, limit) if available else limit
+    return available
+
+
+def pick_profile(memory=None):
+    memory = available_memory() if memory is None else memory
+    if memory is None:
+        return 'laptop'
+    fitting = [name for name, profile in PROFILES.items() if memory >= profile['min_memory']]
+    return max(fitting, key=lambda name: PROFILES[name]['min_memory'])
+
+
+def resolve_profile(name='auto', **overrides):
+    # Settings of the named (or auto-picked) profile, capped to the machine's cores and available memory,
+    # with any explicitly given setting taking precedence
+    memory = available_memory()
+    name = pick_profile(memory) if name == 'auto' else name
+    settings = dict(PROFILES[name], name=name)
+    settings['threads'] = min(settings['threads'], os.cpu_count() or 1)
+    if memory:
+        settings['memory_limit'] = min(settings['memory_limit'], int(memory * MEMORY_SHARE))
+    settings['memory_limit'] = f"{settings['memory_limit'] >> 20}MB"
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    return settings
+
+
+def apply_settings(conn, settings):
+    for key in ENGINE_SETTINGS:
+        value = settings.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            conn.execute(f"SET {key} = {str(value).lower()}")
+        elif isinstance(value, int):
+            conn.execute(f"SET {key} = {value}")
+        else:
+            conn.execute(f"SET {key} = '{value}'")
+
+
+# ========================================== SPILL MONITOR ==========================================
+# Samples DuckDB's buffer manager on its own cursor while the pipeline runs, recording peak memory and
+# peak temp-directory usage. Pass the unwrapped connection so the samples don't show up in query_metrics.
+
+class SpillMonitor:
+
+    def __init__(self, conn, interval=0.5):
+        self.cursor = conn.cursor()
+        self.interval = interval
+        self.peak_memory = 0
+        self.peak_spill = 0
+        self.spilled_files = 0
+        self.settings = {}
+        self._done = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        memory, spill = self.cursor.execute(
+            "SELECT SUM(memory_usage_bytes), SUM(temporary_storage_bytes) FROM duckdb_memory()"
+        ).fetchone()
+        files = self.cursor.execute("SELECT COUNT(*) FROM duckdb_temporary_files()").fetchone()[0]
+        self.peak_memory = max(self.peak_memory, memory or 0)
+        self.peak_spill = max(self.peak_spill, spill or 0)
+        self.spilled_files = max(self.spilled_files, files)
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                # The connection is being closed underneath us
+                return
+
+    def start(self):
+        # The settings actually in effect, e.g. memory_limit as DuckDB rounded it
+        columns = ", ".join(f"current_setting('{key}')" for key in ENGINE_SETTINGS)
+        self.settings = dict(zip(ENGINE_SETTINGS, self.cursor.execute(f"SELECT {columns}").fetchone()))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+        self.sample()
+        self.cursor.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def report(self, profile=None):
+        print(f"Run profile {profile or 'default'}: "
+              + ", ".join(f"{key}={value}" for key, value in self.settings.items()))
+        print(f"Peak buffer memory {self.peak_memory / (1 << 20):,.1f} MB, peak spill "
+              f"{self.peak_spill / (1 << 20):,.1f} MB in up to {self.spilled_files} temp files")
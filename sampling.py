@@ -0,0 +1,50 @@
+SEED = 42
+
+# ========================================== SAMPLING ==========================================
+# Every row gets a pseudo-random sample key from a seeded hash of the whole row, and a sample keeps the rows
+# with the smallest keys. DuckDB runs ORDER BY ... LIMIT n as a Top-N heap of n rows, so a reservoir sample
+# of the 21M-row base table costs one scan instead of a full sort. Keys depend only on the row and the seed:
+# the same seed draws the same sample whatever the thread count or scan order.
+#
+# Stratified samples first take one row from every stratum (e.g. every quarter of question4), then fill
+# the rest of the sample in proportion to each stratum's row count.
+
+
+def sample_key(alias, seed=SEED):
+    return f"hash({alias}, {int(seed)})"
+
+
+def reservoir_query(source, size, seed=SEED):
+    return f"""
+        SELECT *
+        FROM {source} AS sample_row
+        ORDER BY {sample_key('sample_row', seed)}
+        LIMIT {int(size)}
+    """
+
+
+def stratified_query(source, size, strata, seed=SEED):
+    partition = ", ".join(strata)
+    return f"""
+        WITH keyed AS (
+            SELECT *, {sample_key('sample_row', seed)} AS sample_key
+            FROM {source} AS sample_row
+        ),
+        ranked AS (
+            SELECT
+                *,
+                ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY sample_key) AS stratum_rank,
+                COUNT(*) OVER (PARTITION BY {partition}) AS stratum_rows
+            FROM keyed
+        )
+        SELECT * EXCLUDE (sample_key, stratum_rank, stratum_rows)
+        FROM ranked
+        ORDER BY stratum_rank > 1, (stratum_rank - 0.5) / stratum_rows, sample_key
+        LIMIT {int(size)}
+    """
+
+
+def sample_query(source, size, strata=(), seed=SEED):
+    if strata:
+        return stratified_query(source, size, strata, seed)
+    return reservoir_query(source, size, seed)
@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# ========================================== BUILD DAG ==========================================
+# tasks: name -> (dependencies, build(cursor)). Dependencies that aren't in `tasks` are treated as already
+# built, so any subset of a pipeline can be run on its own. Each task gets its own cursor of the shared
+# connection, and at most `workers` tasks run at once.
+
+
+def topological_order(tasks):
+    remaining = {name: {dep for dep in deps if dep in tasks} for name, (deps, _) in tasks.items()}
+    order = []
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError(f"Dependency cycle between {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+        order.extend(ready)
+    return order
+
+
+def run_task(cursor, build):
+    started = time.perf_counter()
+    try:
+        build(cursor)
+    finally:
+        cursor.close()
+    return time.perf_counter() - started
+
+
+def run_dag(conn, tasks, workers=4):
+    order = topological_order(tasks)
+    waiting = {name: {dep for dep in tasks[name][0] if dep in tasks} for name in order}
+    timings = {}
+    error = None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while waiting or running:
+            if error is None:
+                for name in [name for name in order if name in waiting and not waiting[name]]:
+                    del waiting[name]
+                    running[pool.submit(run_task, conn.cursor(), tasks[name][1])] = name
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                except Exception as exc:
+                    # Let the tasks already running finish, but don't start anything new
+                    error = error or exc
+                    continue
+                print(f"Built {name} ({timings[name]:.2f}s)")
+                for deps in waiting.values():
+                    deps.discard(name)
+
+    if error is not None:
+        raise error
+    return timings
+
+
+def plan_dag(conn, tasks):
+    # Dry run: the builds in the order run_dag would start them, one at a time, on a profiling.PlanConnection
+    order = topological_order(tasks)
+    for name in order:
+        deps = [dep for dep in tasks[name][0] if dep in tasks]
+        print(f"==== {name}" + (f" (after {', '.join(deps)})" if deps else ""))
+        tasks[name][1](conn.cursor())
+    return order
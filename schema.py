@@ -0,0 +1,25 @@
+DUCKDB_PATH = 'steam_reviews_db.duckdb'
+
+# ========================================== COMPACT REVIEW TABLES ==========================================
+# Names and layout of the compact tables db_queries.py builds. They live here so that segments.py, which
+# db_queries.py imports, can read the same tables and flags without importing db_queries.py back.
+
+COMPACT_TABLE = 'reviews_compact'
+APPS_TABLE = 'apps'
+AUTHORS_TABLE = 'authors'
+LANGUAGE_TYPE = 'review_language'
+
+# Bit of each boolean review field in reviews_compact.flags. The bit four places higher is set when the field
+# is NULL, so flag_expr gives back NULL rather than FALSE and filters like `received_for_free = FALSE` keep
+# their meaning.
+FLAG_BITS = {
+    'recommended': 1,
+    'steam_purchase': 2,
+    'received_for_free': 4,
+    'written_during_early_access': 8,
+}
+FLAG_NULL_BITS = {flag: bit << 4 for flag, bit in FLAG_BITS.items()}
+
+
+def flag_expr(flag):
+    return f"(CASE WHEN (flags & {FLAG_NULL_BITS[flag]}) = 0 THEN (flags & {FLAG_BITS[flag]}) <> 0 END)"
@@ -0,0 +1,301 @@
+import argparse
+import time
+
+import duckdb
+
+from schema import AUTHORS_TABLE, COMPACT_TABLE, DUCKDB_PATH, flag_expr
+
+# ========================================== USER FEATURES ==========================================
+# One aggregation pass over reviews_compact gives every (author, review language) pair; user_features rolls
+# those up to one row per author, and user_languages keeps the pairs with their author's features attached.
+# Author attributes (games owned, reviews written) are the latest snapshot kept in the authors dimension
+# rather than averages over every review they wrote, so prolific reviewers count once. Segmenting, and
+# re-segmenting with other bounds, scans these two tables without joining them or reading a review again.
+# An ingested batch is merged in per author: only the batch's authors are recomputed, from their existing
+# per-language rows plus the batch's.
+
+USER_LANGUAGES_TABLE = 'user_languages'
+USER_FEATURES_TABLE = 'user_features'
+USER_SEGMENTS_TABLE = 'user_segments'
+CUBE_TABLE = 'segment_language'
+
+# Columns of user_features (and user_languages) a segmentation can use
+FEATURES = ['games_owned', 'num_reviews', 'review_count', 'playtime_hours', 'recommendation_rate']
+
+
+def language_reviews_query(source=COMPACT_TABLE):
+    return f"""
+        SELECT
+            author_key,
+            language::VARCHAR AS language,
+            COUNT(*) AS language_reviews,
+            COUNT(*) FILTER (WHERE {flag_expr('recommended')}) AS language_positive_reviews,
+            SUM("author.playtime_forever") / 60.0 AS language_playtime_hours
+        FROM {source}
+        WHERE author_key IS NOT NULL
+        GROUP BY ALL
+    """
+
+
+def user_features_query(source):
+    return f"""
+        SELECT
+            author_key,
+            a.steamid,
+            a.num_games_owned AS games_owned,
+            a.num_reviews,
+            l.review_count,
+            l.positive_reviews,
+            l.playtime_hours,
+            l.recommendation_rate,
+            l.languages
+        FROM (
+            SELECT
+                author_key,
+                SUM(language_reviews)::BIGINT AS review_count,
+                SUM(language_positive_reviews)::BIGINT AS positive_reviews,
+                SUM(language_playtime_hours) AS playtime_hours,
+                SUM(language_positive_reviews) / SUM(language_reviews) AS recommendation_rate,
+                COUNT(*) AS languages
+            FROM {source}
+            GROUP BY author_key
+        ) AS l
+        JOIN {AUTHORS_TABLE} AS a USING (author_key)
+    """
+
+
+def user_languages_query(source):
+    return f"""
+        SELECT
+            l.author_key,
+            l.language,
+            l.language_reviews,
+            l.language_positive_reviews,
+            l.language_playtime_hours,
+            f.* EXCLUDE (author_key, steamid)
+        FROM {source} l
+        JOIN {USER_FEATURES_TABLE} f USING (author_key)
+    """
+
+
+def build_user_features(conn, source=COMPACT_TABLE):
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE language_reviews AS {language_reviews_query(source)}")
+    conn.execute(f"CREATE OR REPLACE TABLE {USER_FEATURES_TABLE} AS {user_features_query('language_reviews')}")
+    conn.execute(f"CREATE OR REPLACE TABLE {USER_LANGUAGES_TABLE} AS {user_languages_query('language_reviews')}")
+    conn.execute("DROP TABLE language_reviews")
+
+
+def merge_user_features(conn, source):
+    # source: new reviews in the compact layout, whose authors are already merged into the authors dimension
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE language_reviews_batch AS {language_reviews_query(source)}")
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE language_reviews_merged AS
+        SELECT
+            author_key,
+            language,
+            SUM(language_reviews)::BIGINT AS language_reviews,
+            SUM(language_positive_reviews)::BIGINT AS language_positive_reviews,
+            SUM(language_playtime_hours) AS language_playtime_hours
+        FROM (
+            SELECT author_key, language, language_reviews, language_positive_reviews, language_playtime_hours
+            FROM {USER_LANGUAGES_TABLE}
+            WHERE author_key IN (SELECT author_key FROM language_reviews_batch)
+            UNION ALL
+            SELECT * FROM language_reviews_batch
+        )
+        GROUP BY author_key, language
+    """)
+    # user_languages carries its author's features, so user_features goes first
+    for table, query in ((USER_FEATURES_TABLE, user_features_query), (USER_LANGUAGES_TABLE, user_languages_query)):
+        conn.execute(f"DELETE FROM {table} WHERE author_key IN (SELECT author_key FROM language_reviews_batch)")
+        conn.execute(f"INSERT INTO {table} {query('language_reviews_merged')}")
+
+
+# ========================================== SEGMENTATIONS ==========================================
+# A segmentation splits the authors on one feature, either at fixed bounds or at the feature's quantiles.
+# bounds are the lower bounds of every segment but the first, so n bounds make n + 1 segments; authors
+# without a value for the feature go to 'Unknown'. Labels default to the value range of each segment.
+
+SEGMENTATIONS = {
+    # question5's user types, with the owners of more than 200 games in a segment of their own
+    'games_owned': {
+        'feature': 'games_owned',
+        'bounds': [3, 10, 201],
+        'labels': ['Light Multi-Game', 'Casual Multi-Game', 'Hardcore Multi-Game', 'Collector Multi-Game'],
+    },
+    'playtime': {'feature': 'playtime_hours', 'quantiles': 4},
+    'activity': {'feature': 'review_count', 'bounds': [2, 5, 20]},
+    'sentiment': {'feature': 'recommendation_rate', 'bounds': [0.5, 0.9]},
+}
+
+DEFAULT_SEGMENTATION = 'games_owned'
+
+UNKNOWN_SEGMENT = 'Unknown'
+
+
+def quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def quantile_bounds(conn, feature, quantiles):
+    # Inner cut points of `quantiles` equal-sized groups. Ties can make cut points coincide (most authors
+    # own few games), which leaves fewer segments.
+    cuts = [i / quantiles for i in range(1, quantiles)]
+    bounds = conn.execute(f"SELECT quantile_disc({feature}, {cuts}) FROM {USER_FEATURES_TABLE}").fetchone()[0]
+    return sorted(set(bound for bound in bounds or [] if bound is not None))
+
+
+def range_labels(feature, bounds):
+    def number(value):
+        return f"{value:,.4g}"
+    if not bounds:
+        return [f"All {feature}"]
+    labels = [f"{feature} < {number(bounds[0])}"]
+    labels += [f"{number(low)} <= {feature} < {number(high)}" for low, high in zip(bounds, bounds[1:])]
+    labels.append(f"{feature} >= {number(bounds[-1])}")
+    return labels
+
+
+def resolve_segmentation(conn, feature, bounds=None, quantiles=None, labels=None):
+    if feature not in FEATURES:
+        raise ValueError(f"unknown feature {feature!r}, expected one of {', '.join(FEATURES)}")
+    if quantiles is not None:
+        if quantiles < 2:
+            raise ValueError("quantiles needs at least 2 segments")
+        bounds = quantile_bounds(conn, feature, quantiles)
+    bounds = list(bounds or [])
+    if bounds != sorted(set(bounds)):
+        raise ValueError(f"bounds must be increasing, got {bounds}")
+    labels = list(labels) if labels else range_labels(feature, bounds)
+    if len(labels) != len(bounds) + 1:
+        raise ValueError(f"{len(bounds)} bounds make {len(bounds) + 1} segments, got {len(labels)} labels")
+    return feature, bounds, labels
+
+
+def segment_expr(feature, bounds, labels):
+    # (label, position) of a feature value; the CASE is evaluated by DuckDB over whole vectors of authors
+    def case(values, unknown):
+        whens = " ".join(f"WHEN {feature} < {bound} THEN {value}" for bound, value in zip(bounds, values))
+        return f"CASE WHEN {feature} IS NULL THEN {unknown} {whens} ELSE {values[-1]} END"
+    labels = [quote(label) for label in labels]
+    positions = [str(position) for position in range(1, len(labels) + 1)]
+    return case(labels, quote(UNKNOWN_SEGMENT)), case(positions, 0)
+
+
+# ========================================== SEGMENT x LANGUAGE CUBE ==========================================
+# segment_language has the shape of question5: a row per (segment, language), per segment, per language and
+# one for all authors. Every row counts each author once: the per-language rows come from user_languages
+# (an author is in every language they reviewed in), the per-segment and total rows from user_features.
+# Review counts, recommendations and playtime of the per-language rows are those of the language's reviews.
+
+def cube_measures(reviews, positive_reviews, playtime_hours):
+    return f"""
+        COUNT(*) AS users,
+        SUM({reviews})::BIGINT AS review_count,
+        SUM({positive_reviews})::BIGINT AS positive_reviews,
+        SUM({positive_reviews}) / SUM({reviews}) AS recommendation_rate,
+        AVG(games_owned) AS avg_games_owned,
+        SUM({playtime_hours}) / COUNT(*) AS avg_playtime_hours,
+        SUM({reviews}) / COUNT(*) AS avg_reviews_per_user
+    """
+
+
+def cube_query(segmentation, feature, bounds, labels):
+    segment, segment_order = segment_expr(feature, bounds, labels)
+    return f"""
+        SELECT
+            {quote(segmentation)} AS segmentation,
+            CASE WHEN GROUPING(segment) = 1 THEN 'All Users' ELSE segment END AS segment,
+            CASE WHEN GROUPING(segment) = 1 THEN NULL ELSE segment_order END AS segment_order,
+            CASE WHEN GROUPING(language) = 1 THEN 'All Languages' ELSE language END AS language,
+            {cube_measures('language_reviews', 'language_positive_reviews', 'language_playtime_hours')}
+        FROM (SELECT {segment} AS segment, {segment_order} AS segment_order, * FROM {USER_LANGUAGES_TABLE})
+        GROUP BY GROUPING SETS ((segment, segment_order, language), (language))
+        UNION ALL
+        SELECT
+            {quote(segmentation)} AS segmentation,
+            CASE WHEN GROUPING(segment) = 1 THEN 'All Users' ELSE segment END AS segment,
+            CASE WHEN GROUPING(segment) = 1 THEN NULL ELSE segment_order END AS segment_order,
+            'All Languages' AS language,
+            {cube_measures('review_count', 'positive_reviews', 'playtime_hours')}
+        FROM (SELECT {segment} AS segment, {segment_order} AS segment_order, * FROM {USER_FEATURES_TABLE})
+        GROUP BY GROUPING SETS ((segment, segment_order), ())
+    """
+
+
+def segment(conn, name=DEFAULT_SEGMENTATION, feature=None, bounds=None, quantiles=None, labels=None, authors=None):
+    # Assigns every author in user_features a segment (user_segments) and rebuilds the cube, with a named
+    # segmentation from SEGMENTATIONS or, given a feature, with its bounds or quantiles under `name`.
+    # With `authors` (a table with an author_key column), only those authors are reassigned.
+    # Returns the (feature, bounds, labels) used.
+    spec = dict(SEGMENTATIONS.get(name, {}))
+    if feature is not None:
+        spec = {'feature': feature, 'bounds': bounds, 'quantiles': quantiles, 'labels': labels}
+    elif not spec:
+        raise ValueError(f"unknown segmentation {name!r}, expected one of {', '.join(SEGMENTATIONS)}")
+    feature, bounds, labels = resolve_segmentation(
+        conn, spec['feature'], spec.get('bounds'), spec.get('quantiles'), spec.get('labels'))
+    segment, segment_order = segment_expr(feature, bounds, labels)
+    assignments = f"""
+        SELECT author_key, {segment} AS segment, {segment_order} AS segment_order FROM {USER_FEATURES_TABLE}
+    """
+    if authors is None:
+        conn.execute(f"CREATE OR REPLACE TABLE {USER_SEGMENTS_TABLE} AS {assignments}")
+    else:
+        reassigned = f"author_key IN (SELECT author_key FROM {authors})"
+        conn.execute(f"DELETE FROM {USER_SEGMENTS_TABLE} WHERE {reassigned}")
+        conn.execute(f"INSERT INTO {USER_SEGMENTS_TABLE} {assignments} WHERE {reassigned}")
+    conn.execute(f"CREATE OR REPLACE TABLE {CUBE_TABLE} AS {cube_query(name, feature, bounds, labels)}")
+    return feature, bounds, labels
+
+
+def print_cube(conn, limit=None):
+    limit_clause = f" LIMIT {int(limit)}" if limit is not None else ""
+    df = conn.execute(f"""
+        SELECT * EXCLUDE (segmentation, segment_order) FROM {CUBE_TABLE}
+        ORDER BY segment_order NULLS LAST, language = 'All Languages' DESC, users DESC{limit_clause}
+    """).df()
+    print(df.to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment the review authors and build the segment x language cube")
+    parser.add_argument('segmentation', nargs='?', default=DEFAULT_SEGMENTATION,
+                        help=f"named segmentation ({', '.join(SEGMENTATIONS)}), or a name for --feature's")
+    parser.add_argument('--feature', choices=FEATURES, help="segment on this feature instead of a named segmentation")
+    parser.add_argument('--bounds', nargs='+', type=float, metavar='VALUE',
+                        help="lower bounds of the segments after the first, e.g. 3 10 201")
+    parser.add_argument('--quantiles', type=int, metavar='N', help="split the feature into N equal-sized segments")
+    parser.add_argument('--labels', nargs='+', metavar='LABEL', help="segment names, one more than --bounds")
+    parser.add_argument('--rebuild-features', action='store_true',
+                        help="recompute user_features and user_languages from reviews_compact first")
+    parser.add_argument('--max-rows', type=int, metavar='N', help="print at most N rows of the cube")
+    parser.add_argument('--database', default=DUCKDB_PATH)
+    args = parser.parse_args()
+    if args.feature and bool(args.bounds) == bool(args.quantiles):
+        parser.error("--feature needs either --bounds or --quantiles")
+    if not args.feature and (args.bounds or args.quantiles or args.labels):
+        parser.error("--bounds, --quantiles and --labels go with --feature")
+
+    conn = duckdb.connect(args.database)
+    try:
+        started = time.perf_counter()
+        if args.rebuild_features or not conn.execute(
+                "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [USER_LANGUAGES_TABLE]).fetchone()[0]:
+            build_user_features(conn)
+            print(f"Built {USER_FEATURES_TABLE} from {COMPACT_TABLE} in {time.perf_counter() - started:.2f}s")
+            started = time.perf_counter()
+        try:
+            feature, bounds, labels = segment(conn, args.segmentation, args.feature, args.bounds, args.quantiles,
+                                              args.labels)
+        except ValueError as error:
+            parser.error(str(error))
+        users = conn.execute(f"SELECT COUNT(*) FROM {USER_SEGMENTS_TABLE}").fetchone()[0]
+        print(f"Segmented {users:,} users on {feature} at {bounds} in {time.perf_counter() - started:.2f}s")
+        print_cube(conn, args.max_rows)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# ========================================== SERVING SCHEMA ==========================================
+# The dashboard reads full question tables from SQLite. Each table gets indexes covering the ORDER BY /
+# WHERE the dashboard pushes down, and the ranked charts read small top-N views.
+# Databases exported before the serving schema existed only hold the *_samples_500 tables; queries fall
+# back to those.
+
+SERVING_INDEXES = {
+    'question1_1': [('total_reviews DESC', 'app_name')],
+    'question1_2': [('positive_percentage DESC', 'total_reviews', 'app_name')],
+    'question1_3': [('total_reviews DESC', 'app_name', 'positive_reviews')],
+    'question2_2': [('total_playtime DESC', 'app_name')],
+    'question2_3': [('average_playtime_per_day DESC', 'app_name')],
+    'question3_1': [('review_count DESC', 'language', 'percentage')],
+    'question3_2': [('total_users DESC', 'language', 'percentage')],
+    'question4': [('app_name', 'quarter', 'review_count'), ('quarter', 'review_count DESC')],
+    'question5': [('language', 'user_type', 'unique_users')],
+    'app_daily': [('app_name', 'day', 'review_count'), ('day', 'app_name', 'review_count')],
+}
+
+TOP_N = 100
+
+# view -> (table, ranking)
+TOP_VIEWS = {
+    'question1_1_top': ('question1_1', 'total_reviews DESC'),
+    'question1_2_top': ('question1_2', 'positive_percentage DESC'),
+    'question1_3_top': ('question1_3', 'total_reviews DESC'),
+    'question2_2_top': ('question2_2', 'total_playtime DESC'),
+    'question2_3_top': ('question2_3', 'average_playtime_per_day DESC'),
+    'question3_1_top': ('question3_1', 'review_count DESC'),
+    'question3_2_top': ('question3_2', 'total_users DESC'),
+}
+
+
+def top_view_query(view):
+    table, ranking = TOP_VIEWS[view]
+    return f"SELECT * FROM {table} ORDER BY {ranking} LIMIT {TOP_N}"
+
+
+# ========================================== TRENDS ==========================================
+# app_daily holds one row per (app, day); trends at any granularity sum its days into periods, and the
+# top-N per period is ranked over those sums. Periods are ISO dates of the period's first day.
+
+TREND_TABLE = 'app_daily'
+
+TREND_GRANULARITIES = {
+    'day': "day",
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m-01', day)",
+    'quarter': "printf('%s-%02d-01', strftime('%Y', day), (CAST(strftime('%m', day) AS INTEGER) + 2) / 3 * 3 - 2)",
+    'year': "strftime('%Y-01-01', day)",
+}
+
+TREND_MEASURES = "SUM(review_count) AS review_count, SUM(positive_reviews) AS positive_reviews"
+
+
+def trend_ranking(granularity):
+    # Subquery usable as a fetch() table: one row per (app, period) with the app's rank within the period
+    return f"""(
+        SELECT *, RANK() OVER (PARTITION BY period ORDER BY review_count DESC) AS rank
+        FROM (
+            SELECT app_name, {TREND_GRANULARITIES[granularity]} AS period, {TREND_MEASURES}
+            FROM {TREND_TABLE}
+            GROUP BY app_name, period
+        )
+    )"""
+
+
+OBJECTS_QUERY = "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+
+
+def existing_objects(sqlite_conn):
+    return {name for (name,) in sqlite_conn.execute(OBJECTS_QUERY)}
+
+
+def build_query(name, objects, columns="*", where=None, group_by=None, order_by=None, limit=None):
+    # Resolve name against the tables/views in the database, falling back from a missing top-N view to its
+    # ranked table and from a missing full table to its 500-row sample
+    if name in TOP_VIEWS:
+        table, ranking = TOP_VIEWS[name]
+        order_by = order_by or ranking
+        if name not in objects:
+            name = table
+    if name not in objects and f"{name}_samples_500" in objects:
+        name = f"{name}_samples_500"
+
+    query = f"SELECT {columns} FROM {name}"
+    if where:
+        query += f" WHERE {where}"
+    if group_by:
+        query += f" GROUP BY {group_by}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return query
+
+
+def make_fetch(read_sql, objects):
+    # fetch(table, ...) for the dashboard and chart code; read_sql(query, params) runs the query
+    def fetch(table_name, columns="*", where=None, group_by=None, order_by=None, limit=None, params=()):
+        return read_sql(build_query(table_name, objects, columns, where, group_by, order_by, limit), params)
+    return fetch
@@ -0,0 +1,227 @@
+import datetime
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# ========================================== TYPE MAPPING ==========================================
+# Declared SQLite column type for each DuckDB type. Timestamps and dates are written as ISO text,
+# the same values pandas' to_sql used to produce.
+
+SQLITE_TYPES = {
+    'BOOLEAN': 'INTEGER',
+    'TINYINT': 'INTEGER',
+    'SMALLINT': 'INTEGER',
+    'INTEGER': 'INTEGER',
+    'BIGINT': 'INTEGER',
+    'UTINYINT': 'INTEGER',
+    'USMALLINT': 'INTEGER',
+    'UINTEGER': 'INTEGER',
+    'UBIGINT': 'INTEGER',
+    'HUGEINT': 'REAL',
+    'FLOAT': 'REAL',
+    'DOUBLE': 'REAL',
+    'VARCHAR': 'TEXT',
+    'DATE': 'DATE',
+    'TIMESTAMP': 'TIMESTAMP',
+}
+
+# Pragmas for a one-off bulk load; the export is simply re-run if it's interrupted
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+]
+
+BATCH_ROWS = 100_000
+
+
+def quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def sqlite_type(duckdb_type):
+    if duckdb_type.startswith('DECIMAL'):
+        return 'REAL'
+    return SQLITE_TYPES.get(duckdb_type, 'TEXT')
+
+
+def table_columns(conn, table):
+    return [(name, column_type) for name, column_type, *_ in conn.execute(f"DESCRIBE {quote(table)}").fetchall()]
+
+
+def select_for_export(table, columns):
+    # Cast in DuckDB so the Arrow batches already hold values SQLite can bind
+    expressions = []
+    for name, column_type in columns:
+        declared = sqlite_type(column_type)
+        if declared in ('DATE', 'TIMESTAMP', 'TEXT') and column_type != 'VARCHAR':
+            expressions.append(f"CAST({quote(name)} AS VARCHAR) AS {quote(name)}")
+        elif declared == 'REAL' and column_type != 'DOUBLE':
+            expressions.append(f"CAST({quote(name)} AS DOUBLE) AS {quote(name)}")
+        else:
+            expressions.append(quote(name))
+    return f"SELECT {', '.join(expressions)} FROM {quote(table)}"
+
+
+# ========================================== DUCKDB READERS ==========================================
+
+def produce_batches(cursor, query, batches, batch_rows, cancelled):
+    # Runs on a worker thread with its own DuckDB cursor and hands Arrow batches to the writer
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        reader = cursor.execute(query).fetch_record_batch(batch_rows)
+        for batch in reader:
+            if not put(batch):
+                return
+        put(None)
+    except Exception as error:
+        put(error)
+    finally:
+        cursor.close()
+
+
+def consume_batches(batches):
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        if isinstance(batch, Exception):
+            raise batch
+        yield batch
+
+
+# ========================================== SQLITE WRITER ==========================================
+
+def export_tables(conn, tables, sqlite_path, indexes=None, views=None, batch_rows=BATCH_ROWS, workers=4,
+                  queue_batches=4):
+    # Tables are read from DuckDB in parallel (one cursor per table, at most `workers` at a time) while a
+    # single SQLite connection bulk-inserts them in order inside one transaction. Each table buffers at
+    # most `queue_batches` Arrow batches, so memory doesn't grow with table size.
+    indexes = indexes or {}
+    views = views or {}
+    schemas = {table: table_columns(conn, table) for table in tables}
+    queues = {table: queue.Queue(maxsize=queue_batches) for table in tables}
+    cancelled = threading.Event()
+
+    sqlite_conn = sqlite3.connect(sqlite_path, isolation_level=None)
+    for pragma in BULK_LOAD_PRAGMAS:
+        sqlite_conn.execute(pragma)
+
+    exported = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for table in tables:
+            pool.submit(produce_batches, conn.cursor(), select_for_export(table, schemas[table]),
+                        queues[table], batch_rows, cancelled)
+
+        sqlite_conn.execute("BEGIN")
+        try:
+            for table in tables:
+                columns = schemas[table]
+                column_defs = ", ".join(f"{quote(name)} {sqlite_type(column_type)}" for name, column_type in columns)
+                placeholders = ", ".join("?" for _ in columns)
+                sqlite_conn.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+                sqlite_conn.execute(f"CREATE TABLE {quote(table)} ({column_defs})")
+
+                rows = 0
+                insert = f"INSERT INTO {quote(table)} VALUES ({placeholders})"
+                for batch in consume_batches(queues[table]):
+                    sqlite_conn.executemany(insert, zip(*(column.to_pylist() for column in batch.columns)))
+                    rows += batch.num_rows
+
+                # Indexes are built once the table is loaded, not maintained row by row
+                for index_columns in indexes.get(table, []):
+                    index_name = f"idx_{table}_" + "_".join(
+                        column.split()[0].strip('"').replace('.', '_') for column in index_columns
+                    )
+                    sqlite_conn.execute(
+                        f"CREATE INDEX {quote(index_name)} ON {quote(table)} ({', '.join(index_columns)})"
+                    )
+
+                exported[table] = rows
+                print(f"Exported {table} to SQLite ({rows} rows)")
+
+            for view, query in views.items():
+                sqlite_conn.execute(f"DROP VIEW IF EXISTS {quote(view)}")
+                sqlite_conn.execute(f"CREATE VIEW {quote(view)} AS {query}")
+            sqlite_conn.execute("COMMIT")
+        except Exception:
+            sqlite_conn.execute("ROLLBACK")
+            # Unblock readers still waiting to hand over batches
+            cancelled.set()
+            raise
+
+    sqlite_conn.execute("ANALYZE")
+    sqlite_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    sqlite_conn.close()
+    return exported
+
+
+# ========================================== VERSIONED SWAP ==========================================
+# Exports write a new versioned file next to the live database (steam_reviews_samples_500.db.<version>),
+# which replaces the live file with one atomic rename once it's complete. Dashboards keep reading the
+# previous snapshot on their open connections until they reopen the file, and never see half-written
+# tables or wait on the export's locks. Tables (with their indexes) and views of the live file that the
+# export didn't write are carried over, so e.g. the graph analytics tables survive a question-only export.
+# The new file is switched to rollback journaling before the swap: a WAL file would be paired with the
+# -wal/-shm files readers of the old file still hold open.
+
+def carry_over(live_path, sqlite_path):
+    if not os.path.exists(live_path):
+        return []
+    sqlite_conn = sqlite3.connect(sqlite_path, isolation_level=None)
+    sqlite_conn.execute("ATTACH DATABASE ? AS live", (live_path,))
+    existing = {name for (name,) in sqlite_conn.execute("SELECT name FROM main.sqlite_master")}
+    objects = sqlite_conn.execute("""
+        SELECT type, name, tbl_name, sql FROM live.sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+        ORDER BY type = 'index', type = 'view'
+    """).fetchall()
+
+    carried = []
+    sqlite_conn.execute("BEGIN")
+    for kind, name, table, sql in objects:
+        if name in existing or (kind == 'index' and table not in carried):
+            continue
+        sqlite_conn.execute(sql)
+        if kind == 'table':
+            sqlite_conn.execute(f"INSERT INTO main.{quote(name)} SELECT * FROM live.{quote(name)}")
+            carried.append(name)
+    sqlite_conn.execute("COMMIT")
+    for table in carried:
+        sqlite_conn.execute(f"ANALYZE main.{quote(table)}")
+    if carried:
+        print(f"Carried over {len(carried)} tables from the previous version")
+    sqlite_conn.execute("DETACH DATABASE live")
+    sqlite_conn.close()
+    return carried
+
+
+@contextmanager
+def new_version(live_path):
+    # with new_version(path) as sqlite_path: export to sqlite_path; it replaces `path` on success
+    version = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    sqlite_path = f"{live_path}.{version}"
+    try:
+        yield sqlite_path
+        carry_over(live_path, sqlite_path)
+        sqlite_conn = sqlite3.connect(sqlite_path, isolation_level=None)
+        sqlite_conn.execute("PRAGMA journal_mode = DELETE")
+        sqlite_conn.close()
+        os.replace(sqlite_path, live_path)
+        print(f"Swapped in version {version} of {live_path}")
+    finally:
+        for path in (sqlite_path, f"{sqlite_path}-wal", f"{sqlite_path}-shm", f"{sqlite_path}-journal"):
+            if os.path.exists(path):
+                os.remove(path)
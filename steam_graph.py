@@ -1,128 +1,131 @@
+import os
+
 import streamlit as st
 import sqlite3
-import networkx as nx
-from pyvis.network import Network
-
-# SQLite connection
-conn = sqlite3.connect('steam_reviews_samples_500.db')
-
-# 1. Load user, game, and review data
-def load_graph_data():
-    users = conn.execute('''
-        SELECT DISTINCT 
-            "author.steamid" as steamid,
-            "author.num_games_owned",
-            "author.num_reviews",
-            "author.playtime_forever"
-        FROM steam_reviews_sample_500
-        LIMIT 5
-    ''').fetchall()
-
-    games = conn.execute('''
-        SELECT DISTINCT 
-            app_id,
-            app_name 
-        FROM steam_reviews_sample_500
-        LIMIT 5
-    ''').fetchall()
-
-    reviews = conn.execute('''
-        SELECT 
-            review_id,
-            recommended,
-            language,
-            votes_helpful,
-            steam_purchase,
-            received_for_free,
-            "author.steamid",
-            app_id
-        FROM steam_reviews_sample_500
-        LIMIT 5
-    ''').fetchall()
-
-    return users, games, reviews
-
-
-# 2. Build NetworkX graph
-def build_graph(users, games, reviews):
-    G = nx.DiGraph()
-
-    # Add nodes
-    for user in users:
-        G.add_node(f'User_{user[0]}', type='user', label=f'User_{user[0]}')
-
-    for game in games:
-        G.add_node(f'Game_{game[0]}', type='game', label=f'Game_{game[1]}')
-
-    for review in reviews:
-        G.add_node(f'Review_{review[0]}', type='review', label=f'Review_{review[0]}')
-
-    # Add edges
-    for review in reviews:
-        # Edge: User -> Review
-        G.add_edge(
-            f'User_{review[6]}',
-            f'Review_{review[0]}',
-            label='WRITES'
-        )
-        # Edge: Review -> Game
-        G.add_edge(
-            f'Review_{review[0]}',
-            f'Game_{review[7]}',
-            label='FOR'
-        )
-
-    return G
-
-
-# 3. Create interactive Pyvis graph
-def create_interactive_graph(G):
-    # Create Pyvis network
-    net = Network(notebook=True, directed=True, height="600px", width="100%")
-
-    # Add nodes and edges to the network
-    for node, data in G.nodes(data=True):
-        net.add_node(node, label=data['label'], color=get_node_color(data['type']))
-
-    for edge in G.edges(data=True):
-        net.add_edge(edge[0], edge[1], label=edge[2]['label'])
-
-    # Graph options
-    net.set_options("""
-    {
-      "physics": {
-        "enabled": true,
-        "stabilization": {
-          "iterations": 100
-        }
-      },
-      "edges": {
-        "arrows": {
-          "to": {
-            "enabled": true,
-            "scaleFactor": 1
-          }
-        },
-        "smooth": {
-          "type": "dynamic"
-        }
-      }
-    }
-    """)
-
-    # Save the graph as an HTML file
-    net.save_graph("graph.html")
-    return "graph.html"
-
-
-# Helper function for node color based on type
-def get_node_color(node_type):
-    colors = {
-        'user': '#1f77b4',
-        'game': '#ff7f0e',
-        'review': '#2ca02c'
-    }
-    return colors.get(node_type, '#000000')
+
+# numpy, pandas, scipy and pyvis (via graph_builder, graph_analytics and graph_view) are imported inside the
+# sections that use them, so the page's first paint doesn't wait for all of them
+
+DB_PATH = 'steam_reviews_samples_500.db'
+
+# SQLite connection; a new export is swapped in atomically and picked up on the next rerun
+conn = sqlite3.connect(DB_PATH)
+
+# 1. Sample graph: the first 5 reviews with their users and games, review nodes drawn explicitly
+def load_sample_view():
+    import graph_builder
+    import graph_view
+    graph = graph_builder.load_graph(conn, 'steam_reviews_sample_500', limit=5)
+    return graph_view.level_of_detail(graph, range(graph.num_games), k=graph.num_reviews, review_nodes=True)
+
+
+# 2. Display a rendered pyvis graph in Streamlit
+def show_graph(view):
+    import graph_view
+    graph_file = graph_view.render(view)
+    with open(graph_file, "r", encoding="utf-8") as f:
+        html_content = f.read()
+    st.components.v1.html(html_content, height=600)
+
+
+# 3. Full graph: every review in the database, held as CSR arrays instead of NetworkX objects.
+# A graph built offline from DuckDB (python graph_builder.py) is used when present. The graph is cached per
+# version of the database and graph files, so a new export or graph is loaded on the next rerun.
+def data_version():
+    import graph_builder
+    import query_cache
+    return query_cache.file_version(DB_PATH), query_cache.file_version(graph_builder.GRAPH_PATH)
+
+
+@st.cache_resource(show_spinner="Building graph...", max_entries=1)
+def load_full_graph(version):
+    import graph_builder
+    if os.path.exists(graph_builder.GRAPH_PATH):
+        return graph_builder.BipartiteGraph.load(graph_builder.GRAPH_PATH)
+    return graph_builder.load_graph(conn, 'steam_reviews_sample_500')
+
+
+def show_full_graph(weight):
+    import numpy as np
+    graph = load_full_graph(data_version())
+    indptr, games, weights = graph.project(weight)
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Users", f"{graph.num_users:,}")
+    col2.metric("Games", f"{graph.num_games:,}")
+    col3.metric("Reviews", f"{graph.num_reviews:,}")
+    col4.metric("User–game edges", f"{len(games):,}")
+    st.caption(f"Graph arrays: {graph.nbytes / (1 << 20):.1f} MB")
+
+    degree = graph.game_indptr[1:] - graph.game_indptr[:-1]
+    top = degree.argsort()[::-1][:20]
+    st.dataframe({
+        'app_name': graph.game_names[top],
+        'reviews': degree[top],
+        weight: np.bincount(games, weights, minlength=graph.num_games)[top],
+    })
+    return graph
+
+
+# 4. Level-of-detail view: top games, their top-k reviewers, everyone else clustered. Games and users
+# picked in the sidebar are expanded in place.
+def show_graph_view(graph):
+    import graph_view
+    st.sidebar.markdown("**Level of detail**")
+    num_games = st.sidebar.slider("Games", 1, min(50, graph.num_games), min(10, graph.num_games))
+    k = st.sidebar.slider("Reviewers per game", 1, 50, 10)
+    ranking = st.sidebar.selectbox("Rank reviews by", graph_view.EDGE_WEIGHTS)
+    games = graph_view.top_games(graph, num_games)
+
+    game_names = {str(graph.game_names[game]): game for game in games}
+    expanded_games = [game_names[name] for name in st.sidebar.multiselect("Expand games", list(game_names))]
+    view = graph_view.level_of_detail(graph, games, k, ranking, expanded_games)
+
+    users = {view.nodes[node]['label']: int(node.split('_')[1]) for node in view.nodes if node.startswith('user_')}
+    expanded_users = [users[label] for label in st.sidebar.multiselect("Expand users", sorted(users))]
+    if expanded_users:
+        view = graph_view.level_of_detail(graph, games, k, ranking, expanded_games, expanded_users)
+
+    if len(view.nodes) > graph_view.PHYSICS_NODE_LIMIT:
+        st.caption(f"{len(view.nodes)} nodes: physics off, radial layout")
+    show_graph(view)
+
+
+# 5. Similar games: precomputed tables from `python db_queries.py --graph` when the database has them,
+# otherwise computed once from the loaded graph
+@st.cache_resource(show_spinner="Computing similar games...", max_entries=1)
+def load_analytics_tables(version):
+    import graph_analytics
+    return graph_analytics.analytics_tables(load_full_graph(version))
+
+
+def fetch_related(table, app_id, k):
+    import pandas as pd
+    query = f"SELECT * FROM {table} WHERE app_id = ? ORDER BY rank LIMIT ?"
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+        return pd.read_sql_query(query, conn, params=(app_id, k))
+    frame = load_analytics_tables(data_version())[table]
+    return frame[frame['app_id'] == app_id].sort_values('rank').head(k)
+
+
+def show_similar_games():
+    import graph_analytics
+    import graph_view
+    graph = load_full_graph(data_version())
+    games = graph_view.top_games(graph, graph.num_games)
+    names = {str(graph.game_names[game]): int(graph.game_ids[game]) for game in games}
+    app_id = names[st.selectbox("🎮 Game", list(names))]
+    k = st.slider("Results", 5, graph_analytics.TOP_K, 10)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Most similar (Jaccard over shared reviewers)**")
+        st.dataframe(fetch_related('game_similarity', app_id, k)[['similar_app_name', 'jaccard', 'cosine']])
+        st.markdown("**Personalized PageRank**")
+        st.dataframe(fetch_related('game_pagerank', app_id, k)[['related_app_name', 'score']])
+    with col2:
+        st.markdown("**Users who reviewed this also reviewed**")
+        st.dataframe(fetch_related('game_also_reviewed', app_id, k)[['also_app_name', 'shared_reviewers', 'share']])
 
 
 # Streamlit interface
@@ -134,15 +137,16 @@ st.markdown("""
 - **🟧 Games**: Identified by app_id
 """)
 
-if st.button('Build Graph'):
-    users, games, reviews = load_graph_data()
-    G = build_graph(users, games, reviews)
-    graph_file = create_interactive_graph(G)
+mode = st.sidebar.radio("Graph", ["Sample (5 reviews)", "Full graph", "Similar games"])
 
-    # Display the interactive graph in Streamlit
-    with open(graph_file, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    st.components.v1.html(html_content, height=600)
+if mode == "Similar games":
+    show_similar_games()
+elif mode == "Full graph":
+    import graph_builder
+    weight = st.sidebar.selectbox("User–game edge weight", graph_builder.PROJECTION_WEIGHTS)
+    show_graph_view(show_full_graph(weight))
+elif st.button('Build Graph'):
+    show_graph(load_sample_view())
 else:
     st.warning('Click the button to build the graph')
 
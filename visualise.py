@@ -1,24 +1,15 @@
+import os
+
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import sqlite3
-import numpy as np
-
-# Connect to SQLite database
-conn = sqlite3.connect('steam_reviews_samples_500.db')
-c = conn.cursor()
-
-# Professional color palette
-PRIMARY_DARK = '#1a1d23'
-SECONDARY_DARK = '#2d3748'
-ACCENT_BLUE = '#3182ce'
-SUCCESS_GREEN = '#38a169'
-WARNING_ORANGE = '#ed8936'
-LIGHT_TEXT = '#e2e8f0'
-MUTED_TEXT = '#a0aec0'
-CARD_BG = '#2d3748'
-BORDER_COLOR = '#4a5568'
+
+import charts
+import column_store
+import query_cache
+import serving
+
+DB_PATH = 'steam_reviews_samples_500.db'
+DUCKDB_PATH = 'steam_reviews_db.duckdb'
+
 
 # Configure Streamlit theme and styling
 st.set_page_config(page_title="Steam Reviews Dashboard", layout="wide", initial_sidebar_state="expanded")
@@ -52,22 +43,56 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def fetch_data(table_name):
-    query = f"SELECT * FROM {table_name}"
-    return pd.read_sql_query(query, conn)
+# One connection pool and result cache shared by every session and rerun. When db_queries.py swaps in a new
+# export, the cache reloads in the background while sessions keep being served the previous snapshot.
+@st.cache_resource(show_spinner=False)
+def get_query_cache():
+    return query_cache.QueryCache(DB_PATH).watch()
+
+
+store = get_query_cache()
+
+# Tables and views available in the serving database
+serving_objects = set(store.read_sql(serving.OBJECTS_QUERY)['name'])
+
+# Filters, ordering and limits run in SQLite against the serving indexes
+fetch_data = serving.make_fetch(store.read_sql, serving_objects)
+
+
+# Per-app totals and quarter series memory-mapped from the column store: every session and every dashboard
+# process slices the same page-cached files instead of holding its own DataFrames
+@st.cache_resource(show_spinner=False)
+def get_column_store():
+    return column_store.ColumnStore(column_store.DEFAULT_DIR)
+
+
+hot_store = get_column_store()
+
+
+# Rendered charts shared by every session; images pre-rendered at export time are picked up from disk
+@st.cache_resource(show_spinner=False)
+def get_chart_cache():
+    return charts.ChartCache(charts.CHART_CACHE_DIR)
+
+
+chart_cache = get_chart_cache()
+
+
+# Ad-hoc queries over the pipeline's DuckDB database, with results shared by every session
+@st.cache_resource(show_spinner=False)
+def get_query_service():
+    import adhoc
+    return adhoc.QueryService(DUCKDB_PATH)
 
 
-# Set professional matplotlib theme
-plt.style.use('dark_background')
-plt.rcParams['figure.facecolor'] = PRIMARY_DARK
-plt.rcParams['axes.facecolor'] = SECONDARY_DARK
-plt.rcParams['axes.edgecolor'] = BORDER_COLOR
-plt.rcParams['text.color'] = LIGHT_TEXT
-plt.rcParams['axes.labelcolor'] = LIGHT_TEXT
-plt.rcParams['xtick.color'] = LIGHT_TEXT
-plt.rcParams['ytick.color'] = LIGHT_TEXT
-plt.rcParams['grid.color'] = BORDER_COLOR
-plt.rcParams['grid.alpha'] = 0.3
+def show_chart(chart, *state, **sources):
+    # Charts are only drawn when (chart, data version, widget state) hasn't been rendered before. `sources` are
+    # column store data sources for the chart, whose file versions are then part of the data version
+    version = store.version
+    if any(source is not None for source in sources.values()):
+        version = (version, hot_store.version)
+    image = chart_cache.render(chart, version, state, lambda: charts.CHARTS[chart](fetch_data, *state, **sources))
+    st.image(image)
 
 # App title
 st.title("🎮 Steam Reviews Dashboard")
@@ -76,7 +101,7 @@ st.markdown("### 📊 *Analyzing 21 Million Gaming Reviews*")
 # Create sidebar navigation
 nav = st.sidebar.radio("📊 Navigation",
                        ["📖 Story & Insights", "📈 Review Analytics", "🎯 Gaming Addiction", "🌍 Global Markets",
-                        "📅 Trending Analysis", "👥 User Demographics"])
+                        "📅 Trending Analysis", "👥 User Demographics", "🔎 Explore"])
 
 if nav == "📖 Story & Insights":
     col1, col2 = st.columns([3, 2])
@@ -115,62 +140,43 @@ if nav == "📖 Story & Insights":
 elif nav == "📈 Review Analytics":
     st.header("📈 Review Analytics")
 
-    q1_1 = fetch_data("question1_1_samples_500")
-    q1_2 = fetch_data("question1_2_samples_500")
-    q1_3 = fetch_data("question1_3_samples_500")
+    if hot_store.available(column_store.APP_TOTALS):
+        totals = column_store.APP_TOTALS
+        q1_1 = hot_store.top(totals, 'total_reviews', 10, ['app_name', 'total_reviews'])
+        q1_2 = hot_store.top(totals, 'positive_percentage', 10,
+                             ['app_name', 'total_reviews', 'positive_reviews', 'positive_percentage'])
+        q1_3 = hot_store.top(totals, 'total_reviews', 10,
+                             ['app_name', 'total_reviews', 'positive_reviews', 'positive_percentage'],
+                             mask=hot_store.column(totals, 'total_reviews') > 500000)
+    else:
+        q1_1 = fetch_data("question1_1_top", limit=10)
+        q1_2 = fetch_data("question1_2", order_by="positive_percentage DESC", limit=10)
+        q1_3 = fetch_data("question1_3_top", limit=10)
 
     col1, col2 = st.columns(2)
 
     with col1:
         st.markdown("**📊 Q1.1: Total Reviews per Game**")
         st.dataframe(q1_1.head(10), height=200)
-
-        fig, ax = plt.subplots(figsize=(8, 4))
-        q1_1.sort_values("total_reviews", ascending=False).head(8).plot(kind="bar", x="app_name", y="total_reviews",
-                                                                        ax=ax, color=ACCENT_BLUE)
-        ax.set_title("🏆 Top 8 Games by Reviews", fontsize=14, color=ACCENT_BLUE)
-        ax.set_xlabel("🎮 Game", fontsize=10)
-        ax.set_ylabel("📝 Reviews", fontsize=10)
-        plt.xticks(rotation=45, ha='right', fontsize=8)
-        plt.tight_layout()
-        st.pyplot(fig)
+        show_chart('top_reviews')
 
     with col2:
         st.markdown("**💯 Q1.2: Positive Reviews and Percentage**")
         st.dataframe(q1_2.head(10), height=200)
-
-        fig, ax = plt.subplots(figsize=(8, 4))
-        ax.scatter(q1_2["total_reviews"], q1_2["positive_percentage"], color=SUCCESS_GREEN, alpha=0.7, s=30)
-        ax.set_title("👍 Positive % vs. Total Reviews", fontsize=14, color=ACCENT_BLUE)
-        ax.set_xlabel("📊 Total Reviews", fontsize=10)
-        ax.set_ylabel("💚 Positive %", fontsize=10)
-        plt.tight_layout()
-        st.pyplot(fig)
+        show_chart('positive_vs_total')
 
     st.markdown("**🔥 Q1.3: Games with Over 500,000 Reviews**")
     col3, col4 = st.columns([1, 2])
     with col3:
         st.dataframe(q1_3.head(10), height=300)
     with col4:
-        fig, ax = plt.subplots(figsize=(10, 5))
-        q1_3_sorted = q1_3.sort_values("total_reviews", ascending=False).head(8)
-        ax.bar(q1_3_sorted["app_name"], q1_3_sorted["total_reviews"], color=WARNING_ORANGE, label="📊 Total Reviews")
-        ax.bar(q1_3_sorted["app_name"], q1_3_sorted["positive_reviews"], color=SUCCESS_GREEN,
-               label="👍 Positive Reviews")
-        ax.set_title("🚀 Top 8 Games with Over 500,000 Reviews", fontsize=14, color=ACCENT_BLUE)
-        ax.set_xlabel("🎮 Game", fontsize=10)
-        ax.set_ylabel("📈 Reviews", fontsize=10)
-        ax.legend()
-        plt.xticks(rotation=45, ha="right", fontsize=8)
-        plt.tight_layout()
-        st.pyplot(fig)
+        show_chart('high_volume_games')
 
 elif nav == "🎯 Gaming Addiction":
     st.header("🎯 Gaming Addiction")
 
-    q2_1 = fetch_data("question2_1_samples_500")
-    q2_2 = fetch_data("question2_2_samples_500")
-    q2_3 = fetch_data("question2_3_samples_500")
+    q2_1 = fetch_data("question2_1", limit=1)
+    q2_3 = fetch_data("question2_3_top", limit=15)
 
     col1, col2 = st.columns([1, 2])
 
@@ -182,112 +188,65 @@ elif nav == "🎯 Gaming Addiction":
         st.dataframe(q2_3.head(15), height=300)
 
     with col2:
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
-
-        q2_2.sort_values("total_playtime", ascending=False).head(8).plot(kind="bar", x="app_name", y="total_playtime",
-                                                                         ax=ax1, color=ACCENT_BLUE)
-        ax1.set_title("⏰ Top 8 Games by Total Playtime", fontsize=14, color=ACCENT_BLUE)
-        ax1.set_xlabel("🎮 Game", fontsize=10)
-        ax1.set_ylabel("⏱️ Total Playtime (hours)", fontsize=10)
-        ax1.tick_params(axis='x', rotation=45, labelsize=8)
-
-        q2_3.sort_values("average_playtime_per_day", ascending=False).head(8).plot(kind="bar", x="app_name",
-                                                                                   y="average_playtime_per_day", ax=ax2,
-                                                                                   color=SUCCESS_GREEN)
-        ax2.set_title("🔥 Top 8 Games by Avg Playtime/Day", fontsize=14, color=ACCENT_BLUE)
-        ax2.set_xlabel("🎮 Game", fontsize=10)
-        ax2.set_ylabel("📈 Avg Playtime/Day (hours)", fontsize=10)
-        ax2.tick_params(axis='x', rotation=45, labelsize=8)
-
-        plt.tight_layout()
-        st.pyplot(fig)
+        show_chart('playtime')
 
 elif nav == "🌍 Global Markets":
     st.header("🌍 Global Markets")
 
-    q3_1 = fetch_data("question3_1_samples_500")
-    q3_2 = fetch_data("question3_2_samples_500")
+    q3_1 = fetch_data("question3_1_top", limit=15)
+    q3_2 = fetch_data("question3_2_top", limit=15)
 
     col1, col2 = st.columns(2)
 
     with col1:
         st.markdown("**🗣️ Q3.1: Reviews by Language**")
         st.dataframe(q3_1.head(15), height=300)
-
-        fig, ax = plt.subplots(figsize=(8, 5))
-        q3_1.sort_values("review_count", ascending=False).head(8).plot(kind="bar", x="language", y="review_count",
-                                                                       ax=ax, color=ACCENT_BLUE)
-        ax.set_title("🌐 Top 8 Languages by Reviews", fontsize=12, color=ACCENT_BLUE)
-        ax.set_xlabel("🗣️ Language", fontsize=10)
-        ax.set_ylabel("📊 Reviews (k)", fontsize=10)
-        plt.xticks(rotation=45, ha='right', fontsize=8)
-        plt.tight_layout()
-        st.pyplot(fig)
+        show_chart('top_languages')
 
     with col2:
         st.markdown("**💰 Q3.2: Purchasing Users by Language**")
         st.dataframe(q3_2.head(15), height=300)
-
-        fig, ax = plt.subplots(figsize=(8, 5))
-        q3_2.sort_values("total_users", ascending=False).head(8).plot(kind="bar", x="language", y="total_users", ax=ax,
-                                                                      color=SUCCESS_GREEN)
-        ax.set_title("🛒 Top 8 Languages by Purchasing Users", fontsize=12, color=ACCENT_BLUE)
-        ax.set_xlabel("🌍 Language", fontsize=10)
-        ax.set_ylabel("👥 Total Users", fontsize=10)
-        plt.xticks(rotation=45, ha='right', fontsize=8)
-        plt.tight_layout()
-        st.pyplot(fig)
+        show_chart('purchasing_languages')
 
 elif nav == "📅 Trending Analysis":
     st.header("📅 Trending Analysis")
 
-    q4 = fetch_data("question4_samples_500")
-    q4['quarter'] = pd.to_datetime(q4['quarter'])
-
-    col1, col2 = st.columns([1, 3])
-
-    with col1:
-        st.markdown("**📈 Q4: Top Trending Games**")
-        st.dataframe(q4.head(20), height=400)
-
-        unique_games = q4['app_name'].unique().tolist()
-        selected_games = st.multiselect("🎮 Select Games", options=unique_games, default=unique_games[:3])
-
-    with col2:
-        if selected_games:
-            filtered_q4 = q4[q4['app_name'].isin(selected_games)].sort_values('quarter')
-
-            fig, ax = plt.subplots(figsize=(12, 6))
-            colors = [ACCENT_BLUE, SUCCESS_GREEN, WARNING_ORANGE, '#ff6b9d', '#c44569', '#f8b500']
-
-            for i, game in enumerate(selected_games):
-                game_data = filtered_q4[filtered_q4['app_name'] == game]
-                ax.plot(game_data['quarter'], game_data['review_count'], marker='o', linewidth=3, markersize=6,
-                        label=game, color=colors[i % len(colors)])
-
-            ax.xaxis.set_major_locator(plt.matplotlib.dates.MonthLocator(interval=3))
-
-
-            def quarter_formatter(x, pos=None):
-                date = plt.matplotlib.dates.num2date(x)
-                quarter = (date.month - 1) // 3 + 1
-                return f"{date.year}-Q{quarter}"
-
-
-            ax.xaxis.set_major_formatter(plt.FuncFormatter(quarter_formatter))
-
-            plt.xticks(rotation=45, ha='right', fontsize=9)
-            plt.title('🚀 Trending Games per Quarter', fontsize=14, color=ACCENT_BLUE)
-            plt.xlabel('📅 Quarter', fontsize=10)
-            plt.ylabel('📊 Review Count', fontsize=10)
-            plt.legend(title='🎮 Games', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=9)
-            plt.tight_layout()
-            st.pyplot(fig)
+    if serving.TREND_TABLE not in serving_objects:
+        # Exported before the daily trend cube existed: only question4's quarterly top 10 is available
+        st.info("Re-run db_queries.py to enable weekly, monthly and top-N trends")
+        st.dataframe(fetch_data("question4", order_by="quarter, review_count DESC", limit=20), height=400)
+    else:
+        col1, col2 = st.columns([1, 3])
+
+        with col1:
+            default_granularity, default_n = charts.TREND_DEFAULTS
+            granularities = list(serving.TREND_GRANULARITIES)
+            granularity = st.selectbox("🗓️ Granularity", options=granularities,
+                                       index=granularities.index(default_granularity), format_func=str.title)
+            top_n = st.slider("🏅 Top N per period", min_value=1, max_value=50, value=default_n)
+
+            st.markdown(f"**📈 Q4: Top {top_n} Trending Games per {granularity.title()}**")
+            hot_quarters = hot_store.available(column_store.APP_TOTALS, column_store.QUARTER_SERIES)
+            if granularity == 'quarter' and hot_quarters:
+                # Ranked in NumPy over the mapped quarter series instead of re-aggregating app_daily in SQLite
+                ranked = hot_store.top_per_quarter(top_n)
+                st.dataframe(ranked, height=400)
+                unique_games = ranked.groupby('app_name')['review_count'].sum().sort_values(ascending=False)
+                unique_games = unique_games.index.tolist()
+            else:
+                st.dataframe(charts.top_trending(fetch_data, granularity, top_n), height=400)
+                unique_games = charts.trending_game_options(fetch_data, granularity, top_n)
+            selected_games = st.multiselect("🎮 Select Games", options=unique_games, default=unique_games[:3])
+
+        with col2:
+            if selected_games:
+                show_chart('trending_games', tuple(selected_games), granularity,
+                           quarter_series=hot_store.series if hot_quarters else None)
 
 elif nav == "👥 User Demographics":
     st.header("👥 User Demographics")
 
-    q5 = fetch_data("question5_samples_500")
+    q5 = fetch_data("question5")
 
     col1, col2 = st.columns([1, 2])
 
@@ -295,37 +254,43 @@ elif nav == "👥 User Demographics":
         st.markdown("**📊 Q5: User Demographics**")
         st.dataframe(q5.head(20), height=400)
 
-        selected_language = st.selectbox("🌐 Select Language", options=q5["language"].unique(), index=0)
+        selected_language = st.selectbox("🌐 Select Language", options=charts.demographic_language_options(fetch_data),
+                                          index=0)
 
     with col2:
-        # Heatmap
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
-
-        pivot_table = q5.pivot_table(index="language", columns="user_type", values="unique_users", aggfunc="sum")
-        from matplotlib.colors import ListedColormap
-        import matplotlib.colors as mcolors
-
-        colors_list = ['#0f1419', '#1a2332', '#2d4a5c', '#3d6b7d', '#4d8ca0', '#63b3d1', '#8cc9e8', '#b3ddf5']
-        custom_cmap = ListedColormap(colors_list)
-
-        sns.heatmap(pivot_table, annot=True, cmap=custom_cmap, ax=ax1, fmt=".0f", cbar_kws={'label': '👥 Users'},
-                    norm=mcolors.LogNorm(vmin=pivot_table.min().min(), vmax=pivot_table.max().max()))
-        ax1.set_title("🌍 User Demographics Heatmap", fontsize=12, color=ACCENT_BLUE)
-        ax1.set_xlabel("🎮 User Type", fontsize=10)
-        ax1.set_ylabel("🗣️ Language", fontsize=10)
-
-        # Bar chart for selected language
-        selected_data = q5[q5["language"] == selected_language]
-        bars = ax2.bar(selected_data["user_type"], selected_data["unique_users"],
-                       color=[ACCENT_BLUE, SUCCESS_GREEN, WARNING_ORANGE][:len(selected_data)])
-        ax2.set_title(f"👥 {selected_language} Demographics", fontsize=12, color=ACCENT_BLUE)
-        ax2.set_xlabel("🎮 User Type", fontsize=10)
-        ax2.set_ylabel("👤 Unique Users", fontsize=10)
-
-        for bar in bars:
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width() / 2., height, f'{int(height)}', ha='center', va='bottom',
-                     fontweight='bold', fontsize=9)
-
-        plt.tight_layout()
-        st.pyplot(fig)
\ No newline at end of file
+        show_chart('demographics', selected_language)
+
+elif nav == "🔎 Explore":
+    st.header("🔎 Explore")
+
+    if not os.path.exists(DUCKDB_PATH):
+        st.info(f"Ad-hoc queries need the pipeline's DuckDB database ({DUCKDB_PATH}) next to the dashboard")
+    else:
+        import adhoc
+        service = get_query_service()
+        col1, col2 = st.columns([1, 3])
+
+        try:
+            with col1:
+                options = service.options()
+                group_by = st.multiselect("📊 Group by", options=adhoc.DIMENSIONS, default=['language'])
+                apps = st.multiselect("🎮 Games", options=options['app'])
+                languages = st.multiselect("🌐 Languages", options=options['language'])
+                date_range = st.date_input("📅 Date range", value=())
+                flags = {}
+                for flag in adhoc.FLAGS:
+                    choice = st.selectbox(flag.replace('_', ' ').capitalize(), ["Any", "Yes", "No"])
+                    flags[flag] = None if choice == "Any" else choice == "Yes"
+
+            # A range is only applied once both ends are picked
+            start, end = date_range if len(date_range) == 2 else (None, None)
+            results = service.query(apps=apps, languages=languages, start=start, end=end, flags=flags,
+                                    group_by=group_by)
+        except Exception as error:
+            # e.g. db_queries.py is rebuilding the database and holds its write lock
+            st.warning(f"Query failed: {error}")
+        else:
+            with col2:
+                st.dataframe(results, height=500)
+                st.caption(f"{len(results)} rows from {results.attrs['source']} in {results.attrs['seconds']:.2f}s"
+                           + (" (cached)" if results.attrs['cached'] else ""))